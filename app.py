@@ -5,32 +5,1923 @@ Desenvolvido com Flask + React
 """
 
 import os
+import sys
+import io
+import secrets
+import re
+import gzip
+import zlib
+import mimetypes
+import csv
 import json
+import base64
+import hashlib
+import time
 import sqlite3
+import signal
+import atexit
+import threading
+import tempfile
+import shutil
+import random
+import itertools
+import cProfile
+from bisect import bisect_left
+from queue import Queue, Empty, Full
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 from functools import wraps
-import jwt
-import bcrypt
-from flask import Flask, request, jsonify, send_from_directory
+from collections import namedtuple, OrderedDict, Counter
+import importlib
+import click
+from flask import Flask, Response, request, jsonify, send_file, g, stream_with_context, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
+class LazyModule:
+    """Módulo importado no primeiro acesso a um atributo
+
+    Mantém jwt e bcrypt fora da partida a frio: /api/health responde sem importá-los.
+    O primeiro acesso importa sob um lock (o LazyLoader do importlib não é seguro
+    entre threads no Python 3.11: threads simultâneas viam o módulo pela metade).
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._module or self._load(), attribute)
+
+def lazy_import(name):
+    return sys.modules.get(name) or LazyModule(name)
+
+jwt = lazy_import('jwt')
+bcrypt = lazy_import('bcrypt')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
 
 # Configurações
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'contentflow_ai_secret_key_2024_secure')
-app.config['DATABASE'] = 'contentflow.db'
+app.config['DATABASE'] = os.getenv('DATABASE', 'contentflow.db')
+app.config['SHARD_COUNT'] = int(os.getenv('SHARD_COUNT', 1))
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 8))
+app.config['DB_BUSY_TIMEOUT'] = int(os.getenv('DB_BUSY_TIMEOUT', 5000))
+app.config['GENERATION_CACHE_SIZE'] = int(os.getenv('GENERATION_CACHE_SIZE', 2048))
+app.config['GENERATION_CACHE_TTL'] = int(os.getenv('GENERATION_CACHE_TTL', 3600))
+app.config['AI_PROVIDER'] = os.getenv('AI_PROVIDER', 'template')
+app.config['AI_PROVIDER_TIMEOUT'] = float(os.getenv('AI_PROVIDER_TIMEOUT', 30))
+app.config['AI_PROVIDER_CONCURRENCY'] = int(os.getenv('AI_PROVIDER_CONCURRENCY', 8))
+app.config['FAKE_PROVIDER_LATENCY'] = float(os.getenv('FAKE_PROVIDER_LATENCY', 0.2))
+app.config['CONTENT_WRITE_MODE'] = os.getenv('CONTENT_WRITE_MODE', 'sync')
+app.config['CONTENT_WRITE_QUEUE'] = int(os.getenv('CONTENT_WRITE_QUEUE', 10000))
+app.config['CONTENT_WRITE_BATCH'] = int(os.getenv('CONTENT_WRITE_BATCH', 500))
+app.config['CONTENT_WRITE_INTERVAL'] = float(os.getenv('CONTENT_WRITE_INTERVAL', 0.05))
+app.config['CONTENT_WRITE_TIMEOUT'] = float(os.getenv('CONTENT_WRITE_TIMEOUT', 0.1))
+app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', 50))
+app.config['EXPORT_FETCH_SIZE'] = int(os.getenv('EXPORT_FETCH_SIZE', 500))
+app.config['STATIC_MEMORY_LIMIT'] = int(os.getenv('STATIC_MEMORY_LIMIT', 512 * 1024))
+app.config['TOKEN_CACHE_SIZE'] = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = float(os.getenv('TOKEN_CACHE_TTL', 60))
+app.config['BCRYPT_ROUNDS'] = int(os.getenv('BCRYPT_ROUNDS', 12))
+app.config['BCRYPT_WORKERS'] = int(os.getenv('BCRYPT_WORKERS', max((os.cpu_count() or 2) // 2, 1)))
+app.config['BCRYPT_MAX_PENDING'] = int(os.getenv('BCRYPT_MAX_PENDING', 4))
+app.config['JSON_ENCODER'] = os.getenv('JSON_ENCODER', 'auto')
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '1') != '0'
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', '')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN', '')
+app.config['AUTO_MIGRATE'] = os.getenv('AUTO_MIGRATE', '1') != '0'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', 'profiles')
+app.config['PROFILE_ROUTES'] = {route for route in os.getenv('PROFILE_ROUTES', '').split(',') if route}
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 200))
+app.config['SLOW_QUERY_LOG'] = os.getenv('SLOW_QUERY_LOG', '')
+app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', '1') != '0'
+app.config['RATE_LIMIT_DATABASE'] = os.getenv('RATE_LIMIT_DATABASE', '')
+app.config['RATE_LIMIT_USER_RATE'] = float(os.getenv('RATE_LIMIT_USER_RATE', 2))
+app.config['RATE_LIMIT_USER_BURST'] = float(os.getenv('RATE_LIMIT_USER_BURST', 20))
+app.config['RATE_LIMIT_IP_RATE'] = float(os.getenv('RATE_LIMIT_IP_RATE', 5))
+app.config['RATE_LIMIT_IP_BURST'] = float(os.getenv('RATE_LIMIT_IP_BURST', 50))
+app.config['RATE_LIMIT_TRUST_PROXY'] = os.getenv('RATE_LIMIT_TRUST_PROXY', '0') == '1'
+app.config['GENERATION_MAX_IN_FLIGHT'] = int(os.getenv('GENERATION_MAX_IN_FLIGHT', 32))
+app.config['ADMISSION_QUEUE_TIMEOUT'] = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 0.5))
+app.config['ADMISSION_MAX_QUEUE_WAIT'] = float(os.getenv('ADMISSION_MAX_QUEUE_WAIT', 5))
+app.config['HASHTAG_INDEX_ENABLED'] = os.getenv('HASHTAG_INDEX_ENABLED', '1') != '0'
+app.config['HASHTAG_INDEX_SIZE'] = int(os.getenv('HASHTAG_INDEX_SIZE', 20000))
+app.config['HASHTAG_INDEX_TTL'] = float(os.getenv('HASHTAG_INDEX_TTL', 300))
+app.config['HASHTAG_PAIRS_FLUSH_INTERVAL'] = float(os.getenv('HASHTAG_PAIRS_FLUSH_INTERVAL', 2))
+app.config['ARCHIVE_AFTER_DAYS'] = float(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+app.config['ARCHIVE_CODEC'] = os.getenv('ARCHIVE_CODEC', 'zlib')
+app.config['ARCHIVE_DICTIONARY'] = os.getenv('ARCHIVE_DICTIONARY', '1') != '0'
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+app.config['ARCHIVE_BATCH_PAUSE'] = float(os.getenv('ARCHIVE_BATCH_PAUSE', 0.05))
+
+# Serialização JSON
+class RawJSON:
+    """JSON já serializado, inserido verbatim na resposta (sem decodificar e recodificar)"""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask com orjson (se instalado) e suporte a RawJSON
+
+    Com JSON_ENCODER=stdlib, ou sem orjson, usa o módulo json da biblioteca padrão.
+    Valores RawJSON viram marcadores durante a serialização e são substituídos
+    pelo texto original no resultado.
+    """
+    _marker = secrets.token_hex(8)
+    _placeholder = re.compile(f'"\\\\u0000{_marker}:(\\d+)\\\\u0000"')
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.use_orjson = orjson is not None and app.config['JSON_ENCODER'] != 'stdlib'
+
+    def dumps(self, obj, **kwargs):
+        raw_values = []
+        
+        def default(value):
+            if isinstance(value, RawJSON):
+                raw_values.append(value.text)
+                return f'\x00{self._marker}:{len(raw_values) - 1}\x00'
+            return self.default(value)
+        
+        if self.use_orjson:
+            option = orjson.OPT_NON_STR_KEYS
+            if kwargs.get('sort_keys', self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            text = orjson.dumps(obj, default=default, option=option).decode('utf-8')
+        else:
+            kwargs['default'] = default
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            text = json.dumps(obj, **kwargs)
+        
+        if raw_values:
+            text = self._placeholder.sub(lambda match: raw_values[int(match.group(1))], text)
+        return text
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+app.json = FastJSONProvider(app)
+
+def static_json(payload):
+    """Pré-serializa uma resposta constante; retorna uma função que a entrega"""
+    body = (app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+    return lambda: Response(body, mimetype='application/json')
 
 # CORS
 CORS(app, origins='*', allow_headers=['Content-Type', 'Authorization'])
 
-# Inicializar banco de dados
-def init_db():
-    """Inicializa o banco de dados SQLite"""
-    conn = sqlite3.connect(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Tabela de usuários
-    cursor.execute('''
+# Métricas por worker, expostas em /api/metrics no formato Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SQL_STATEMENTS = 500
+SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_SPACE_RE = re.compile(r'\s+')
+
+METRIC_HELP = {
+    'contentflow_http_requests_total': ('counter', 'Requisições HTTP por rota, método e status'),
+    'contentflow_http_request_duration_seconds': ('histogram', 'Latência das requisições por rota'),
+    'contentflow_sql_statement_duration_seconds': ('summary', 'Tempo gasto por comando SQL normalizado (execute + fetch)'),
+    'contentflow_cache_hits_total': ('counter', 'Acertos por cache'),
+    'contentflow_cache_misses_total': ('counter', 'Faltas por cache'),
+    'contentflow_cache_evictions_total': ('counter', 'Entradas expulsas por cache'),
+    'contentflow_cache_entries': ('gauge', 'Entradas atualmente em cada cache'),
+    'contentflow_db_connections_opened_total': ('counter', 'Conexões SQLite abertas pelo pool'),
+    'contentflow_db_connections_reused_total': ('counter', 'Conexões SQLite reaproveitadas do pool'),
+    'contentflow_db_connections_idle': ('gauge', 'Conexões SQLite ociosas no pool'),
+    'contentflow_provider_calls_total': ('counter', 'Chamadas ao provedor de geração'),
+    'contentflow_provider_coalesced_total': ('counter', 'Gerações atendidas por uma chamada idêntica em andamento'),
+    'contentflow_provider_timeouts_total': ('counter', 'Chamadas ao provedor que excederam o prazo'),
+    'contentflow_provider_rejected_total': ('counter', 'Chamadas ao provedor recusadas por falta de vaga'),
+    'contentflow_provider_in_flight': ('gauge', 'Chamadas ao provedor em andamento'),
+    'contentflow_write_behind_rows_total': ('counter', 'Linhas gravadas pelo writer em segundo plano'),
+    'contentflow_write_behind_sync_fallbacks_total': ('counter', 'Gravações feitas de forma síncrona com a fila cheia'),
+    'contentflow_write_behind_queue_depth': ('gauge', 'Linhas aguardando gravação'),
+    'contentflow_bcrypt_rejected_total': ('counter', 'Hashes bcrypt recusados por excesso de pendências'),
+    'contentflow_admission_admitted_total': ('counter', 'Requisições de geração admitidas'),
+    'contentflow_admission_rejected_total': ('counter', 'Requisições de geração recusadas, por motivo'),
+    'contentflow_admission_in_flight': ('gauge', 'Requisições de geração em andamento'),
+    'contentflow_hashtag_index_tags': ('gauge', 'Tags carregadas na trie de hashtags, por plataforma'),
+    'contentflow_hashtag_posts_pending': ('gauge', 'Posts com pares de hashtags aguardando gravação'),
+    'contentflow_hashtag_pairs_flushed_total': ('counter', 'Pares de hashtags gravados em lote'),
+}
+
+_normalized_sql = {}
+
+def normalize_sql(sql):
+    """Troca literais por ? e compacta espaços, para agrupar comandos equivalentes"""
+    normalized = _normalized_sql.get(sql)
+    if normalized is None:
+        normalized = SQL_SPACE_RE.sub(' ', SQL_LITERAL_RE.sub('?', sql)).strip()
+        if len(_normalized_sql) < 4 * MAX_SQL_STATEMENTS:
+            _normalized_sql[sql] = normalized
+    return normalized
+
+def metrics_master_pid():
+    """pid do master do gunicorn (definido pelo gunicorn.conf.py) ou None fora dele"""
+    pid = os.getenv('METRICS_MASTER_PID')
+    return int(pid) if pid else None
+
+def metrics_directory(master_pid=None):
+    """Diretório dos snapshots
+
+    Sob o gunicorn, compartilhado pelos workers do mesmo master (o child_exit
+    soma e apaga os de workers encerrados). Fora dele não há quem limpe, então
+    cada processo usa o seu, removido no encerramento: processos sucessivos
+    não herdam contadores uns dos outros.
+    """
+    if app.config['METRICS_DIR']:
+        return app.config['METRICS_DIR']
+    master_pid = master_pid or metrics_master_pid()
+    name = f'contentflow-metrics-{master_pid}' if master_pid else f'contentflow-metrics-pid-{os.getpid()}'
+    return os.path.join(tempfile.gettempdir(), name)
+
+DEAD_WORKERS_FILE = 'dead-workers.json'
+
+def read_metrics_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def retire_worker_metrics(pid, directory):
+    """Soma os contadores de um worker encerrado ao total dos workers mortos e apaga o snapshot
+
+    Chamado pelo master (child_exit do gunicorn.conf.py). Gauges do worker
+    são descartados. O total lista os pids já somados cujo snapshot ainda
+    existe, para /api/metrics não contá-los duas vezes entre a gravação do
+    total e a remoção do arquivo.
+    """
+    path = os.path.join(directory, f'worker-{pid}.json')
+    snapshot = read_metrics_file(path)
+    if snapshot is None:
+        return False
+    dead_path = os.path.join(directory, DEAD_WORKERS_FILE)
+    dead = read_metrics_file(dead_path) or {'pid': None, 'folded': [], 'samples': []}
+    totals = {(family, sample, tuple(labels.items())): value
+              for family, sample, labels, value in dead['samples']}
+    for family, sample, labels, value in snapshot['samples']:
+        if METRIC_HELP.get(family, ('gauge', ''))[0] == 'gauge':
+            continue
+        key = (family, sample, tuple(labels.items()))
+        totals[key] = totals.get(key, 0) + value
+    folded = [folded_pid for folded_pid in dead['folded']
+              if os.path.exists(os.path.join(directory, f'worker-{folded_pid}.json'))]
+    dead = {
+        'pid': None,
+        'folded': folded + [pid],
+        'samples': [[family, sample, dict(labels), value] for (family, sample, labels), value in totals.items()]
+    }
+    with open(dead_path + '.tmp', 'w') as f:
+        json.dump(dead, f)
+    os.replace(dead_path + '.tmp', dead_path)
+    os.remove(path)
+    return True
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Metrics:
+    """Contadores e histogramas do worker
+
+    Cada worker grava periodicamente um snapshot em METRICS_DIR; /api/metrics
+    soma os snapshots de todos os workers. Contadores de workers encerrados
+    continuam somados (não regridem): sob o gunicorn, o master os acumula em
+    dead-workers.json e apaga o snapshot; gauges só contam workers vivos.
+    """
+
+    def __init__(self, directory, flush_interval=5.0):
+        self.pid = os.getpid()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._latency = {}
+        self._sql = {}
+        self._flusher = None
+
+    def observe_request(self, endpoint, method, status, duration):
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                # Contagem por bucket (não cumulativa), +Inf e soma
+                histogram = self._latency[endpoint] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(LATENCY_BUCKETS, duration)] += 1
+            histogram[-1] += duration
+
+    def observe_sql(self, sql, duration, count=1):
+        statement = normalize_sql(sql)
+        with self._lock:
+            entry = self._sql.get(statement)
+            if entry is None:
+                if len(self._sql) >= MAX_SQL_STATEMENTS:
+                    statement = 'other'
+                entry = self._sql.setdefault(statement, [0, 0.0])
+            entry[0] += count
+            entry[1] += duration
+
+    def samples(self):
+        """Lista de [família, amostra, labels, valor] deste worker"""
+        samples = []
+        with self._lock:
+            for (endpoint, method, status), count in self._requests.items():
+                samples.append(['contentflow_http_requests_total', 'contentflow_http_requests_total',
+                                {'endpoint': endpoint, 'method': method, 'status': str(status)}, count])
+            family = 'contentflow_http_request_duration_seconds'
+            for endpoint, histogram in self._latency.items():
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+                    cumulative += count
+                    samples.append([family, family + '_bucket', {'endpoint': endpoint, 'le': str(bound)}, cumulative])
+                samples.append([family, family + '_sum', {'endpoint': endpoint}, histogram[-1]])
+                samples.append([family, family + '_count', {'endpoint': endpoint}, cumulative])
+            family = 'contentflow_sql_statement_duration_seconds'
+            for statement, (count, total) in self._sql.items():
+                samples.append([family, family + '_sum', {'statement': statement}, total])
+                samples.append([family, family + '_count', {'statement': statement}, count])
+        samples.extend(component_samples())
+        return samples
+
+    def flush(self):
+        """Grava o snapshot deste worker (escrita atômica)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'worker-{self.pid}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'pid': self.pid, 'samples': self.samples()}, f)
+        os.replace(path + '.tmp', path)
+
+    def ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run_flusher, name='metrics-flusher',
+                                                     daemon=True)
+                    self._flusher.start()
+                    atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                app.logger.warning('Falha ao gravar métricas: %s', e)
+
+def component_samples():
+    """Contadores de caches, pool, provedor, writer e bcrypt deste worker"""
+    samples = []
+
+    def add(name, value, **labels):
+        samples.append([name, name, labels, value])
+
+    for cache_name, cache in (('token', token_cache), ('generation', generation_cache)):
+        stats = cache.stats()
+        add('contentflow_cache_hits_total', stats['hits'], cache=cache_name)
+        add('contentflow_cache_misses_total', stats['misses'], cache=cache_name)
+        add('contentflow_cache_evictions_total', stats['evictions'], cache=cache_name)
+        add('contentflow_cache_entries', stats['size'], cache=cache_name)
+    for shard, pool in list(_pools.items()):
+        if pool.pid == os.getpid():
+            add('contentflow_db_connections_opened_total', pool.created, shard=str(shard))
+            add('contentflow_db_connections_reused_total', pool.reused, shard=str(shard))
+            add('contentflow_db_connections_idle', pool._idle.qsize(), shard=str(shard))
+    gateway = _gateway
+    if gateway is not None and gateway.pid == os.getpid():
+        stats = gateway.stats()
+        for key in ('calls', 'coalesced', 'timeouts', 'rejected'):
+            add(f'contentflow_provider_{key}_total', stats[key], provider=stats['provider'])
+        add('contentflow_provider_in_flight', stats['in_flight'], provider=stats['provider'])
+    for shard, writer in list(_writers.items()):
+        if writer.pid == os.getpid():
+            stats = writer.stats()
+            add('contentflow_write_behind_rows_total', stats['rows_written'], shard=str(shard))
+            add('contentflow_write_behind_sync_fallbacks_total', stats['sync_fallbacks'], shard=str(shard))
+            add('contentflow_write_behind_queue_depth', stats['queue_depth'], shard=str(shard))
+    hasher = _hasher
+    if hasher is not None and hasher.pid == os.getpid():
+        add('contentflow_bcrypt_rejected_total', hasher.rejected)
+    admission = _admission
+    if admission is not None and admission.pid == os.getpid():
+        stats = admission.stats()
+        add('contentflow_admission_admitted_total', stats['admitted'])
+        for reason, count in stats['rejected'].items():
+            add('contentflow_admission_rejected_total', count, reason=reason)
+        add('contentflow_admission_in_flight', stats['in_flight'])
+    index = _hashtag_index
+    if index is not None and index.pid == os.getpid():
+        for platform, tags in index.stats().items():
+            add('contentflow_hashtag_index_tags', tags, platform=platform)
+        add('contentflow_hashtag_posts_pending', index.pending_posts())
+        add('contentflow_hashtag_pairs_flushed_total', index.pairs_flushed)
+    return samples
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """Métricas do processo atual (recriadas após fork)"""
+    global _metrics
+    metrics = _metrics
+    if metrics is None or metrics.pid != os.getpid():
+        with _metrics_lock:
+            metrics = _metrics
+            if metrics is None or metrics.pid != os.getpid():
+                metrics = Metrics(metrics_directory(), app.config['METRICS_FLUSH_INTERVAL'])
+                if not app.config['METRICS_DIR'] and metrics_master_pid() is None:
+                    # Diretório só deste processo (registrado antes do flush final, roda depois dele)
+                    atexit.register(shutil.rmtree, metrics.directory, ignore_errors=True)
+                _metrics = metrics
+    return metrics
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def collect_metrics_snapshots(directory, attempts=3):
+    """Total dos workers encerrados e snapshots dos demais
+
+    Snapshots já somados ao total são ignorados; se um sumir durante a
+    leitura (o master acabou de somá-lo), a coleta recomeça.
+    """
+    for _ in range(attempts):
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return []
+        dead = read_metrics_file(os.path.join(directory, DEAD_WORKERS_FILE))
+        snapshots = [dead] if dead else []
+        folded = set(dead['folded']) if dead else set()
+        vanished = False
+        for name in names:
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            snapshot = read_metrics_file(os.path.join(directory, name))
+            if snapshot is None:
+                vanished = True
+            elif snapshot['pid'] not in folded:
+                snapshots.append(snapshot)
+        if not vanished:
+            break
+    return snapshots
+
+def render_metrics():
+    """Soma os snapshots de todos os workers e gera o texto no formato Prometheus"""
+    metrics = get_metrics()
+    metrics.flush()
+    families = {}
+    snapshots = collect_metrics_snapshots(metrics.directory)
+    for snapshot in snapshots:
+        alive = snapshot['pid'] is not None and (snapshot['pid'] == metrics.pid or pid_alive(snapshot['pid']))
+        for family, sample, labels, value in snapshot['samples']:
+            kind = METRIC_HELP.get(family, ('gauge', ''))[0]
+            if kind == 'gauge' and not alive:
+                continue
+            series = families.setdefault(family, {})
+            key = (sample, tuple(labels.items()))
+            series[key] = series.get(key, 0) + value
+
+    lines = []
+    for family, series in families.items():
+        kind, help_text = METRIC_HELP.get(family, ('gauge', ''))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for (sample, labels), value in series.items():
+            label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels)
+            lines.append(f'{sample}{{{label_text}}} {value}' if label_text else f'{sample} {value}')
+    return '\n'.join(lines) + '\n'
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que mede cada comando SQL do execute até o fim do resultado
+
+    O tempo de fetchone/fetchmany/fetchall e da iteração (for row in cursor)
+    soma no comando que os gerou; ele é registrado (métricas e log de consultas
+    lentas, com o formato dos parâmetros do execute) quando o resultado se
+    esgota, no próximo execute, no close ou quando o cursor é descartado.
+    """
+
+    _timed = None
+
+    def execute(self, sql, parameters=()):
+        self._finish_statement()
+        self._timed = [sql, parameters, 0.0, 'execute']
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._timed[2] += time.perf_counter() - start
+            # Sem resultado (INSERT/UPDATE sem RETURNING, DDL...): já terminou
+            if self.description is None:
+                self._finish_statement()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish_statement()
+        # Formato (e plano) a partir da primeira linha, quando é uma sequência
+        first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+        self._timed = [sql, first, 0.0, 'executemany']
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._timed[2] += time.perf_counter() - start
+            self._finish_statement()
+
+    def _finish_statement(self):
+        timed, self._timed = self._timed, None
+        if timed is None:
+            return
+        sql, parameters, elapsed, phase = timed
+        if app.config['METRICS_ENABLED']:
+            get_metrics().observe_sql(sql, elapsed)
+        if elapsed * 1000 >= app.config['SLOW_QUERY_MS'] > 0:
+            log_slow_query(self.connection, sql, parameters, elapsed, phase)
+
+    def _timed_fetch(self, fetch, exhausted, *args):
+        """Soma o tempo de um fetch ao comando; exhausted(resultado) diz se ele terminou"""
+        timed = self._timed
+        start = time.perf_counter()
+        done = True
+        try:
+            result = fetch(*args)
+            done = exhausted(result)
+            return result
+        finally:
+            if timed is not None and timed is self._timed:
+                timed[2] += time.perf_counter() - start
+                timed[3] = 'fetch'
+                if done:
+                    self._finish_statement()
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone, lambda row: row is None)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        return self._timed_fetch(super().fetchmany, lambda rows: len(rows) < size, size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall, lambda rows: True)
+
+    def __next__(self):
+        # StopIteration (fim do resultado) sai pelo finally com done=True
+        return self._timed_fetch(super().__next__, lambda row: False)
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish_statement()
+        except Exception:
+            pass
+
+class TimedConnection(sqlite3.Connection):
+    """Conexão cujos cursores são TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None and app.config['METRICS_ENABLED']:
+        metrics = get_metrics()
+        metrics.ensure_flusher()
+        # Rota (padrão da URL) em vez do caminho, para não criar uma série por ID
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code,
+                                time.perf_counter() - started)
+    return response
+
+# Profiling por amostragem e log de consultas lentas
+def parameter_shape(parameters):
+    """Tipos (e tamanhos de texto) dos parâmetros, sem os valores"""
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f'{type(value).__name__}({len(value)})'
+        return type(value).__name__
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    return [shape(value) for value in parameters]
+
+EXPLAINABLE_SQL_RE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_slow_query_lock = threading.Lock()
+
+def log_slow_query(conn, sql, parameters, elapsed, phase):
+    """Registra um comando acima de SLOW_QUERY_MS com o formato dos parâmetros e o plano"""
+    plan = None
+    if parameters is not None and EXPLAINABLE_SQL_RE.match(sql):
+        try:
+            # Cursor comum, para o EXPLAIN não ser medido nem registrado
+            plan = [row[3] for row in sqlite3.Cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+        except sqlite3.Error as e:
+            plan = [f'erro: {e}']
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'duration_ms': round(elapsed * 1000, 3),
+        'phase': phase,
+        'statement': normalize_sql(sql),
+        'parameters': parameter_shape(parameters),
+        'plan': plan,
+        'endpoint': request.endpoint if has_request_context() else None,
+        'pid': os.getpid()
+    }
+    if app.config['SLOW_QUERY_LOG']:
+        with _slow_query_lock, open(app.config['SLOW_QUERY_LOG'], 'a') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    else:
+        app.logger.warning('Consulta lenta: %s', json.dumps(entry, ensure_ascii=False))
+
+def profiling_requested():
+    """Decide se a requisição atual será perfilada (amostragem ou header de admin)"""
+    routes = app.config['PROFILE_ROUTES']
+    if routes and request.endpoint not in routes:
+        return False
+    if request.headers.get('X-Profile') == '1' and app.config['ADMIN_TOKEN'] and admin_authorized():
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+@app.before_request
+def start_profiler():
+    if (app.config['PROFILE_SAMPLE_RATE'] > 0 or app.config['ADMIN_TOKEN']) and profiling_requested():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Outro profiler já ativo nesta thread
+            return
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+
+@app.after_request
+def remember_profiled_status(response):
+    if 'profiler' in g:
+        g.profile_status = response.status_code
+    return response
+
+@app.teardown_request
+def save_profile(exception):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    duration_ms = (time.perf_counter() - g.profile_started) * 1000
+    endpoint = request.endpoint or 'unmatched'
+    directory = app.config['PROFILE_DIR']
+    name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{endpoint}-{duration_ms:.0f}ms-{os.getpid()}'
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+        with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+            json.dump({
+                'endpoint': endpoint,
+                'route': request.url_rule.rule if request.url_rule is not None else None,
+                'method': request.method,
+                'path': request.path,
+                'status': g.get('profile_status', 500),
+                'duration_ms': round(duration_ms, 3),
+                'pid': os.getpid(),
+                'timestamp': datetime.now().isoformat(),
+                'error': repr(exception) if exception is not None else None
+            }, f)
+    except OSError as e:
+        app.logger.warning('Falha ao gravar profile: %s', e)
+
+# Pool de conexões SQLite
+# UPSERT ... RETURNING (rate limit, favoritos) exige SQLite 3.35+
+MIN_SQLITE_VERSION = (3, 35, 0)
+if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+    raise RuntimeError(f'SQLite {sqlite3.sqlite_version} encontrado; o ContentFlow exige '
+                       f"{'.'.join(map(str, MIN_SQLITE_VERSION))} ou mais recente")
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('mmap_size', 134217728),
+    ('temp_store', 'MEMORY'),
+)
+
+class ConnectionPool:
+    """Pool de conexões SQLite reutilizadas entre requisições do mesmo worker"""
+
+    def __init__(self, database, size=8, busy_timeout=5000):
+        self.database = database
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.pid = os.getpid()
+        self._idle = Queue(maxsize=max(size, 1))
+        self.created = 0
+        self.reused = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=256,
+            factory=TimedConnection if app.config['METRICS_ENABLED'] or app.config['SLOW_QUERY_MS'] > 0
+            else sqlite3.Connection
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        for pragma, value in SQLITE_PRAGMAS:
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        register_archive_function(conn)
+        self.created += 1
+        return conn
+
+    def acquire(self):
+        """Retorna uma conexão ociosa ou abre uma nova"""
+        try:
+            conn = self._idle.get_nowait()
+            self.reused += 1
+            return conn
+        except Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Devolve a conexão ao pool (ou fecha se o pool estiver cheio)"""
+        if conn.in_transaction:
+            conn.rollback()
+        if self.size <= 0:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+# Shards: cada usuário, com todo o seu conteúdo, fica no arquivo user_id % SHARD_COUNT.
+# O shard 0 é o próprio DATABASE, que também guarda o diretório global de usuários
+# (username/email -> id) e o índice de hashtags; os demais são DATABASE.shard1, ...
+SHARD_FILE_RE = re.compile(r'\.shard(\d+)$')
+
+def shard_count():
+    return max(app.config['SHARD_COUNT'], 1)
+
+def shard_for(user_id):
+    return user_id % shard_count()
+
+def shard_database(shard, database=None):
+    database = database or app.config['DATABASE']
+    return database if shard == 0 else f'{database}.shard{shard}'
+
+def existing_shards(database=None):
+    """Shards com arquivo em disco, inclusive os acima de SHARD_COUNT"""
+    database = database or app.config['DATABASE']
+    directory, name = os.path.split(os.path.abspath(database))
+    shards = {0}
+    for entry in os.listdir(directory):
+        if entry.startswith(name):
+            match = SHARD_FILE_RE.fullmatch(entry[len(name):])
+            if match:
+                shards.add(int(match.group(1)))
+    return sorted(shards)
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+def get_pool(shard=0):
+    """Retorna o pool do shard no processo atual, recriando após fork ou troca de banco"""
+    database = shard_database(shard)
+    pool = _pools.get(shard)
+    if pool is None or pool.pid != os.getpid() or pool.database != database:
+        with _pool_lock:
+            pool = _pools.get(shard)
+            if pool is None or pool.pid != os.getpid() or pool.database != database:
+                if pool is not None and pool.pid == os.getpid():
+                    pool.close_all()
+                # Sem migração no deploy (ex.: serverless), o primeiro uso no processo aplica
+                if app.config['AUTO_MIGRATE']:
+                    init_db(database)
+                # Conexões herdadas do processo pai (fork) são descartadas sem fechar
+                pool = ConnectionPool(database,
+                                      app.config['DB_POOL_SIZE'],
+                                      app.config['DB_BUSY_TIMEOUT'])
+                _pools[shard] = pool
+    return pool
+
+def get_db(shard=0):
+    """Conexão do shard associada à requisição atual (shard 0: diretório de usuários)"""
+    connections = g.setdefault('db', {})
+    conn = connections.get(shard)
+    if conn is None:
+        conn = connections[shard] = get_pool(shard).acquire()
+    return conn
+
+def get_user_db(user_id):
+    """Conexão do shard que guarda o usuário e o seu conteúdo"""
+    return get_db(shard_for(user_id))
+
+@app.teardown_appcontext
+def release_db(exception):
+    for shard, conn in g.pop('db', {}).items():
+        get_pool(shard).release(conn)
+
+# Cache LRU com TTL
+class LRUCache:
+    """Cache limitado com expulsão LRU, expiração por TTL e contadores"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Remove as entradas para as quais predicate(key, value) é verdadeiro"""
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Busca textual (FTS5): user_key ('u<id>') permite filtrar o usuário dentro do índice.
+# Corpos JSON (ideias, hashtags, roteiros) são indexados pelos seus textos decodificados.
+SEARCH_BODY_SQL = '''(SELECT CASE WHEN json_valid(body)
+                     THEN (SELECT group_concat(value, ' ') FROM json_tree(body) WHERE type = 'text')
+                     ELSE body END
+             FROM (SELECT {body} AS body))'''
+
+# Corpo gravado de uma linha de content: texto antigo ou content_blobs e, em bancos
+# com armazenamento frio, content_archive (o COALESCE só chega nele se os outros
+# forem NULL, então conteúdo recente não passa pela descompressão)
+STORED_BODY_SQL = 'COALESCE({row}.generated_text, (SELECT body FROM content_blobs WHERE hash = {row}.blob_hash){archived})'
+ARCHIVED_BODY_SQL = ', (SELECT archived_body(codec, dictionary, payload) FROM content_archive WHERE hash = {row}.blob_hash)'
+
+def stored_body_sql(row, archived=False):
+    return STORED_BODY_SQL.format(row=row, archived=ARCHIVED_BODY_SQL.format(row=row) if archived else '')
+
+def search_body_sql(row, archived=False):
+    return SEARCH_BODY_SQL.format(body=stored_body_sql(row, archived))
+
+SEARCH_SCHEMA_STATEMENTS = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+        user_key, prompt, body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS content_fts_insert AFTER INSERT ON content BEGIN
+        INSERT INTO content_fts (rowid, user_key, prompt, body)
+        VALUES (new.id, 'u' || new.user_id, new.prompt, {search_body_sql('new')});
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS content_fts_delete AFTER DELETE ON content BEGIN
+        DELETE FROM content_fts WHERE rowid = old.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS content_fts_update
+    AFTER UPDATE OF user_id, prompt, generated_text, blob_hash ON content BEGIN
+        DELETE FROM content_fts WHERE rowid = old.id;
+        INSERT INTO content_fts (rowid, user_key, prompt, body)
+        VALUES (new.id, 'u' || new.user_id, new.prompt, {search_body_sql('new')});
+    END
+    '''
+)
+
+def rebuild_search_index(conn, commit=True):
+    """Recria o índice de busca a partir da tabela content"""
+    archived = prepare_archive_reads(conn)
+    conn.execute('DELETE FROM content_fts')
+    conn.execute(f'''
+        INSERT INTO content_fts (rowid, user_key, prompt, body)
+        SELECT id, 'u' || user_id, prompt, {search_body_sql('content', archived)} FROM content
+    ''')
+    conn.execute("INSERT INTO content_fts (content_fts) VALUES ('optimize')")
+    if commit:
+        conn.commit()
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Recria o índice de busca textual de cada shard (flask --app app rebuild-search)"""
+    migrate_shards()
+    total = 0
+    for shard in existing_shards():
+        conn = sqlite3.connect(shard_database(shard))
+        rebuild_search_index(conn)
+        total += conn.execute('SELECT COUNT(*) FROM content_fts').fetchone()[0]
+        conn.close()
+    print(f"🔎 Índice de busca recriado: {total} conteúdos")
+
+# Índice de hashtags aprendido dos pedidos gravados, por plataforma: hashtag_counts
+# (usos de cada tag) e hashtag_pairs (tags usadas no mesmo pedido). Só entram termos
+# do usuário (as tags pedidas e as #tags escritas no prompt), nunca o texto gerado:
+# as listas fixas e as variações das sementes realimentariam o próprio índice. As contagens são
+# atualizadas na mesma transação dos INSERTs em content; os pares (dezenas por post,
+# cada um em uma página diferente) são montados e gravados em lote a cada
+# HASHTAG_PAIRS_FLUSH_INTERVAL segundos. Cada worker mantém uma trie de prefixos com
+# as tags mais usadas, recarregada a cada HASHTAG_INDEX_TTL segundos.
+HASHTAG_SCHEMA_STATEMENTS = (
+    '''
+    CREATE TABLE IF NOT EXISTS hashtag_counts (
+        platform TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        uses INTEGER NOT NULL,
+        PRIMARY KEY (platform, tag)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS hashtag_pairs (
+        platform TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        related TEXT NOT NULL,
+        uses INTEGER NOT NULL,
+        PRIMARY KEY (platform, tag, related)
+    ) WITHOUT ROWID
+    ''',
+    # Carga da trie e tags mais usadas junto de outra saem ordenadas do índice
+    '''
+    CREATE INDEX IF NOT EXISTS idx_hashtag_counts_rank
+    ON hashtag_counts (platform, uses DESC, tag)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_hashtag_pairs_rank
+    ON hashtag_pairs (platform, tag, uses DESC, related)
+    '''
+)
+
+UPSERT_HASHTAG_COUNT_SQL = '''
+    INSERT INTO hashtag_counts (platform, tag, uses) VALUES (?, ?, ?)
+    ON CONFLICT (platform, tag) DO UPDATE SET uses = uses + excluded.uses
+'''
+
+UPSERT_HASHTAG_PAIR_SQL = '''
+    INSERT INTO hashtag_pairs (platform, tag, related, uses) VALUES (?, ?, ?, ?)
+    ON CONFLICT (platform, tag, related) DO UPDATE SET uses = uses + excluded.uses
+'''
+
+HASHTAG_TOP_SQL = '''
+    SELECT tag, uses FROM hashtag_counts WHERE platform = ?
+    ORDER BY uses DESC, tag LIMIT ?
+'''
+
+HASHTAG_RELATED_SQL = '''
+    SELECT related, uses FROM hashtag_pairs WHERE platform = ? AND tag = ?
+    ORDER BY uses DESC, related LIMIT ?
+'''
+
+# Pedidos agrupados antes da extração: prompts repetidos são lidos uma vez
+HASHTAG_SOURCE_SQL = '''
+    SELECT content_type, platform, prompt, COUNT(*) FROM content
+    GROUP BY content_type, platform, prompt
+'''
+
+HASHTAG_RE = re.compile(r'#(\w+)')
+HASHTAG_CLEAN_RE = re.compile(r'\W+')
+HASHTAG_MAX_LENGTH = 50
+# Só as primeiras tags de cada post formam pares (no máximo 90 por post)
+HASHTAG_PAIR_LIMIT = 10
+# Pares por transação na gravação em lote, para não segurar o lock de escrita
+HASHTAG_PAIRS_FLUSH_BATCH = 5000
+# Sugestões aprendidas por (plataforma, semente), reaproveitadas entre requisições
+HASHTAG_LOOKUP_CACHE_SIZE = 4096
+# Prefixos com versão própria; acima disso as versões (e as consultas guardadas) recomeçam
+HASHTAG_VERSIONS_MAX = 200000
+HASHTAG_SUGGESTIONS = 20
+HASHTAG_TRIE_TOP = 10
+
+def normalize_hashtag(tag):
+    """Tag em minúsculas, sem '#', espaços ou pontuação ('' se inválida)"""
+    tag = HASHTAG_CLEAN_RE.sub('', tag.lower())
+    return tag if len(tag) <= HASHTAG_MAX_LENGTH else ''
+
+def hashtag_platform(platform):
+    # Linhas sem plataforma (ideias, roteiros) foram geradas como instagram
+    return platform if platform in PLATFORMS else 'instagram'
+
+def hashtag_seeds(prompt, limit=None):
+    """Tags normalizadas de um pedido de hashtags ('tag1, tag2, ...'), sem repetição"""
+    tags = (normalize_hashtag(part) for part in prompt.split(',')[:limit])
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+def extract_hashtags(content_type, prompt):
+    """Tags informadas pelo usuário em um pedido, sem repetição e na ordem do texto
+
+    Nos pedidos de hashtags, os termos separados por vírgula; nos demais, as
+    #tags escritas no prompt.
+    """
+    if not prompt:
+        return []
+    if content_type == 'hashtags':
+        return hashtag_seeds(prompt)
+    if '#' not in prompt:
+        return []
+    tags = (normalize_hashtag(candidate) for candidate in HASHTAG_RE.findall(prompt))
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+def hashtag_posts(items):
+    """(platform, tags, vezes) de cada pedido com hashtags em [(content_type, platform, prompt, vezes), ...]"""
+    for content_type, platform, prompt, times in items:
+        tags = extract_hashtags(content_type, prompt)
+        if tags:
+            yield hashtag_platform(platform), tags, times
+
+def count_hashtags(posts, counts=None, pairs=None):
+    """Soma os usos (platform, tag) em `counts` e os pares (platform, tag, related) em `pairs`"""
+    for platform, tags, times in posts:
+        if counts is not None:
+            for tag in tags:
+                counts[platform, tag] += times
+        if pairs is not None:
+            paired = tags[:HASHTAG_PAIR_LIMIT]
+            for tag in paired:
+                for related in paired:
+                    if related != tag:
+                        pairs[platform, tag, related] += times
+
+def apply_hashtag_counts(conn, counts, pairs=None):
+    """Soma as contagens (e os pares, se informados) ao índice, sem commit"""
+    conn.executemany(UPSERT_HASHTAG_COUNT_SQL,
+                     [(platform, tag, uses) for (platform, tag), uses in counts.items()])
+    if pairs:
+        conn.executemany(UPSERT_HASHTAG_PAIR_SQL,
+                         [key + (uses,) for key, uses in pairs.items()])
+
+def rebuild_hashtag_index(conn, sources=None, commit=True):
+    """Recria hashtag_counts e hashtag_pairs a partir da tabela content
+
+    `sources` são as conexões cujo conteúdo é lido (padrão: a própria `conn`).
+    """
+    counts, pairs = Counter(), Counter()
+    for source in sources or (conn,):
+        count_hashtags(hashtag_posts(source.execute(HASHTAG_SOURCE_SQL)), counts, pairs)
+    conn.execute('DELETE FROM hashtag_counts')
+    conn.execute('DELETE FROM hashtag_pairs')
+    # Carga em ordem de chave, com os índices de ranking recriados no fim
+    conn.execute('DROP INDEX IF EXISTS idx_hashtag_counts_rank')
+    conn.execute('DROP INDEX IF EXISTS idx_hashtag_pairs_rank')
+    apply_hashtag_counts(conn, dict(sorted(counts.items())), dict(sorted(pairs.items())))
+    for statement in HASHTAG_SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if commit:
+        conn.commit()
+    return len(counts), len(pairs)
+
+@app.cli.command('rebuild-hashtags')
+def rebuild_hashtags_command():
+    """Recria o índice de hashtags (flask --app app rebuild-hashtags)"""
+    migrate_shards()
+    # O índice fica no shard 0 e soma o conteúdo de todos os shards
+    sources = [sqlite3.connect(shard_database(shard)) for shard in existing_shards()]
+    tags, pairs = rebuild_hashtag_index(sources[0], sources)
+    for conn in sources:
+        conn.close()
+    print(f"#️⃣  Índice de hashtags recriado: {tags} tags, {pairs} pares")
+
+class HashtagTrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = None
+        self.top = []
+
+class HashtagTrie:
+    """Trie de prefixos em que cada nó guarda as `top` tags mais usadas abaixo dele
+
+    complete(prefix) custa O(len(prefix) + k), sem percorrer a subárvore.
+    """
+
+    def __init__(self, ranked, top=HASHTAG_TRIE_TOP):
+        self.top = top
+        self.uses = {}
+        self.root = HashtagTrieNode()
+        # Inseridas já em ordem de ranking: basta anexar enquanto houver vaga
+        for tag, uses in ranked:
+            self.uses[tag] = uses
+            for node in self._path(tag):
+                if len(node.top) < top:
+                    node.top.append(tag)
+
+    def __len__(self):
+        return len(self.uses)
+
+    def _path(self, tag):
+        node = self.root
+        yield node
+        for char in tag:
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = HashtagTrieNode()
+            node = child
+            yield node
+
+    def _rank(self, tag):
+        return (-self.uses[tag], tag)
+
+    def add(self, tag, uses):
+        """Soma usos de uma tag e a reposiciona nos nós do caminho"""
+        self.uses[tag] = self.uses.get(tag, 0) + uses
+        rank = self._rank(tag)
+        for node in self._path(tag):
+            top = node.top
+            if tag in top:
+                position = top.index(tag)
+                if position == 0 or self._rank(top[position - 1]) < rank:
+                    continue
+                top = [other for other in top if other != tag]
+            elif len(top) >= self.top and rank > self._rank(top[-1]):
+                continue
+            # Lista nova em vez de alterar a atual: leitores concorrentes veem a anterior
+            top = top[:]
+            top.insert(bisect_left([self._rank(other) for other in top], rank), tag)
+            node.top = top[:self.top]
+
+    def complete(self, prefix, limit=HASHTAG_TRIE_TOP):
+        node = self.root
+        for char in prefix:
+            if node.children is None:
+                return []
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top[:limit]
+
+class HashtagIndex:
+    """Tries por plataforma deste worker e consultas de co-ocorrência no banco
+
+    Gravações deste worker entram na trie na hora; as de outros workers
+    aparecem na próxima recarga (HASHTAG_INDEX_TTL). Cada (plataforma, prefixo)
+    tem uma versão, incrementada quando uma tag com esse prefixo é contada ou
+    ganha pares; consultas guardadas com versão antiga são refeitas.
+    """
+
+    def __init__(self, pool, size, ttl, flush_interval=2.0):
+        self.pool = pool
+        self.pid = os.getpid()
+        self.size = size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._tries = {}
+        self._pending_posts = []
+        self._pending_counts = Counter()
+        self._retry_pairs = Counter()
+        self._load_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._flusher = None
+        self._lookups = LRUCache(HASHTAG_LOOKUP_CACHE_SIZE, ttl)
+        self._versions = {}
+        self._clock = itertools.count(1)
+        self._epoch = 0
+        self.pairs_flushed = 0
+
+    def _load(self, platform):
+        conn = self.pool.acquire()
+        try:
+            ranked = conn.execute(HASHTAG_TOP_SQL, (platform, self.size)).fetchall()
+        finally:
+            self.pool.release(conn)
+        return HashtagTrie(ranked)
+
+    def trie(self, platform):
+        entry = self._tries.get(platform)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        # Durante a recarga as outras threads seguem com a trie anterior
+        if not self._load_lock.acquire(blocking=entry is None):
+            return entry[1]
+        try:
+            current = self._tries.get(platform)
+            if current is not entry and current is not None:
+                return current[1]
+            loaded_at = time.monotonic()
+            trie = self._load(platform)
+            self._tries[platform] = (loaded_at, trie)
+            return trie
+        finally:
+            self._load_lock.release()
+
+    def version(self, platform, seed):
+        return self._versions.get((platform, seed), self._epoch)
+
+    def _touch(self, tags):
+        """Invalida as consultas afetadas por [(platform, tag), ...] (chamar com _update_lock)
+
+        Uma tag muda os complementos de todos os seus prefixos e as
+        co-ocorrências dela mesma. Versões vêm de um relógio único, então uma
+        consulta guardada nunca volta a valer depois de invalidada.
+        """
+        if len(self._versions) > HASHTAG_VERSIONS_MAX:
+            self._versions.clear()
+            self._epoch = next(self._clock)
+        for platform, tag in tags:
+            version = next(self._clock)
+            for end in range(len(tag) + 1):
+                self._versions[platform, tag[:end]] = version
+
+    def observe(self, counts, posts, persisted=True):
+        """Soma às tries os usos recém-gravados e enfileira os posts para os pares
+
+        Contagens de conteúdo gravado em outro shard (persisted=False) também
+        esperam a gravação em lote.
+        """
+        with self._update_lock:
+            for (platform, tag), uses in counts.items():
+                entry = self._tries.get(platform)
+                if entry is not None:
+                    entry[1].add(tag, uses)
+            self._touch(counts)
+            self._pending_posts.extend(posts)
+            if not persisted:
+                self._pending_counts.update(counts)
+        self.ensure_flusher()
+
+    def flush(self):
+        """Grava contagens pendentes e pares em transações de até HASHTAG_PAIRS_FLUSH_BATCH"""
+        with self._update_lock:
+            posts, self._pending_posts = self._pending_posts, []
+            counts, self._pending_counts = self._pending_counts, Counter()
+            pairs, self._retry_pairs = self._retry_pairs, Counter()
+        # Pares montados aqui, fora da requisição que gravou o conteúdo
+        count_hashtags(posts, pairs=pairs)
+        if not (counts or pairs):
+            return
+        rows = [key + (uses,) for key, uses in pairs.items()]
+        conn = self.pool.acquire()
+        try:
+            if counts:
+                try:
+                    apply_hashtag_counts(conn, counts)
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    with self._update_lock:
+                        self._pending_counts.update(counts)
+                        self._retry_pairs.update(pairs)
+                    raise
+            for start in range(0, len(rows), HASHTAG_PAIRS_FLUSH_BATCH):
+                batch = rows[start:start + HASHTAG_PAIRS_FLUSH_BATCH]
+                try:
+                    conn.executemany(UPSERT_HASHTAG_PAIR_SQL, batch)
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    # Devolve o que faltou gravar para a próxima tentativa
+                    with self._update_lock:
+                        self._retry_pairs.update({row[:3]: row[3] for row in rows[start:]})
+                    raise
+                self.pairs_flushed += len(batch)
+                # Co-ocorrências novas: refaz as consultas dessas tags
+                with self._update_lock:
+                    self._touch({(platform, tag) for platform, tag, _, _ in batch})
+        finally:
+            self.pool.release(conn)
+
+    def ensure_flusher(self):
+        if self._flusher is None:
+            with self._update_lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._run_flusher, name='hashtag-flusher',
+                                                     daemon=True)
+                    self._flusher.start()
+                    atexit.register(self._flush_logged)
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            app.logger.warning('Falha ao gravar pares de hashtags: %s', e)
+
+    def _run_flusher(self):
+        # Termina após a última gravação quando o índice é substituído (fork, troca de banco)
+        while True:
+            time.sleep(self.flush_interval)
+            replaced = _hashtag_index is not self
+            self._flush_logged()
+            if replaced:
+                return
+
+    def lookup(self, platform, seed, limit=HASHTAG_SUGGESTIONS):
+        """(co-ocorrências [(tag, usos)], complementos de prefixo) de uma semente
+
+        Guardado por até HASHTAG_INDEX_TTL, como a trie, enquanto a versão da
+        semente não mudar: o que este worker grava aparece na consulta seguinte.
+        """
+        key = (platform, seed, limit)
+        version = self.version(platform, seed)
+        cached = self._lookups.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        related = []
+        if seed:
+            conn = self.pool.acquire()
+            try:
+                related = conn.execute(HASHTAG_RELATED_SQL, (platform, seed, limit)).fetchall()
+            finally:
+                self.pool.release(conn)
+        result = (related, self.trie(platform).complete(seed, limit))
+        self._lookups.set(key, (version, result))
+        return result
+
+    def learned(self, platform, seeds, limit=HASHTAG_SUGGESTIONS):
+        """Co-ocorrências (maior soma, depois nome) seguidas dos complementos de prefixo"""
+        platform = hashtag_platform(platform)
+        # Sem sementes, as mais usadas da plataforma
+        lookups = [self.lookup(platform, seed, limit) for seed in seeds or ('',)]
+        related = Counter()
+        for pairs, _ in lookups:
+            for tag, uses in pairs:
+                related[tag] += uses
+        tags = sorted(related, key=lambda tag: (-related[tag], tag))
+        for _, completions in lookups:
+            tags.extend(completions)
+        return tags
+
+    def suggestions(self, platform, prompt):
+        """learned() para as até 3 sementes do prompt, guardado por (plataforma, prompt)
+
+        Refeito quando a versão de alguma semente muda.
+        """
+        key = (platform, prompt)
+        cached = self._lookups.get(key)
+        if cached is not None:
+            normalized, seeds, versions, tags = cached
+            if versions == tuple(self.version(normalized, seed) for seed in seeds):
+                return tags
+        normalized = hashtag_platform(platform)
+        seeds = tuple(hashtag_seeds(prompt, 3)) or ('',)
+        versions = tuple(self.version(normalized, seed) for seed in seeds)
+        tags = self.learned(platform, seeds)
+        self._lookups.set(key, (normalized, seeds, versions, tags))
+        return tags
+
+    def stats(self):
+        return {platform: len(trie) for platform, (_, trie) in self._tries.items()}
+
+    def pending_posts(self):
+        return len(self._pending_posts)
+
+_hashtag_index = None
+_hashtag_index_lock = threading.Lock()
+
+def get_hashtag_index():
+    """Índice de hashtags do processo atual, recriado após fork ou troca de banco"""
+    global _hashtag_index
+    index = _hashtag_index
+    pool = get_pool()
+    if index is None or index.pid != os.getpid() or index.pool is not pool:
+        with _hashtag_index_lock:
+            index = _hashtag_index
+            if index is None or index.pid != os.getpid() or index.pool is not pool:
+                index = HashtagIndex(pool, app.config['HASHTAG_INDEX_SIZE'],
+                                     app.config['HASHTAG_INDEX_TTL'],
+                                     app.config['HASHTAG_PAIRS_FLUSH_INTERVAL'])
+                _hashtag_index = index
+    return index
+
+# Armazenamento frio: corpos referenciados só por conteúdo mais antigo que
+# ARCHIVE_AFTER_DAYS saem de content_blobs (e de content.generated_text, nas linhas
+# anteriores ao armazenamento por hash) para content_archive, comprimidos com zlib ou
+# zstd. O dicionário opcional é treinado com os trechos que os templates repetem em
+# todos os corpos. As leituras descomprimem pela função SQL archived_body, registrada
+# em cada conexão do pool, e a compactação (flask --app app compact-archive) anda em
+# lotes curtos, na ordem dos ids, guardando o progresso em archive_state.
+ARCHIVE_SCHEMA_STATEMENTS = (
+    '''
+    CREATE TABLE IF NOT EXISTS archive_dictionaries (
+        id TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS content_archive (
+        hash TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        dictionary TEXT,
+        size INTEGER NOT NULL,
+        payload BLOB NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive_state (
+        key TEXT PRIMARY KEY,
+        value
+    ) WITHOUT ROWID
+    ''',
+    # Referências recentes a um corpo, conferidas antes de arquivá-lo
+    '''
+    CREATE INDEX IF NOT EXISTS idx_content_blob_created ON content (blob_hash, created_at)
+    '''
+)
+
+ARCHIVE_CODECS = ('zlib', 'zstd')
+ARCHIVE_ZLIB_LEVEL = 9
+ARCHIVE_ZSTD_LEVEL = 19
+# O zlib só enxerga os últimos 32 KB do dicionário
+ARCHIVE_DICTIONARY_SIZE = 32768
+ARCHIVE_DICTIONARY_SAMPLES = 5000
+ARCHIVE_SEGMENT_MIN_LENGTH = 8
+
+class ArchiveCodec:
+    """Compressão dos corpos arquivados com um codec e um dicionário opcional
+
+    Os objetos de zlib com o dicionário carregado são copiados a cada corpo, em
+    vez de recarregar os 32 KB; no zstd, cada thread tem o seu descompressor.
+    """
+
+    def __init__(self, codec='zlib', dictionary=None, dictionary_id=None):
+        if codec not in ARCHIVE_CODECS:
+            raise ValueError(f'Codec de arquivo inválido: {codec}')
+        if codec == 'zstd' and zstandard is None:
+            raise RuntimeError('ARCHIVE_CODEC=zstd requer o pacote zstandard (pip install zstandard)')
+        self.codec = codec
+        self.dictionary = dictionary
+        self.dictionary_id = dictionary_id
+        self._local = threading.local()
+        if codec == 'zlib':
+            extra = {'zdict': dictionary} if dictionary else {}
+            # Deflate sem cabeçalho: corpos curtos não pagam os 6 bytes do zlib
+            self._compressor = zlib.compressobj(ARCHIVE_ZLIB_LEVEL, zlib.DEFLATED, -15, 9,
+                                                zlib.Z_DEFAULT_STRATEGY, **extra)
+            self._decompressor = zlib.decompressobj(-15, **extra)
+        else:
+            self._zstd_dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._compressor = zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL,
+                                                        dict_data=self._zstd_dictionary)
+
+    def compress(self, body):
+        data = body.encode('utf-8')
+        if self.codec == 'zlib':
+            compressor = self._compressor.copy()
+            return compressor.compress(data) + compressor.flush()
+        return self._compressor.compress(data)
+
+    def decompress(self, payload):
+        if self.codec == 'zlib':
+            decompressor = self._decompressor.copy()
+            return (decompressor.decompress(payload) + decompressor.flush()).decode('utf-8')
+        decompressor = getattr(self._local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(
+                dict_data=self._zstd_dictionary)
+        return decompressor.decompress(payload).decode('utf-8')
+
+# Codecs por (codec, id do dicionário): o id é o hash do dicionário, que nunca muda,
+# então vale para qualquer shard e conexão do processo
+_archive_codecs = {}
+
+def archive_dictionary_id(codec, data):
+    return hashlib.blake2b(codec.encode('ascii') + b'\0' + data, digest_size=8).hexdigest()
+
+def get_archive_codec(codec, dictionary_id=None, load=None):
+    """Codec do processo para (codec, dicionário); `load(id)` lê o dicionário se preciso"""
+    archive_codec = _archive_codecs.get((codec, dictionary_id))
+    if archive_codec is None:
+        data = load(dictionary_id) if dictionary_id is not None else None
+        archive_codec = _archive_codecs.setdefault(
+            (codec, dictionary_id), ArchiveCodec(codec, data, dictionary_id))
+    return archive_codec
+
+def register_archive_function(conn):
+    """Registra archived_body(codec, dictionary, payload) na conexão"""
+    def load_dictionary(dictionary_id):
+        return conn.execute('SELECT data FROM archive_dictionaries WHERE id = ?',
+                            (dictionary_id,)).fetchone()[0]
+
+    def archived_body(codec, dictionary_id, payload):
+        if payload is None:
+            return None
+        return get_archive_codec(codec, dictionary_id, load_dictionary).decompress(payload)
+
+    conn.create_function('archived_body', 3, archived_body, deterministic=True)
+
+def prepare_archive_reads(conn):
+    """True se o banco já tem content_archive (e registra archived_body na conexão)
+
+    Os rebuilds também rodam dentro das migrações anteriores à tabela.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'content_archive'").fetchone():
+        return False
+    register_archive_function(conn)
+    return True
+
+def train_archive_dictionary(samples, size=ARCHIVE_DICTIONARY_SIZE):
+    """Dicionário com os trechos repetidos de [(prompt, corpo), ...]
+
+    Cada corpo é cortado nos pontos onde aparece o seu prompt (também na forma
+    escapada do JSON); o que sobra são os trechos fixos dos templates. Os mais
+    frequentes ficam no fim, onde a distância até eles é menor.
+    """
+    segments = Counter()
+    for prompt, body in samples:
+        if not body:
+            continue
+        cuts = {prompt, json.dumps(prompt)[1:-1]} if prompt and len(prompt) >= 3 else set()
+        pieces = re.split('|'.join(map(re.escape, cuts)), body) if cuts else [body]
+        segments.update(piece for piece in set(pieces) if len(piece) >= ARCHIVE_SEGMENT_MIN_LENGTH)
+    chosen = []
+    total = 0
+    for piece, uses in segments.most_common():
+        if uses < 2:
+            break
+        encoded = piece.encode('utf-8')
+        if total + len(encoded) <= size:
+            chosen.append(encoded)
+            total += len(encoded)
+    return b''.join(reversed(chosen))
+
+def archive_cutoff(days):
+    """created_at a partir do qual o conteúdo ainda é recente (formato do CURRENT_TIMESTAMP)"""
+    return (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+def archive_state(conn, key, default=None):
+    row = conn.execute('SELECT value FROM archive_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+def set_archive_state(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO archive_state (key, value) VALUES (?, ?)', (key, value))
+
+def archive_dictionary(conn, codec, cutoff, after, retrain=False):
+    """Codec da compactação: dicionário atual do shard ou um novo, treinado com
+    até ARCHIVE_DICTIONARY_SAMPLES corpos que serão arquivados"""
+    if not app.config['ARCHIVE_DICTIONARY']:
+        return get_archive_codec(codec)
+    state_key = f'dictionary:{codec}'
+    dictionary_id = None if retrain else archive_state(conn, state_key)
+    if dictionary_id is None:
+        samples = conn.execute(f'''
+            SELECT prompt, {stored_body_sql('content')} FROM content
+            WHERE id > ? AND created_at < ? ORDER BY id LIMIT ?
+        ''', (after, cutoff, ARCHIVE_DICTIONARY_SAMPLES)).fetchall()
+        data = train_archive_dictionary(samples)
+        if not data:
+            return get_archive_codec(codec)
+        dictionary_id = archive_dictionary_id(codec, data)
+        with conn:
+            conn.execute('INSERT OR IGNORE INTO archive_dictionaries (id, codec, data) VALUES (?, ?, ?)',
+                         (dictionary_id, codec, data))
+            set_archive_state(conn, state_key, dictionary_id)
+    return get_archive_codec(codec, dictionary_id, lambda key: conn.execute(
+        'SELECT data FROM archive_dictionaries WHERE id = ?', (key,)).fetchone()[0])
+
+RECENT_REFERENCE_SQL = 'SELECT 1 FROM content WHERE blob_hash = ? AND created_at >= ? LIMIT 1'
+
+def compact_archive_batch(conn, archive_codec, cutoff, after, batch_size):
+    """Arquiva um lote de até batch_size linhas depois do id `after`
+
+    Lê e comprime fora da transação; a transação de escrita só converte as linhas
+    antigas, grava o arquivo e remove os corpos. Retorna (último id, estatísticas)
+    ou (None, estatísticas) ao chegar no conteúdo recente.
+    """
+    stats = Counter()
+    rows = conn.execute('''
+        SELECT id, prompt, blob_hash, generated_text, created_at FROM content
+        WHERE id > ? ORDER BY id LIMIT ?
+    ''', (after, batch_size)).fetchall()
+    # Para no primeiro conteúdo recente: o progresso nunca passa por ele
+    old = []
+    for row in rows:
+        if row[4] is not None and row[4] >= cutoff:
+            break
+        old.append(row)
+    finished = len(old) < len(rows) or len(rows) < batch_size
+    if not old:
+        return None, stats
+    stats['rows'] = len(old)
+
+    legacy = [(content_id, content_digest(text), text)
+              for content_id, _, _, text, _ in old if text is not None]
+    hashes = {blob_hash for _, _, blob_hash, text, _ in old if text is None and blob_hash}
+    hashes.update(blob_hash for _, blob_hash, _ in legacy)
+    bodies = {blob_hash: text for _, blob_hash, text in legacy}
+    stored = list(hashes - bodies.keys())
+    for start in range(0, len(stored), 500):
+        chunk = stored[start:start + 500]
+        bodies.update(conn.execute(
+            f"SELECT hash, body FROM content_blobs WHERE hash IN ({', '.join('?' * len(chunk))})", chunk))
+
+    # Comprime e confere cada corpo antes de apagar o original
+    archived = []
+    started = time.perf_counter()
+    for blob_hash, body in bodies.items():
+        payload = archive_codec.compress(body)
+        decompress_started = time.perf_counter()
+        if archive_codec.decompress(payload) != body:
+            raise RuntimeError(f'Corpo {blob_hash} não sobreviveu à compressão')
+        stats['decompress_seconds'] += time.perf_counter() - decompress_started
+        archived.append((blob_hash, archive_codec.codec, archive_codec.dictionary_id,
+                         len(body.encode('utf-8')), payload))
+    stats['compress_seconds'] = time.perf_counter() - started - stats['decompress_seconds']
+
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if legacy:
+            # Texto antigo vai para content_blobs antes: o trigger da busca relê o corpo de lá
+            conn.executemany(INSERT_BLOB_SQL, [(blob_hash, text) for _, blob_hash, text in legacy])
+            conn.executemany('UPDATE content SET blob_hash = ?, generated_text = NULL WHERE id = ?',
+                             [(blob_hash, content_id) for content_id, blob_hash, _ in legacy])
+            stats['legacy_rows'] = len(legacy)
+        # Corpos que também são de conteúdo recente continuam em content_blobs
+        archived = [entry for entry in archived
+                    if conn.execute(RECENT_REFERENCE_SQL, (entry[0], cutoff)).fetchone() is None]
+        conn.executemany('''
+            INSERT OR REPLACE INTO content_archive (hash, codec, dictionary, size, payload)
+            VALUES (?, ?, ?, ?, ?)
+        ''', archived)
+        conn.executemany('DELETE FROM content_blobs WHERE hash = ?', [(entry[0],) for entry in archived])
+        last_id = old[-1][0]
+        set_archive_state(conn, 'last_content_id', last_id)
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    stats['lock_seconds'] = time.perf_counter() - started
+    stats['bodies'] = len(archived)
+    stats['decompressed'] = len(bodies)
+    stats['bytes_before'] = sum(entry[3] for entry in archived)
+    stats['bytes_after'] = sum(len(entry[4]) for entry in archived)
+    return (None if finished else last_id), stats
+
+def compact_archive(database, days=None, codec=None, batch_size=None, pause=None, retrain=False):
+    """Compacta um shard até o conteúdo recente; retorna as estatísticas da execução"""
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    codec = codec or app.config['ARCHIVE_CODEC']
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    pause = app.config['ARCHIVE_BATCH_PAUSE'] if pause is None else pause
+    cutoff = archive_cutoff(days)
+    conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        register_archive_function(conn)
+        after = archive_state(conn, 'last_content_id', 0)
+        archive_codec = archive_dictionary(conn, codec, cutoff, after, retrain)
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        totals = Counter()
+        started = time.perf_counter()
+        while after is not None:
+            after, stats = compact_archive_batch(conn, archive_codec, cutoff, after, batch_size)
+            totals.update({key: value for key, value in stats.items() if key != 'lock_seconds'})
+            if stats:
+                totals['batches'] += 1
+                totals['max_lock_seconds'] = max(totals['max_lock_seconds'], stats['lock_seconds'])
+            if after is not None and pause:
+                time.sleep(pause)
+        free_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return {
+            'cutoff': cutoff,
+            'codec': codec,
+            'dictionary': archive_codec.dictionary_id,
+            'rows': totals['rows'],
+            'legacy_rows': totals['legacy_rows'],
+            'bodies': totals['bodies'],
+            'bytes_before': totals['bytes_before'],
+            'bytes_after': totals['bytes_after'],
+            'ratio': totals['bytes_before'] / totals['bytes_after'] if totals['bytes_after'] else 0.0,
+            # Páginas liberadas ficam para novos dados; o arquivo só encolhe com VACUUM
+            'freed_bytes': max(free_after - free_before, 0) * page_size,
+            'batches': totals['batches'],
+            'max_lock_ms': totals['max_lock_seconds'] * 1000,
+            'decompress_us': (totals['decompress_seconds'] / totals['decompressed'] * 1e6
+                              if totals['decompressed'] else 0.0),
+            'elapsed': time.perf_counter() - started
+        }
+    finally:
+        conn.close()
+
+@app.cli.command('compact-archive')
+@click.option('--days', type=float, default=None, help='Idade mínima do conteúdo arquivado (padrão: ARCHIVE_AFTER_DAYS)')
+@click.option('--codec', type=click.Choice(ARCHIVE_CODECS), default=None, help='Padrão: ARCHIVE_CODEC')
+@click.option('--retrain', is_flag=True, help='Treina um novo dicionário antes de compactar')
+def compact_archive_command(days, codec, retrain):
+    """Move o conteúdo antigo de cada shard para o armazenamento frio (flask --app app compact-archive)"""
+    migrate_shards()
+    for shard in existing_shards():
+        stats = compact_archive(shard_database(shard), days, codec, retrain=retrain)
+        print(f"🧊 Shard {shard}: {stats['rows']} conteúdos anteriores a {stats['cutoff']}, "
+              f"{stats['bodies']} corpos arquivados ({stats['legacy_rows']} linhas antigas convertidas)")
+        if stats['bodies']:
+            print(f"   {stats['bytes_before'] / 1024:.1f} KB -> {stats['bytes_after'] / 1024:.1f} KB "
+                  f"({stats['ratio']:.1f}x, {stats['codec']}"
+                  f"{', dicionário ' + stats['dictionary'] if stats['dictionary'] else ''}), "
+                  f"{stats['freed_bytes'] / 1024:.1f} KB liberados no arquivo")
+            print(f"   Leitura: +{stats['decompress_us']:.1f} µs por corpo arquivado; "
+                  f"{stats['batches']} lotes, lock de escrita de no máximo {stats['max_lock_ms']:.1f} ms, "
+                  f"{stats['elapsed']:.1f}s")
+
+# Estatísticas por usuário (user_stats), no shard do usuário: contagens por
+# dimensão ('total', 'favorites', 'content_type', 'platform', 'tone' e 'day')
+# somadas na mesma transação que grava o conteúdo ou troca o favorito, para que
+# /api/user/stats e o total do histórico não agreguem a tabela content.
+USER_STATS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, dimension, value)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_USER_STAT_SQL = '''
+    INSERT INTO user_stats (user_id, dimension, value, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, dimension, value) DO UPDATE SET count = count + excluded.count
+'''
+
+# Dimensões de tamanho fixo, lidas por chave; 'day' é lida por intervalo
+USER_STATS_DIMENSIONS = ('total', 'favorites', 'content_type', 'platform', 'tone')
+USER_STATS_MAX_DAYS = 365
+
+# (dimensão, valor, filtro) de cada agregação do reparo
+USER_STATS_REPAIR_GROUPS = (
+    ('total', "''", ''),
+    ('favorites', "''", 'AND is_favorite'),
+    ('content_type', 'content_type', 'AND content_type IS NOT NULL'),
+    ('platform', 'platform', "AND platform IS NOT NULL AND platform != ''"),
+    ('tone', 'tone', "AND tone IS NOT NULL AND tone != ''"),
+    ('day', 'date(created_at)', 'AND created_at IS NOT NULL'),
+)
+USER_STATS_REPAIR_SQL = '\n    UNION ALL\n'.join(
+    f"SELECT user_id, '{dimension}', {value}, COUNT(*) FROM content "
+    f"WHERE user_id BETWEEN :first AND :last {condition} GROUP BY user_id, {value}"
+    for dimension, value, condition in USER_STATS_REPAIR_GROUPS)
+# Usuários por transação no reparo
+USER_STATS_REPAIR_BATCH = 200
+
+def content_stats(entries, day=None):
+    """Contagens de [(user_id, rows, blobs), ...] para user_stats"""
+    day = day or datetime.utcnow().strftime('%Y-%m-%d')
+    deltas = Counter()
+    for user_id, rows, _ in entries:
+        for content_type, _, _, platform, tone in rows:
+            deltas[user_id, 'total', ''] += 1
+            deltas[user_id, 'content_type', content_type] += 1
+            deltas[user_id, 'day', day] += 1
+            if platform:
+                deltas[user_id, 'platform', platform] += 1
+            if tone:
+                deltas[user_id, 'tone', tone] += 1
+    return deltas
+
+def apply_user_stats(conn, deltas):
+    """Soma {(user_id, dimensão, valor): n} em user_stats, sem commit"""
+    conn.executemany(UPSERT_USER_STAT_SQL, [key + (count,) for key, count in deltas.items()])
+
+def user_stat(conn, user_id, dimension, value=''):
+    row = conn.execute('SELECT count FROM user_stats WHERE user_id = ? AND dimension = ? AND value = ?',
+                       (user_id, dimension, value)).fetchone()
+    return row[0] if row else 0
+
+def repair_user_stats(conn, commit=True):
+    """Recria user_stats a partir de content, em transações de até
+    USER_STATS_REPAIR_BATCH usuários; retorna (usuários, linhas)
+
+    Com commit=True a conexão deve estar em modo autocommit (isolation_level=None).
+    """
+    user_ids = [user_id for (user_id,) in conn.execute(
+        'SELECT user_id FROM content UNION SELECT user_id FROM user_stats ORDER BY 1')]
+    written = 0
+    for start in range(0, len(user_ids), USER_STATS_REPAIR_BATCH):
+        chunk = user_ids[start:start + USER_STATS_REPAIR_BATCH]
+        bounds = {'first': chunk[0], 'last': chunk[-1]}
+        if commit:
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM user_stats WHERE user_id BETWEEN :first AND :last', bounds)
+            written += conn.execute(f'''
+                INSERT INTO user_stats (user_id, dimension, value, count)
+                {USER_STATS_REPAIR_SQL}
+            ''', bounds).rowcount
+            if commit:
+                conn.execute('COMMIT')
+        except BaseException:
+            if commit:
+                conn.execute('ROLLBACK')
+            raise
+    return len(user_ids), written
+
+@app.cli.command('repair-stats')
+def repair_stats_command():
+    """Recria as estatísticas por usuário de cada shard (flask --app app repair-stats)"""
+    migrate_shards()
+    for shard in existing_shards():
+        conn = sqlite3.connect(shard_database(shard), timeout=30, isolation_level=None)
+        users, rows = repair_user_stats(conn)
+        conn.close()
+        print(f"📊 Shard {shard}: estatísticas de {users} usuário(s) recriadas ({rows} linhas)")
+
+# Migrações versionadas: PRAGMA user_version guarda a última aplicada.
+# Cada migração é idempotente, para bancos criados antes do versionamento (versão 0).
+def migrate_base_tables(conn):
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -41,13 +1932,12 @@ def init_db():
             subscription_status TEXT DEFAULT 'active',
             usage_limit INTEGER DEFAULT 10,
             monthly_usage INTEGER DEFAULT 0,
+            usage_period TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_login TIMESTAMP
         )
     ''')
-    
-    # Tabela de conteúdo gerado
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS content (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -59,12 +1949,332 @@ def init_db():
             keywords TEXT,
             is_favorite BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            blob_hash TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
-    
+
+def migrate_usage_period(conn):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+    if 'usage_period' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN usage_period TEXT')
+        conn.execute('UPDATE users SET usage_period = ?', (current_usage_period(),))
+
+def migrate_content_blobs(conn):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(content)')]
+    if 'blob_hash' not in columns:
+        conn.execute('ALTER TABLE content ADD COLUMN blob_hash TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS content_blobs (
+            hash TEXT PRIMARY KEY,
+            body TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+def migrate_history_indexes(conn):
+    # Filtro por tipo e listagem geral, mais recentes primeiro
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_content_user_type_created
+        ON content (user_id, content_type, created_at, id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_content_user_created
+        ON content (user_id, created_at, id)
+    ''')
+
+def migrate_search(conn):
+    search_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'content_fts'").fetchone()
+    for statement in SEARCH_SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if not search_exists:
+        rebuild_search_index(conn, commit=False)
+
+def migrate_hashtags(conn):
+    hashtags_exist = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'hashtag_counts'").fetchone()
+    for statement in HASHTAG_SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if not hashtags_exist:
+        rebuild_hashtag_index(conn, commit=False)
+
+def migrate_user_directory(conn):
+    # Diretório global (usado no shard 0): ids únicos entre shards e unicidade de username/email
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_directory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO user_directory (id, username, email)
+        SELECT id, username, email FROM users
+    ''')
+
+def migrate_token_revocation(conn):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+    if 'tokens_valid_after' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN tokens_valid_after INTEGER DEFAULT 0')
+
+def migrate_token_version(conn):
+    # Versão exata no lugar do instante (iat em segundos cortava tokens novos)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+    if 'token_version' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0')
+    if 'tokens_valid_after' in columns:
+        conn.execute('ALTER TABLE users DROP COLUMN tokens_valid_after')
+
+def migrate_hashtag_prompts(conn):
+    # O índice passa a aprender só dos prompts: recria o que veio do texto gerado
+    rebuild_hashtag_index(conn, commit=False)
+
+def migrate_archive(conn):
+    for statement in ARCHIVE_SCHEMA_STATEMENTS:
+        conn.execute(statement)
+
+def migrate_user_stats(conn):
+    conn.execute(USER_STATS_SCHEMA)
+    repair_user_stats(conn, commit=False)
+
+MIGRATIONS = (
+    (1, 'tabelas users e content', migrate_base_tables),
+    (2, 'período da cota mensal', migrate_usage_period),
+    (3, 'armazenamento de conteúdo por hash', migrate_content_blobs),
+    (4, 'índices do histórico', migrate_history_indexes),
+    (5, 'busca textual (FTS5)', migrate_search),
+    (6, 'índice de hashtags', migrate_hashtags),
+    (7, 'diretório global de usuários', migrate_user_directory),
+    (8, 'armazenamento frio do conteúdo', migrate_archive),
+    (9, 'estatísticas por usuário', migrate_user_stats),
+    (10, 'índice de hashtags só com termos do usuário', migrate_hashtag_prompts),
+    (11, 'revogação de tokens entre workers', migrate_token_revocation),
+    (12, 'versão dos tokens por usuário', migrate_token_version),
+)
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def init_db(database=None):
+    """Aplica as migrações pendentes e retorna as versões aplicadas
+
+    Roda uma vez por deploy (gunicorn.conf.py, no master) ou pelo comando
+    `flask --app app migrate`. Vários processos podem chamar ao mesmo tempo:
+    o BEGIN IMMEDIATE serializa e só o primeiro aplica.
+    """
+    conn = sqlite3.connect(database or app.config['DATABASE'], timeout=30, isolation_level=None)
+    try:
+        if schema_version(conn) >= MIGRATIONS[-1][0]:
+            return []
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        applied = []
+        try:
+            # Outro processo pode ter migrado enquanto esperávamos o lock
+            version = schema_version(conn)
+            for number, description, migration in MIGRATIONS:
+                if number > version:
+                    migration(conn)
+                    conn.execute(f'PRAGMA user_version = {number}')
+                    applied.append(number)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return applied
+    finally:
+        conn.close()
+
+def migrate_shards():
+    """Aplica as migrações pendentes em cada shard; retorna {shard: versões aplicadas}"""
+    return {shard: init_db(shard_database(shard)) for shard in range(shard_count())}
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Aplica as migrações pendentes em todos os shards (flask --app app migrate)"""
+    applied = migrate_shards()
+    descriptions = dict((number, description) for number, description, _ in MIGRATIONS)
+    for shard, numbers in applied.items():
+        for number in numbers:
+            print(f"🗄️  Shard {shard}, migração {number}: {descriptions[number]}")
+    if any(applied.values()):
+        print(f"✅ {len(applied)} shard(s) na versão {MIGRATIONS[-1][0]}")
+    else:
+        print("✅ Nenhuma migração pendente")
+
+# Rebalanceamento (offline, com os workers parados): move cada usuário para o
+# shard user_id % SHARD_COUNT depois de uma mudança na quantidade de shards
+USER_COLUMNS = ('id, username, email, password_hash, full_name, subscription_plan, '
+                'subscription_status, usage_limit, monthly_usage, usage_period, created_at, last_login, '
+                'token_version')
+
+MOVED_CONTENT_COLUMNS = ('user_id, content_type, prompt, generated_text, platform, tone, '
+                         'keywords, is_favorite, created_at, blob_hash')
+
+def move_user(conn, user_id):
+    """Move o usuário do banco anexado como `source` para o principal
+
+    Uma única transação sobre os dois arquivos (o conteúdo recebe ids novos no
+    destino). Retorna a quantidade de conteúdos movidos.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'''
+            INSERT OR REPLACE INTO main.users ({USER_COLUMNS})
+            SELECT {USER_COLUMNS} FROM source.users WHERE id = ?
+        ''', (user_id,))
+        conn.execute('''
+            INSERT OR IGNORE INTO main.content_blobs (hash, body)
+            SELECT hash, body FROM source.content_blobs
+            WHERE hash IN (SELECT blob_hash FROM source.content WHERE user_id = ?)
+        ''', (user_id,))
+        conn.execute('''
+            INSERT OR IGNORE INTO main.content_archive (hash, codec, dictionary, size, payload)
+            SELECT hash, codec, dictionary, size, payload FROM source.content_archive
+            WHERE hash IN (SELECT blob_hash FROM source.content WHERE user_id = ?)
+        ''', (user_id,))
+        conn.execute('''
+            INSERT OR IGNORE INTO main.archive_dictionaries (id, codec, data, created_at)
+            SELECT id, codec, data, created_at FROM source.archive_dictionaries
+            WHERE id IN (SELECT dictionary FROM source.content_archive
+                         WHERE hash IN (SELECT blob_hash FROM source.content WHERE user_id = ?))
+        ''', (user_id,))
+        moved = conn.execute(f'''
+            INSERT INTO main.content ({MOVED_CONTENT_COLUMNS})
+            SELECT {MOVED_CONTENT_COLUMNS} FROM source.content WHERE user_id = ? ORDER BY id
+        ''', (user_id,)).rowcount
+        # O trigger da busca só lê content_blobs: corpos arquivados são indexados aqui
+        conn.execute(f'''
+            UPDATE main.content_fts
+            SET body = (SELECT {search_body_sql('c', archived=True)} FROM main.content c
+                        WHERE c.id = content_fts.rowid)
+            WHERE rowid IN (SELECT id FROM main.content
+                            WHERE user_id = ? AND generated_text IS NULL
+                            AND blob_hash NOT IN (SELECT hash FROM main.content_blobs))
+        ''', (user_id,))
+        conn.execute('DELETE FROM main.user_stats WHERE user_id = ?', (user_id,))
+        conn.execute('''
+            INSERT INTO main.user_stats (user_id, dimension, value, count)
+            SELECT user_id, dimension, value, count FROM source.user_stats WHERE user_id = ?
+        ''', (user_id,))
+        conn.execute('DELETE FROM source.user_stats WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM source.content WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM source.users WHERE id = ?', (user_id,))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return moved
+
+def rebalance_shards(dry_run=False):
+    """Move os usuários fora do seu shard; retorna [(user_id, origem, destino, conteúdos)]"""
+    migrate_shards()
+    moves = []
+    for source in existing_shards():
+        source_database = shard_database(source)
+        init_db(source_database)
+        reader = sqlite3.connect(source_database)
+        misplaced = [(user_id, shard_for(user_id)) for (user_id,) in reader.execute('SELECT id FROM users ORDER BY id')
+                     if shard_for(user_id) != source]
+        if dry_run:
+            for user_id, target in misplaced:
+                count = reader.execute('SELECT COUNT(*) FROM content WHERE user_id = ?', (user_id,)).fetchone()[0]
+                moves.append((user_id, source, target, count))
+            reader.close()
+            continue
+        reader.close()
+        targets = {}
+        try:
+            for user_id, target in misplaced:
+                conn = targets.get(target)
+                if conn is None:
+                    conn = targets[target] = sqlite3.connect(shard_database(target), timeout=30,
+                                                             isolation_level=None)
+                    conn.execute('ATTACH DATABASE ? AS source', (source_database,))
+                    register_archive_function(conn)
+                moves.append((user_id, source, target, move_user(conn, user_id)))
+        finally:
+            for conn in targets.values():
+                conn.close()
+        if misplaced:
+            # Corpos que só o conteúdo movido referenciava
+            conn = sqlite3.connect(source_database)
+            for table in ('content_blobs', 'content_archive'):
+                conn.execute(f'''
+                    DELETE FROM {table} WHERE hash NOT IN
+                        (SELECT blob_hash FROM content WHERE blob_hash IS NOT NULL)
+                ''')
+            conn.commit()
+            conn.close()
+    return moves
+
+@app.cli.command('rebalance-shards')
+@click.option('--dry-run', is_flag=True, help='Apenas lista os usuários que seriam movidos')
+def rebalance_shards_command(dry_run):
+    """Move usuários para o shard de SHARD_COUNT atual (flask --app app rebalance-shards)"""
+    moves = rebalance_shards(dry_run)
+    for user_id, source, target, count in moves:
+        print(f"{'🔍' if dry_run else '📦'} Usuário {user_id}: shard {source} -> {target} ({count} conteúdos)")
+    print(f"✅ {len(moves)} usuário(s) {'a mover' if dry_run else 'movido(s)'} para {shard_count()} shard(s)")
+    extra = [shard for shard in existing_shards() if shard >= shard_count()]
+    if extra and not dry_run:
+        print(f"ℹ️  Shards sem uso (podem ser removidos): "
+              f"{', '.join(shard_database(shard) for shard in extra)}")
+
+# Tokens JWT
+def create_token(user_id, version=0):
+    return jwt.encode({
+        'user_id': user_id,
+        'ver': version,
+        'iat': int(time.time()),
+        'exp': datetime.utcnow() + timedelta(days=30)
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+
+# Cache de tokens já verificados: digest do token -> (user_id, versão), válido até o exp
+# ou por TOKEN_CACHE_TTL, o que vier antes: ao expirar, a revogação é conferida de novo
+token_cache = LRUCache(app.config['TOKEN_CACHE_SIZE'])
+
+# Revogações feitas neste worker, valendo já (os demais as veem em users.token_version)
+_token_versions = {}
+
+def revoke_user_tokens(user_id, conn=None):
+    """Invalida os tokens já emitidos para o usuário e os remove do cache
+
+    Incrementa users.token_version no shard do usuário; cada token carrega a
+    versão vigente na emissão (claim ver) e só vale enquanto ela for a atual.
+    Outros workers rejeitam os tokens antigos na próxima verificação, em até
+    TOKEN_CACHE_TTL segundos. Tokens emitidos depois continuam válidos.
+    """
+    conn = conn or get_user_db(user_id)
+    row = conn.execute('UPDATE users SET token_version = token_version + 1 WHERE id = ? '
+                       'RETURNING token_version', (user_id,)).fetchone()
     conn.commit()
-    conn.close()
+    if row is not None:
+        _token_versions[user_id] = row[0]
+    return token_cache.delete_where(lambda key, value: value[0] == user_id)
+
+def token_version(user_id):
+    row = get_user_db(user_id).execute('SELECT token_version FROM users WHERE id = ?',
+                                       (user_id,)).fetchone()
+    if row is None:
+        raise jwt.InvalidTokenError('Usuário não encontrado')
+    return row[0]
+
+def verify_token(token):
+    """Retorna o user_id do token, consultando o cache antes de verificar o HMAC"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    cached = token_cache.get(key)
+    if cached is None:
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        cached = (data['user_id'], data.get('ver', 0))
+        if cached[1] != token_version(cached[0]):
+            raise jwt.InvalidTokenError('Token revogado')
+        token_cache.set(key, cached, ttl=min(data['exp'] - time.time(), app.config['TOKEN_CACHE_TTL']))
+    
+    user_id, version = cached
+    if version < _token_versions.get(user_id, 0):
+        raise jwt.InvalidTokenError('Token revogado')
+    return user_id
 
 # Decorador para autenticação JWT
 def token_required(f):
@@ -77,8 +2287,7 @@ def token_required(f):
         try:
             if token.startswith('Bearer '):
                 token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
+            current_user_id = verify_token(token)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token expirado'}), 401
         except jwt.InvalidTokenError:
@@ -87,92 +2296,552 @@ def token_required(f):
         return f(current_user_id, *args, **kwargs)
     return decorated
 
-# Função para gerar conteúdo com IA (simulado)
-def generate_ai_content(content_type, prompt, platform='instagram', tone='casual'):
-    """Simula geração de conteúdo com IA"""
-    
-    if content_type == 'caption':
-        templates = {
-            'casual': f"🚀 {prompt} ✨\n\nVocê sabia que isso pode transformar completamente sua rotina? Aqui estão algumas dicas incríveis:\n\n📝 Primeira dica importante\n💡 Segunda dica valiosa\n🎯 Terceira dica essencial\n\nO que você achou? Comenta aqui embaixo! 👇\n\n#ContentFlow #DicasIncriveis #Transformacao",
-            'professional': f"📊 {prompt}\n\nEm um mercado cada vez mais competitivo, é fundamental estar atualizado com as melhores práticas. Nosso estudo mostra que:\n\n• 85% dos profissionais que aplicam essas técnicas veem resultados\n• Aumento médio de 40% na produtividade\n• ROI positivo em até 30 dias\n\nSaiba mais nos comentários.\n\n#Profissional #Resultados #Estrategia",
-            'funny': f"😂 {prompt} 🤣\n\nGente, vocês não vão acreditar no que aconteceu! Era uma vez...\n\n🎭 Plot twist número 1\n🎪 Momento épico\n🎨 Final inesperado\n\nQuem mais já passou por isso? Marca aquele amigo que precisa ver! 😅\n\n#Humor #Engracado #VidaReal"
-        }
-        return templates.get(tone, templates['casual'])
-    
-    elif content_type == 'ideas':
-        ideas = [
-            {
-                'title': f'Tutorial sobre {prompt}',
-                'description': f'Crie um passo a passo completo sobre {prompt} para iniciantes',
-                'format': 'Vídeo tutorial'
-            },
-            {
-                'title': f'Mitos e verdades sobre {prompt}',
-                'description': f'Desmistifique conceitos errados relacionados a {prompt}',
-                'format': 'Carrossel informativo'
-            },
-            {
-                'title': f'Antes e depois: {prompt}',
-                'description': f'Mostre transformações reais relacionadas a {prompt}',
-                'format': 'Post comparativo'
-            },
-            {
-                'title': f'5 erros comuns em {prompt}',
-                'description': f'Liste os principais erros que pessoas cometem com {prompt}',
-                'format': 'Lista educativa'
-            },
-            {
-                'title': f'Tendências 2024 em {prompt}',
-                'description': f'Apresente as principais tendências e novidades em {prompt}',
-                'format': 'Post informativo'
-            }
-        ]
-        return ideas
-    
-    elif content_type == 'hashtags':
+# Templates de geração de conteúdo (simulado)
+PROMPT_PLACEHOLDER = '{prompt}'
+
+TONES = ('casual', 'professional', 'funny')
+PLATFORMS = ('instagram', 'tiktok', 'youtube', 'linkedin')
+
+CAPTION_TEMPLATES = {
+    'casual': "🚀 {prompt} ✨\n\nVocê sabia que isso pode transformar completamente sua rotina? Aqui estão algumas dicas incríveis:\n\n📝 Primeira dica importante\n💡 Segunda dica valiosa\n🎯 Terceira dica essencial\n\nO que você achou? Comenta aqui embaixo! 👇\n\n#ContentFlow #DicasIncriveis #Transformacao",
+    'professional': "📊 {prompt}\n\nEm um mercado cada vez mais competitivo, é fundamental estar atualizado com as melhores práticas. Nosso estudo mostra que:\n\n• 85% dos profissionais que aplicam essas técnicas veem resultados\n• Aumento médio de 40% na produtividade\n• ROI positivo em até 30 dias\n\nSaiba mais nos comentários.\n\n#Profissional #Resultados #Estrategia",
+    'funny': "😂 {prompt} 🤣\n\nGente, vocês não vão acreditar no que aconteceu! Era uma vez...\n\n🎭 Plot twist número 1\n🎪 Momento épico\n🎨 Final inesperado\n\nQuem mais já passou por isso? Marca aquele amigo que precisa ver! 😅\n\n#Humor #Engracado #VidaReal"
+}
+
+IDEA_TEMPLATES = [
+    {
+        'title': 'Tutorial sobre {prompt}',
+        'description': 'Crie um passo a passo completo sobre {prompt} para iniciantes',
+        'format': 'Vídeo tutorial'
+    },
+    {
+        'title': 'Mitos e verdades sobre {prompt}',
+        'description': 'Desmistifique conceitos errados relacionados a {prompt}',
+        'format': 'Carrossel informativo'
+    },
+    {
+        'title': 'Antes e depois: {prompt}',
+        'description': 'Mostre transformações reais relacionadas a {prompt}',
+        'format': 'Post comparativo'
+    },
+    {
+        'title': '5 erros comuns em {prompt}',
+        'description': 'Liste os principais erros que pessoas cometem com {prompt}',
+        'format': 'Lista educativa'
+    },
+    {
+        'title': 'Tendências 2024 em {prompt}',
+        'description': 'Apresente as principais tendências e novidades em {prompt}',
+        'format': 'Post informativo'
+    }
+]
+
+SCRIPT_TEMPLATE = {
+    'hook': 'Você sabia que {prompt} pode mudar sua vida em 30 dias?',
+    'development': 'Hoje vou te mostrar exatamente como {prompt} funciona na prática. Primeiro, você precisa entender que... [desenvolvimento do conteúdo sobre {prompt}]',
+    'cta': 'Se esse conteúdo te ajudou, salva o post e compartilha com quem precisa ver!',
+    'visual_suggestions': [
+        'Texto na tela com estatísticas',
+        'Transições dinâmicas',
+        'Close-up para momentos importantes',
+        'Música de fundo energética'
+    ]
+}
+
+# Hashtags gerais por plataforma
+PLATFORM_HASHTAGS = {
+    'instagram': ['insta', 'instagram', 'reels', 'stories', 'igers'],
+    'tiktok': ['tiktok', 'fyp', 'viral', 'trending', 'foryou'],
+    'youtube': ['youtube', 'shorts', 'subscribe', 'youtuber', 'video'],
+    'linkedin': ['linkedin', 'professional', 'career', 'business', 'networking']
+}
+
+# Hashtags populares gerais
+POPULAR_HASHTAGS = [
+    'brasil', 'dicas', 'motivacao', 'inspiracao', 'sucesso',
+    'lifestyle', 'qualidade', 'inovacao', 'criatividade', 'foco'
+]
+
+GeneratedContent = namedtuple('GeneratedContent', ['native', 'serialized', 'digest'],
+                              defaults=[None])
+
+def content_digest(serialized):
+    """Hash usado como chave do corpo em content_blobs"""
+    return hashlib.blake2b(serialized.encode('utf-8'), digest_size=16).hexdigest()
+
+def _compile_structure(value):
+    """Transforma a estrutura do template em uma função prompt -> conteúdo
+
+    Strings com {prompt} viram fragmentos unidos pelo prompt; o resto é
+    resolvido aqui, uma única vez, e não a cada chamada.
+    """
+    if isinstance(value, str):
+        if PROMPT_PLACEHOLDER in value:
+            parts = tuple(value.split(PROMPT_PLACEHOLDER))
+            return lambda prompt: prompt.join(parts)
+        return lambda prompt: value
+    if isinstance(value, dict):
+        items = tuple((key, _compile_structure(item)) for key, item in value.items())
+        return lambda prompt: {key: render(prompt) for key, render in items}
+    renderers = tuple(_compile_structure(item) for item in value)
+    return lambda prompt: [render(prompt) for render in renderers]
+
+class PromptTemplate:
+    """Template pré-compilado: o prompt é inserido por uma única junção
+
+    O JSON também é pré-serializado com o marcador, então a forma gravada no
+    banco sai de uma junção com o prompt já escapado, sem json.dumps por chamada.
+    Strings são gravadas como texto puro, como antes.
+    """
+
+    def __init__(self, structure):
+        self.is_text = isinstance(structure, str)
+        self.render_native = _compile_structure(structure)
+        if self.is_text:
+            self.json_parts = None
+        else:
+            self.json_parts = tuple(json.dumps(structure).split(PROMPT_PLACEHOLDER))
+
+    def render(self, prompt):
+        native = self.render_native(prompt)
+        if self.is_text:
+            return GeneratedContent(native, native)
+        return GeneratedContent(native, json.dumps(prompt)[1:-1].join(self.json_parts))
+
+class HashtagTemplate:
+    """Hashtags do prompt, as aprendidas dos pedidos gravados e as fixas da plataforma
+
+    A ordem é determinística: tags do prompt com as variações 2024 e Brasil, tags
+    que mais aparecem junto delas, complementos de prefixo e as listas fixas. Com
+    o índice vazio ou desligado, o resultado é o mesmo de antes do índice.
+    """
+
+    def __init__(self, platform, platform_tags, popular_tags):
+        self.platform = platform
+        self.fixed_tags = tuple(platform_tags) + tuple(popular_tags)
+
+    def render(self, prompt):
         base_hashtags = prompt.lower().replace(' ', '').split(',')
         hashtags = []
         
         # Hashtags específicas do prompt
         for tag in base_hashtags[:3]:
-            hashtags.extend([
-                tag.strip(),
-                f'{tag.strip()}2024',
-                f'{tag.strip()}Brasil'
-            ])
+            tag = tag.strip()
+            hashtags.extend([tag, f'{tag}2024', f'{tag}Brasil'])
         
-        # Hashtags gerais por plataforma
-        platform_hashtags = {
-            'instagram': ['insta', 'instagram', 'reels', 'stories', 'igers'],
-            'tiktok': ['tiktok', 'fyp', 'viral', 'trending', 'foryou'],
-            'youtube': ['youtube', 'shorts', 'subscribe', 'youtuber', 'video'],
-            'linkedin': ['linkedin', 'professional', 'career', 'business', 'networking']
-        }
+        if app.config['HASHTAG_INDEX_ENABLED']:
+            hashtags.extend(get_hashtag_index().suggestions(self.platform, prompt))
+        
+        hashtags.extend(self.fixed_tags)
+        
+        # Remove duplicatas mantendo a ordem e limita a 20
+        native = list(dict.fromkeys(hashtags))[:HASHTAG_SUGGESTIONS]
+        return GeneratedContent(native, json.dumps(native))
+
+# Registro de templates por (content_type, tone, platform)
+TEMPLATE_REGISTRY = {}
+DEFAULT_TEMPLATE = PromptTemplate('Conteúdo gerado com sucesso!')
+
+def register_template(content_type, template, tones=TONES, platforms=PLATFORMS):
+    """Registra um template para todas as combinações de tom e plataforma informadas"""
+    for tone in tones:
+        for platform in platforms:
+            TEMPLATE_REGISTRY[(content_type, tone, platform)] = template
+
+def load_templates():
+    """Carrega os templates padrão no registro (executado uma vez na importação)"""
+    for tone, text in CAPTION_TEMPLATES.items():
+        register_template('caption', PromptTemplate(text), tones=(tone,))
+    register_template('ideas', PromptTemplate(IDEA_TEMPLATES))
+    for platform, tags in PLATFORM_HASHTAGS.items():
+        register_template('hashtags', HashtagTemplate(platform, tags, POPULAR_HASHTAGS),
+                          platforms=(platform,))
+    register_template('script', PromptTemplate(SCRIPT_TEMPLATE))
+
+load_templates()
+
+# Cache de geração
+generation_cache = LRUCache(app.config['GENERATION_CACHE_SIZE'], app.config['GENERATION_CACHE_TTL'])
+
+def render_template(content_type, prompt, platform='instagram', tone='casual'):
+    """Renderiza o template registrado, sem cache"""
+    template = TEMPLATE_REGISTRY.get((content_type, tone, platform))
+    if template is None:
+        # Tom ou plataforma desconhecidos usam o padrão (casual / instagram)
+        template = TEMPLATE_REGISTRY.get((content_type, tone if tone in TONES else 'casual',
+                                          platform if platform in PLATFORMS else 'instagram'),
+                                         DEFAULT_TEMPLATE)
+    return template.render(prompt)
+
+# Provedores de IA
+class ProviderError(Exception):
+    """Falha ao obter conteúdo do provedor de IA"""
+    status_code = 503
+    message = 'Serviço de geração indisponível'
+
+class ProviderBusy(ProviderError):
+    message = 'Serviço de geração sobrecarregado, tente novamente'
+
+class ProviderTimeout(ProviderError):
+    status_code = 504
+    message = 'Tempo limite de geração excedido'
+
+class AIProvider:
+    """Interface dos provedores de geração
+
+    Provedores com blocking = True (chamadas de rede, modelos) rodam no executor
+    limitado do gateway; os demais são chamados diretamente.
+    """
+    name = None
+    blocking = True
+
+    def generate(self, content_type, prompt, platform, tone):
+        """Retorna GeneratedContent(native, serialized)"""
+        raise NotImplementedError
+
+    def stream(self, content_type, prompt, platform, tone):
+        """Gera o conteúdo em partes (seção, valor); por padrão, divide o resultado completo"""
+        return iter_sections(content_type, self.generate(content_type, prompt, platform, tone).native)
+
+class TemplateProvider(AIProvider):
+    """Geração simulada a partir do registro de templates"""
+    name = 'template'
+    blocking = False
+
+    def generate(self, content_type, prompt, platform, tone):
+        return render_template(content_type, prompt, platform, tone)
+
+class FakeProvider(TemplateProvider):
+    """Provedor local com latência configurável, para testes e benchmarks"""
+    name = 'fake'
+    blocking = True
+
+    def __init__(self, latency=0.2):
+        self.latency = latency
+
+    def generate(self, content_type, prompt, platform, tone):
+        time.sleep(self.latency)
+        return super().generate(content_type, prompt, platform, tone)
+
+    def stream(self, content_type, prompt, platform, tone):
+        # A latência total é distribuída entre as seções
+        generated = TemplateProvider.generate(self, content_type, prompt, platform, tone)
+        sections = list(iter_sections(content_type, generated.native))
+        for section in sections:
+            time.sleep(self.latency / len(sections))
+            yield section
+
+PROVIDERS = {
+    'template': TemplateProvider,
+    'fake': lambda: FakeProvider(app.config['FAKE_PROVIDER_LATENCY']),
+}
+
+class ProviderGateway:
+    """Executa chamadas ao provedor com limite de concorrência, timeout e single-flight
+
+    Pedidos idênticos em andamento compartilham a mesma chamada ao provedor.
+    Quando o limite de concorrência está cheio, a requisição espera no máximo
+    o timeout da chamada e falha com ProviderBusy.
+    """
+
+    def __init__(self, provider, max_concurrency=8, timeout=30.0):
+        self.provider = provider
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix=f'provider-{provider.name}')
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def _call(self, content_type, prompt, platform, tone):
+        generated = self.provider.generate(content_type, prompt, platform, tone)
+        return generated._replace(digest=content_digest(generated.serialized))
+
+    def generate(self, content_type, prompt, platform='instagram', tone='casual'):
+        if not self.provider.blocking:
+            self.calls += 1
+            return self._call(content_type, prompt, platform, tone)
         
-        hashtags.extend(platform_hashtags.get(platform, platform_hashtags['instagram']))
+        key = (content_type, prompt, platform, tone)
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
         
-        # Hashtags populares gerais
-        hashtags.extend([
-            'brasil', 'dicas', 'motivacao', 'inspiracao', 'sucesso',
-            'lifestyle', 'qualidade', 'inovacao', 'criatividade', 'foco'
-        ])
+        if leader:
+            self._submit(key, future, deadline)
         
-        return list(set(hashtags))[:20]  # Remove duplicatas e limita a 20
-    
-    elif content_type == 'script':
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            self.timeouts += 1
+            raise ProviderTimeout() from None
+
+    def _submit(self, key, future, deadline):
+        def finish(result=None, error=None):
+            with self._lock:
+                self._in_flight.pop(key, None)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self.rejected += 1
+            finish(error=ProviderBusy())
+            return
+        
+        def run():
+            try:
+                self.calls += 1
+                result = self._call(*key)
+            except ProviderError as e:
+                self.failures += 1
+                finish(error=e)
+            except Exception as e:
+                self.failures += 1
+                app.logger.exception('Falha no provedor %s', self.provider.name)
+                finish(error=ProviderError(str(e)))
+            else:
+                finish(result=result)
+            finally:
+                self._slots.release()
+        
+        self._executor.submit(run)
+
+    def stream(self, content_type, prompt, platform='instagram', tone='casual'):
+        """Repassa as seções do provedor, respeitando o limite de concorrência e o timeout
+
+        Provedores bloqueantes rodam no executor e entregam as seções por uma
+        fila; cada seção é esperada só até o prazo da chamada, então um
+        provedor travado no meio do stream gera ProviderTimeout no prazo.
+        """
+        if not self.provider.blocking:
+            self.calls += 1
+            yield from self.provider.stream(content_type, prompt, platform, tone)
+            return
+        
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise ProviderBusy()
+        sections = Queue()
+        cancelled = threading.Event()
+        
+        def run():
+            try:
+                self.calls += 1
+                for section in self.provider.stream(content_type, prompt, platform, tone):
+                    if cancelled.is_set():
+                        return
+                    sections.put(('section', section))
+                sections.put(('done', None))
+            except ProviderError as e:
+                self.failures += 1
+                sections.put(('error', e))
+            except Exception as e:
+                self.failures += 1
+                app.logger.exception('Falha no provedor %s', self.provider.name)
+                sections.put(('error', ProviderError(str(e))))
+            finally:
+                # A vaga só volta quando o provedor de fato termina
+                self._slots.release()
+        
+        self._executor.submit(run)
+        try:
+            while True:
+                try:
+                    kind, value = sections.get(timeout=max(deadline - time.monotonic(), 0))
+                except Empty:
+                    self.timeouts += 1
+                    raise ProviderTimeout() from None
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise value
+                yield value
+        finally:
+            # Cliente desconectou ou prazo estourou: o provedor para na próxima seção
+            cancelled.set()
+
+    def stats(self):
         return {
-            'hook': f'Você sabia que {prompt} pode mudar sua vida em 30 dias?',
-            'development': f'Hoje vou te mostrar exatamente como {prompt} funciona na prática. Primeiro, você precisa entender que... [desenvolvimento do conteúdo sobre {prompt}]',
-            'cta': 'Se esse conteúdo te ajudou, salva o post e compartilha com quem precisa ver!',
-            'visual_suggestions': [
-                'Texto na tela com estatísticas',
-                'Transições dinâmicas',
-                'Close-up para momentos importantes',
-                'Música de fundo energética'
-            ]
+            'provider': self.provider.name,
+            'in_flight': len(self._in_flight),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'failures': self.failures
         }
-    
-    return "Conteúdo gerado com sucesso!"
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_provider_gateway():
+    """Gateway do provedor configurado, recriado após fork"""
+    global _gateway
+    gateway = _gateway
+    if gateway is None or gateway.pid != os.getpid() or gateway.provider.name != app.config['AI_PROVIDER']:
+        with _gateway_lock:
+            gateway = _gateway
+            if gateway is None or gateway.pid != os.getpid() or gateway.provider.name != app.config['AI_PROVIDER']:
+                factory = PROVIDERS.get(app.config['AI_PROVIDER'])
+                if factory is None:
+                    raise ProviderError(f"Provedor desconhecido: {app.config['AI_PROVIDER']}")
+                gateway = ProviderGateway(factory(),
+                                          app.config['AI_PROVIDER_CONCURRENCY'],
+                                          app.config['AI_PROVIDER_TIMEOUT'])
+                _gateway = gateway
+    return gateway
+
+def render_content(content_type, prompt, platform='instagram', tone='casual'):
+    """Gera o conteúdo e retorna GeneratedContent(native, serialized, digest)
+
+    Consulta o cache e, em caso de falta, o provedor configurado. O resultado é
+    compartilhado: não altere o valor nativo retornado. Hashtags com o índice
+    ativo não entram no cache: as sugestões mudam a cada gravação (o índice
+    tem o seu próprio cache, invalidado por tag).
+    """
+    if content_type == 'hashtags' and app.config['HASHTAG_INDEX_ENABLED']:
+        return get_provider_gateway().generate(content_type, prompt, platform, tone)
+    key = (content_type, prompt, platform, tone)
+    generated = generation_cache.get(key)
+    if generated is None:
+        generated = get_provider_gateway().generate(content_type, prompt, platform, tone)
+        generation_cache.set(key, generated)
+    return generated
+
+def iter_sections(content_type, native):
+    """Divide um conteúdo pronto nas seções enviadas por streaming"""
+    if content_type == 'caption':
+        paragraphs = native.split('\n\n')
+        for paragraph in paragraphs[:-1]:
+            yield 'chunk', paragraph + '\n\n'
+        yield 'chunk', paragraphs[-1]
+    elif isinstance(native, dict):
+        yield from native.items()
+    else:
+        yield 'content', native
+
+def assemble_sections(content_type, sections):
+    """Reconstrói o GeneratedContent a partir das seções recebidas"""
+    if content_type == 'caption':
+        native = ''.join(value for _, value in sections)
+        serialized = native
+    elif content_type == 'script':
+        native = dict(sections)
+        serialized = json.dumps(native)
+    else:
+        native = sections[0][1]
+        serialized = json.dumps(native) if isinstance(native, (dict, list)) else native
+    return GeneratedContent(native, serialized, content_digest(serialized))
+
+class GenerationStream:
+    """Itera as seções geradas; ao final, result contém o conteúdo completo"""
+
+    def __init__(self, content_type, prompt, platform, tone):
+        self.content_type = content_type
+        self.key = (content_type, prompt, platform, tone)
+        self.result = generation_cache.get(self.key)
+
+    def __iter__(self):
+        if self.result is not None:
+            yield from iter_sections(self.content_type, self.result.native)
+            return
+        
+        sections = []
+        for section in get_provider_gateway().stream(*self.key):
+            sections.append(section)
+            yield section
+        self.result = assemble_sections(self.content_type, sections)
+        generation_cache.set(self.key, self.result)
+
+def stream_generation(content_type, prompt, platform='instagram', tone='casual'):
+    """Versão em streaming de render_content"""
+    return GenerationStream(content_type, prompt, platform, tone)
+
+# Função para gerar conteúdo com IA (simulado)
+def generate_ai_content(content_type, prompt, platform='instagram', tone='casual'):
+    """Simula geração de conteúdo com IA"""
+    return render_content(content_type, prompt, platform, tone).native
+
+# Hash de senhas em pool dedicado
+class HasherBusy(Exception):
+    """Fila do pool de hash de senhas está cheia"""
+
+class PasswordHasher:
+    """Executa bcrypt em um pool de threads limitado
+
+    O bcrypt libera o GIL, então o pool limita quantos núcleos o login pode
+    ocupar. Acima de max_pending operações (em execução + na fila) a chamada
+    falha imediatamente com HasherBusy, em vez de prender o worker. O limite é
+    por processo e só tem efeito com threads por worker (gthread, ver
+    gunicorn.conf.py): deve ficar abaixo de GUNICORN_THREADS.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=4):
+        self.rounds = rounds
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._pending = threading.BoundedSemaphore(max(max_pending, workers))
+        self.rejected = 0
+
+    def _run(self, func, *args):
+        if not self._pending.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._pending.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        """Hash gerado com custo diferente do configurado ($2b$<custo>$...)"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def get_password_hasher():
+    """Pool de hash do processo atual, recriado após fork"""
+    global _hasher
+    hasher = _hasher
+    if hasher is None or hasher.pid != os.getpid():
+        with _hasher_lock:
+            hasher = _hasher
+            if hasher is None or hasher.pid != os.getpid():
+                hasher = PasswordHasher(app.config['BCRYPT_ROUNDS'],
+                                        app.config['BCRYPT_WORKERS'],
+                                        app.config['BCRYPT_MAX_PENDING'])
+                _hasher = hasher
+    return hasher
+
+def auth_busy_response():
+    response = jsonify({'error': 'Serviço de autenticação sobrecarregado, tente novamente'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # Rotas de autenticação
 @app.route('/api/auth/register', methods=['POST'])
@@ -187,34 +2856,47 @@ def register():
     if len(data['password']) < 8:
         return jsonify({'error': 'Senha deve ter pelo menos 8 caracteres'}), 400
     
-    conn = sqlite3.connect(app.config['DATABASE'])
-    cursor = conn.cursor()
+    directory = get_db()
     
-    # Verificar se usuário já existe
-    cursor.execute('SELECT id FROM users WHERE username = ? OR email = ?', 
-                   (data['username'], data['email']))
-    if cursor.fetchone():
-        conn.close()
+    # Verificar se usuário já existe (diretório global, no shard 0)
+    if directory.execute('SELECT id FROM user_directory WHERE username = ? OR email = ?',
+                         (data['username'], data['email'])).fetchone():
         return jsonify({'error': 'Username ou email já existe'}), 400
     
     # Hash da senha
-    password_hash = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        password_hash = get_password_hasher().hash(data['password'])
+    except HasherBusy:
+        return auth_busy_response()
     
-    # Inserir usuário
-    cursor.execute('''
-        INSERT INTO users (username, email, password_hash, full_name)
-        VALUES (?, ?, ?, ?)
-    ''', (data['username'], data['email'], password_hash, data.get('full_name', '')))
+    # Reservar username/email e o id no diretório
+    try:
+        user_id = directory.execute('INSERT INTO user_directory (username, email) VALUES (?, ?)',
+                                    (data['username'], data['email'])).lastrowid
+        directory.commit()
+    except sqlite3.IntegrityError:
+        # Outro registro com o mesmo username/email chegou antes
+        directory.rollback()
+        return jsonify({'error': 'Username ou email já existe'}), 400
     
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    # Inserir usuário no seu shard
+    conn = get_user_db(user_id)
+    try:
+        conn.execute('''
+            INSERT INTO users (id, username, email, password_hash, full_name, usage_period)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, data['username'], data['email'], password_hash, data.get('full_name', ''),
+              current_usage_period()))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        # Libera o username/email reservado
+        directory.execute('DELETE FROM user_directory WHERE id = ?', (user_id,))
+        directory.commit()
+        raise
     
     # Gerar token JWT
-    token = jwt.encode({
-        'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=30)
-    }, app.config['SECRET_KEY'], algorithm='HS256')
+    token = create_token(user_id)
     
     return jsonify({
         'message': 'Usuário criado com sucesso',
@@ -238,32 +2920,46 @@ def login():
     if not data or not data.get('username') or not data.get('password'):
         return jsonify({'error': 'Username e senha são obrigatórios'}), 400
     
-    conn = sqlite3.connect(app.config['DATABASE'])
-    cursor = conn.cursor()
-    
-    # Buscar usuário (pode ser username ou email)
-    cursor.execute('''
-        SELECT id, username, email, password_hash, full_name, subscription_plan, 
-               usage_limit, monthly_usage, subscription_status
-        FROM users WHERE username = ? OR email = ?
-    ''', (data['username'], data['username']))
+    # Buscar usuário (pode ser username ou email) no diretório e depois no seu shard
+    entry = get_db().execute('SELECT id FROM user_directory WHERE username = ? OR email = ?',
+                             (data['username'], data['username'])).fetchone()
+    user = None
+    if entry:
+        conn = get_user_db(entry[0])
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, username, email, password_hash, full_name, subscription_plan, 
+                   usage_limit, CASE WHEN usage_period = ? THEN monthly_usage ELSE 0 END,
+                   subscription_status, token_version
+            FROM users WHERE id = ?
+        ''', (current_usage_period(), entry[0]))
+        user = cursor.fetchone()
+    hasher = get_password_hasher()
     
-    user = cursor.fetchone()
+    try:
+        if not user or not hasher.verify(data['password'], user[3]):
+            return jsonify({'error': 'Credenciais inválidas'}), 401
+    except HasherBusy:
+        return auth_busy_response()
     
-    if not user or not bcrypt.checkpw(data['password'].encode('utf-8'), user[3].encode('utf-8')):
-        conn.close()
-        return jsonify({'error': 'Credenciais inválidas'}), 401
+    # Refazer o hash se o custo configurado mudou; com o pool cheio, fica para o próximo login
+    new_hash = None
+    if hasher.needs_rehash(user[3]):
+        try:
+            new_hash = hasher.hash(data['password'])
+        except HasherBusy:
+            pass
     
     # Atualizar último login
-    cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user[0],))
+    if new_hash:
+        cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = ? WHERE id = ?',
+                       (new_hash, user[0]))
+    else:
+        cursor.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user[0],))
     conn.commit()
-    conn.close()
     
     # Gerar token JWT
-    token = jwt.encode({
-        'user_id': user[0],
-        'exp': datetime.utcnow() + timedelta(days=30)
-    }, app.config['SECRET_KEY'], algorithm='HS256')
+    token = create_token(user[0], user[9])
     
     return jsonify({
         'message': 'Login realizado com sucesso',
@@ -280,148 +2976,941 @@ def login():
         }
     })
 
+# Controle de cota mensal
+class QuotaExceeded(Exception):
+    """Usuário sem cota disponível no mês"""
+
+def current_usage_period():
+    return datetime.utcnow().strftime('%Y-%m')
+
+# Uso no período atual: contadores de meses anteriores valem zero
+PERIOD_USAGE_SQL = 'CASE WHEN usage_period = :period THEN monthly_usage ELSE 0 END'
+
+RESERVE_ONE_SQL = f'''
+    UPDATE users SET monthly_usage = {PERIOD_USAGE_SQL} + 1, usage_period = :period
+    WHERE id = :user_id AND (usage_limit = -1 OR {PERIOD_USAGE_SQL} < usage_limit)
+'''
+
+def reserve_quota(conn, user_id, requested=1):
+    """Verifica e incrementa o uso mensal em um único passo atômico
+
+    Retorna quantos usos foram concedidos (até requested) e levanta
+    QuotaExceeded se nenhum foi. A virada de mês zera o contador.
+    """
+    params = {'user_id': user_id, 'period': current_usage_period()}
+    if requested == 1:
+        # Caminho comum: um único UPDATE condicional; só o sucesso importa, então
+        # basta o rowcount (RETURNING fica para quando o valor gravado é lido de volta)
+        granted = conn.execute(RESERVE_ONE_SQL, params).rowcount
+    else:
+        # Lotes: leitura e escrita sob o lock de escrita (BEGIN IMMEDIATE)
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(f'SELECT usage_limit, {PERIOD_USAGE_SQL} FROM users WHERE id = :user_id',
+                           params).fetchone()
+        granted = 0
+        if row:
+            usage_limit, usage = row
+            granted = requested if usage_limit == -1 else max(min(requested, usage_limit - usage), 0)
+        if granted:
+            conn.execute('UPDATE users SET monthly_usage = :usage, usage_period = :period WHERE id = :user_id',
+                         dict(params, usage=usage + granted))
+    conn.commit()
+    
+    if not granted:
+        raise QuotaExceeded()
+    return granted
+
+def release_quota(conn, user_id, count):
+    """Devolve usos reservados que não geraram conteúdo"""
+    if count <= 0:
+        return
+    conn.execute('''
+        UPDATE users SET monthly_usage = MAX(monthly_usage - :count, 0)
+        WHERE id = :user_id AND usage_period = :period
+    ''', {'user_id': user_id, 'count': count, 'period': current_usage_period()})
+    conn.commit()
+
+def quota_exceeded_response():
+    return jsonify({'error': 'Limite mensal atingido'}), 403
+
+# Controle de admissão: token buckets por usuário/IP e limite de requisições simultâneas
+TAKE_TOKENS_SQL = '''
+    INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (:key, :burst - :cost, :now)
+    ON CONFLICT(key) DO UPDATE SET
+        tokens = MIN(:burst, tokens + (:now - updated_at) * :rate) - :cost,
+        updated_at = :now
+    WHERE MIN(:burst, tokens + (:now - updated_at) * :rate) >= :cost
+    RETURNING tokens
+'''
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Muitas requisições, tente novamente em instantes')
+        self.message = str(self)
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Admissão das rotas de geração
+
+    Os buckets ficam em um arquivo SQLite separado (RATE_LIMIT_DATABASE), então
+    valem para todos os workers sem disputar o lock de escrita do banco principal.
+    O limite de requisições simultâneas é por worker: quem não consegue vaga em
+    ADMISSION_QUEUE_TIMEOUT recebe 503.
+    """
+
+    def __init__(self, database, max_in_flight=32, queue_timeout=0.5):
+        self.database = database
+        self.pid = os.getpid()
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max(max_in_flight, 1))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database, timeout=1, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = OFF')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        self._takes = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {'user': 0, 'ip': 0, 'concurrency': 0, 'queue_wait': 0}
+        self.errors = 0
+
+    def take(self, buckets, cost=1):
+        """Consome `cost` fichas de cada bucket (key, rate, burst), todos ou nenhum
+
+        Levanta RateLimited com o tempo até o bucket mais vazio ter fichas.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for key, rate, burst in buckets:
+                        params = {'key': key, 'rate': rate, 'burst': burst,
+                                  'cost': min(cost, burst), 'now': now}
+                        if self._conn.execute(TAKE_TOKENS_SQL, params).fetchone() is None:
+                            self._conn.execute('ROLLBACK')
+                            tokens, updated_at = self._conn.execute(
+                                'SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+                            available = min(burst, tokens + (now - updated_at) * rate)
+                            self.rejected[key.split(':', 1)[0]] += 1
+                            raise RateLimited((params['cost'] - available) / rate)
+                    self._takes += 1
+                    if self._takes % 1000 == 0:
+                        # Buckets cheios há muito tempo equivalem a buckets inexistentes
+                        self._conn.execute('DELETE FROM rate_buckets WHERE updated_at < ?', (now - 3600,))
+                    self._conn.execute('COMMIT')
+                except sqlite3.Error:
+                    if self._conn.in_transaction:
+                        self._conn.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                # Falha no limitador não derruba a geração
+                self.errors += 1
+                app.logger.warning('Falha no rate limiter: %s', e)
+
+    def acquire_slot(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected['concurrency'] += 1
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.admitted += 1
+        return True
+
+    def release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'errors': self.errors
+        }
+
+_admission = None
+_admission_lock = threading.Lock()
+
+def rate_limit_database():
+    return app.config['RATE_LIMIT_DATABASE'] or app.config['DATABASE'] + '.ratelimit'
+
+def get_admission():
+    """Controlador do processo atual, recriado após fork ou troca de banco"""
+    global _admission
+    admission = _admission
+    database = rate_limit_database()
+    if admission is None or admission.pid != os.getpid() or admission.database != database:
+        with _admission_lock:
+            admission = _admission
+            if admission is None or admission.pid != os.getpid() or admission.database != database:
+                admission = AdmissionController(database,
+                                                app.config['GENERATION_MAX_IN_FLIGHT'],
+                                                app.config['ADMISSION_QUEUE_TIMEOUT'])
+                _admission = admission
+    return admission
+
+def client_ip():
+    if app.config['RATE_LIMIT_TRUST_PROXY'] and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
+def request_queue_wait():
+    """Tempo desde X-Request-Start (proxy), em segundos, ou None"""
+    header = request.headers.get('X-Request-Start', '')
+    try:
+        started = float(header[2:] if header.startswith('t=') else header)
+    except ValueError:
+        return None
+    # Aceita segundos, milissegundos ou microssegundos desde a época
+    while started > 1e11:
+        started /= 1000
+    return time.time() - started
+
+def overloaded_response(message, retry_after, status_code):
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+    return response, status_code
+
+def batch_cost():
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    return len(items) if isinstance(items, list) and items else 1
+
+def admission_control(cost=None):
+    """Aplica fila máxima, rate limit e limite de simultaneidade a uma rota autenticada
+
+    Deve vir depois de @token_required (recebe o user_id como primeiro argumento).
+    A vaga de simultaneidade é devolvida quando a resposta termina, inclusive em streaming.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(user_id, *args, **kwargs):
+            if not app.config['RATE_LIMIT_ENABLED']:
+                return f(user_id, *args, **kwargs)
+            admission = get_admission()
+            
+            queue_wait = request_queue_wait()
+            if queue_wait is not None and queue_wait > app.config['ADMISSION_MAX_QUEUE_WAIT']:
+                admission.rejected['queue_wait'] += 1
+                return overloaded_response('Servidor sobrecarregado, tente novamente', 1, 503)
+            
+            try:
+                admission.take([
+                    (f'user:{user_id}', app.config['RATE_LIMIT_USER_RATE'], app.config['RATE_LIMIT_USER_BURST']),
+                    (f'ip:{client_ip()}', app.config['RATE_LIMIT_IP_RATE'], app.config['RATE_LIMIT_IP_BURST'])
+                ], cost() if cost else 1)
+            except RateLimited as e:
+                return overloaded_response(e.message, e.retry_after, 429)
+            
+            if not admission.acquire_slot():
+                return overloaded_response('Servidor sobrecarregado, tente novamente', 1, 503)
+            try:
+                response = app.make_response(f(user_id, *args, **kwargs))
+            except BaseException:
+                admission.release_slot()
+                raise
+            response.call_on_close(admission.release_slot)
+            return response
+        return decorated
+    return decorator
+
 # Rotas de geração de conteúdo
+CONTENT_TYPES = ('caption', 'ideas', 'hashtags', 'script')
+
+def content_params(content_type, data):
+    """Extrai (prompt, platform, tone) do payload conforme o tipo de conteúdo"""
+    if content_type == 'caption':
+        return data.get('topic', ''), data.get('platform', 'instagram'), data.get('tone', 'casual')
+    elif content_type == 'ideas':
+        return data.get('keywords', ''), 'instagram', 'casual'
+    elif content_type == 'hashtags':
+        return data.get('content', ''), data.get('platform', 'instagram'), 'casual'
+    elif content_type == 'script':
+        return data.get('topic', ''), 'instagram', 'casual'
+
+def content_rows(content_type, data, generated):
+    """Linhas para INSERT em content (sem user_id) e em content_blobs"""
+    row = (content_type, data.get('topic') or data.get('keywords') or data.get('content'),
+           generated.digest, data.get('platform', ''), data.get('tone', ''))
+    return row, (generated.digest, generated.serialized)
+
+def build_content(content_type, data):
+    """Gera o conteúdo de um pedido
+
+    Retorna (conteúdo, linha para INSERT sem user_id, linha para content_blobs).
+    """
+    generated = render_content(content_type, *content_params(content_type, data))
+    row, blob = content_rows(content_type, data, generated)
+    return generated.native, row, blob
+
+INSERT_BLOB_SQL = 'INSERT OR IGNORE INTO content_blobs (hash, body) VALUES (?, ?)'
+
+INSERT_CONTENT_SQL = '''
+    INSERT INTO content (user_id, content_type, prompt, blob_hash, platform, tone)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def write_content(conn, entries, shard=0):
+    """Grava [(user_id, rows, blobs), ...] do shard em uma única transação
+
+    As estatísticas dos usuários entram na mesma transação. As contagens de
+    hashtags também, quando o shard é o 0,
+    onde fica o índice; nos demais, vão para a fila do índice junto com os
+    pares. Após o commit, também vão para as tries deste worker.
+    """
+    cursor = conn.cursor()
+    learned = []
+    for user_id, rows, blobs in entries:
+        # Corpo deduplicado por hash
+        cursor.executemany(INSERT_BLOB_SQL, blobs)
+        cursor.executemany(INSERT_CONTENT_SQL, [(user_id,) + row for row in rows])
+        if app.config['HASHTAG_INDEX_ENABLED']:
+            learned.extend((content_type, platform, prompt, 1)
+                           for content_type, prompt, _, platform, _ in rows)
+    apply_user_stats(cursor, content_stats(entries))
+    posts = list(hashtag_posts(learned))
+    counts = Counter()
+    if posts:
+        count_hashtags(posts, counts)
+        if shard == 0:
+            apply_hashtag_counts(cursor, counts)
+    conn.commit()
+    if posts:
+        get_hashtag_index().observe(counts, posts, persisted=shard == 0)
+
+# Gravação em segundo plano (write-behind)
+class ContentWriter:
+    """Fila limitada de conteúdos gravados por uma thread em transações agrupadas
+
+    submit() espera no máximo `timeout` por espaço na fila; se ela continuar
+    cheia, retorna False e o chamador grava de forma síncrona (backpressure).
+    A fila é esvaziada no encerramento do processo (atexit e SIGTERM).
+    """
+
+    def __init__(self, pool, max_queue=10000, batch_size=500, interval=0.05, shard=0):
+        self.pool = pool
+        self.shard = shard
+        self.pid = os.getpid()
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='content-writer', daemon=True)
+        self._stopping = threading.Event()
+        self.batches = 0
+        self.rows_written = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.sync_fallbacks = 0
+        self.errors = 0
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+        if threading.current_thread() is threading.main_thread():
+            previous = signal.getsignal(signal.SIGTERM)
+            
+            def handle_sigterm(signum, frame):
+                self.stop()
+                if callable(previous):
+                    previous(signum, frame)
+                else:
+                    raise SystemExit(0)
+            
+            signal.signal(signal.SIGTERM, handle_sigterm)
+        return self
+
+    def submit(self, user_id, rows, blobs, timeout=0.1):
+        if self._stopping.is_set():
+            return False
+        try:
+            self._queue.put((user_id, rows, blobs), timeout=timeout)
+            return True
+        except Full:
+            self.sync_fallbacks += 1
+            return False
+
+    def _run(self):
+        conn = self.pool.acquire()
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                entries = [self._queue.get(timeout=self.interval)]
+            except Empty:
+                continue
+            # Agrupa o que chegar até o lote encher ou o intervalo acabar
+            row_count = len(entries[0][1])
+            deadline = time.monotonic() + self.interval
+            while row_count < self.batch_size and not self._stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entries.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+                row_count += len(entries[-1][1])
+            try:
+                write_content(conn, entries, self.shard)
+                self.batches += 1
+                self.rows_written += row_count
+                self.last_batch_size = row_count
+                self.max_batch_size = max(self.max_batch_size, row_count)
+            except sqlite3.Error:
+                self.errors += 1
+                conn.rollback()
+                app.logger.exception('Falha ao gravar lote de %d conteúdos', row_count)
+            finally:
+                for _ in entries:
+                    self._queue.task_done()
+        self.pool.release(conn)
+
+    def flush(self):
+        """Aguarda a gravação de tudo que já está na fila"""
+        self._queue.join()
+
+    def stop(self, timeout=10):
+        """Grava o que resta na fila e encerra a thread"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'batches': self.batches,
+            'rows_written': self.rows_written,
+            'last_batch_size': self.last_batch_size,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': self.rows_written / self.batches if self.batches else 0.0,
+            'sync_fallbacks': self.sync_fallbacks,
+            'errors': self.errors
+        }
+
+_writers = {}
+_writer_lock = threading.Lock()
+
+def get_content_writer(shard=0):
+    """Writer do shard no processo atual, iniciado sob demanda e recriado após fork"""
+    writer = _writers.get(shard)
+    pool = get_pool(shard)
+    if writer is None or writer.pid != os.getpid() or writer.pool is not pool:
+        with _writer_lock:
+            writer = _writers.get(shard)
+            if writer is None or writer.pid != os.getpid() or writer.pool is not pool:
+                if writer is not None and writer.pid == os.getpid():
+                    writer.stop()
+                writer = ContentWriter(pool,
+                                       app.config['CONTENT_WRITE_QUEUE'],
+                                       app.config['CONTENT_WRITE_BATCH'],
+                                       app.config['CONTENT_WRITE_INTERVAL'],
+                                       shard).start()
+                _writers[shard] = writer
+    return writer
+
+def save_content(conn, user_id, rows, blobs):
+    """Grava conteúdos gerados (a cota já foi reservada)
+
+    `conn` é a conexão do shard do usuário. Com CONTENT_WRITE_MODE=batched as
+    linhas vão para a fila do ContentWriter do shard e a resposta não espera o
+    commit; com sync (padrão) são gravadas aqui.
+    """
+    shard = shard_for(user_id)
+    if app.config['CONTENT_WRITE_MODE'] == 'batched':
+        if get_content_writer(shard).submit(user_id, rows, blobs, app.config['CONTENT_WRITE_TIMEOUT']):
+            return
+    write_content(conn, [(user_id, rows, blobs)], shard)
+
+# Streaming (Server-Sent Events)
+STREAMABLE_TYPES = ('caption', 'script')
+
+def wants_stream():
+    """Cliente pediu streaming via ?stream=1 ou Accept: text/event-stream"""
+    return (request.args.get('stream') in ('1', 'true')
+            or 'text/event-stream' in request.headers.get('Accept', ''))
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_content(user_id, content_type, data):
+    """Envia as seções à medida que são geradas e grava ao final do stream"""
+    try:
+        generation = stream_generation(content_type, *content_params(content_type, data))
+    except Exception:
+        # Falhou antes do stream começar: o finally de events() não vai rodar
+        release_quota(get_user_db(user_id), user_id, 1)
+        raise
+    
+    def events():
+        saved = False
+        try:
+            for section, value in generation:
+                yield sse_event(section, value)
+            
+            generated = generation.result
+            row, blob = content_rows(content_type, data, generated)
+            save_content(get_user_db(user_id), user_id, [row], [blob])
+            saved = True
+            yield sse_event('done', {'status': 'success', content_type: generated.native})
+        except ProviderError as e:
+            yield sse_event('error', {'error': e.message})
+        finally:
+            # Erro ou cliente desconectado antes do fim: devolve a cota reservada
+            if not saved:
+                release_quota(get_user_db(user_id), user_id, 1)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/content/generate/<content_type>', methods=['POST'])
 @token_required
+@admission_control()
 def generate_content(user_id, content_type):
-    """Gera conteúdo usando IA"""
-    data = request.get_json()
+    """Gera conteúdo usando IA
+
+    Legendas e roteiros aceitam streaming SSE (?stream=1 ou
+    Accept: text/event-stream): cada seção é enviada assim que gerada.
+    """
+    data = request.get_json(silent=True)
     
-    if content_type not in ['caption', 'ideas', 'hashtags', 'script']:
+    if content_type not in CONTENT_TYPES:
         return jsonify({'error': 'Tipo de conteúdo inválido'}), 400
     
-    # Verificar limite de uso
-    conn = sqlite3.connect(app.config['DATABASE'])
-    cursor = conn.cursor()
+    # Validar antes de reservar: um corpo inválido não consome cota
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Corpo JSON (objeto) é obrigatório'}), 400
     
-    cursor.execute('SELECT usage_limit, monthly_usage FROM users WHERE id = ?', (user_id,))
-    user_data = cursor.fetchone()
+    # Reservar uso da cota (verificação e incremento atômicos)
+    conn = get_user_db(user_id)
+    try:
+        reserve_quota(conn, user_id)
+    except QuotaExceeded:
+        return quota_exceeded_response()
     
-    if user_data and user_data[0] != -1 and user_data[1] >= user_data[0]:
-        conn.close()
-        return jsonify({'error': 'Limite mensal atingido'}), 403
+    if content_type in STREAMABLE_TYPES and wants_stream():
+        return stream_content(user_id, content_type, data)
     
     # Gerar conteúdo
-    if content_type == 'caption':
-        prompt = data.get('topic', '')
-        platform = data.get('platform', 'instagram')
-        tone = data.get('tone', 'casual')
-        generated_content = generate_ai_content('caption', prompt, platform, tone)
-        
-    elif content_type == 'ideas':
-        keywords = data.get('keywords', '')
-        generated_content = generate_ai_content('ideas', keywords)
-        
-    elif content_type == 'hashtags':
-        content = data.get('content', '')
-        platform = data.get('platform', 'instagram')
-        generated_content = generate_ai_content('hashtags', content, platform)
-        
-    elif content_type == 'script':
-        topic = data.get('topic', '')
-        generated_content = generate_ai_content('script', topic)
+    try:
+        generated_content, row, blob = build_content(content_type, data)
+    except ProviderError as e:
+        release_quota(conn, user_id, 1)
+        return jsonify({'error': e.message}), e.status_code
+    except Exception:
+        release_quota(conn, user_id, 1)
+        raise
     
     # Salvar no banco
-    cursor.execute('''
-        INSERT INTO content (user_id, content_type, prompt, generated_text, platform, tone)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (user_id, content_type, data.get('topic') or data.get('keywords') or data.get('content'), 
-          json.dumps(generated_content) if isinstance(generated_content, (dict, list)) else generated_content,
-          data.get('platform', ''), data.get('tone', '')))
-    
-    # Atualizar uso mensal
-    cursor.execute('UPDATE users SET monthly_usage = monthly_usage + 1 WHERE id = ?', (user_id,))
-    
-    conn.commit()
-    conn.close()
+    save_content(conn, user_id, [row], [blob])
     
     # Preparar resposta
     response = {'status': 'success'}
-    
-    if content_type == 'caption':
-        response['caption'] = generated_content
-    elif content_type == 'ideas':
-        response['ideas'] = generated_content
-    elif content_type == 'hashtags':
-        response['hashtags'] = generated_content
-    elif content_type == 'script':
-        response['script'] = generated_content
+    response[content_type] = generated_content
     
     return jsonify(response)
 
+@app.route('/api/content/generate/batch', methods=['POST'])
+@token_required
+@admission_control(cost=batch_cost)
+def generate_content_batch(user_id):
+    """Gera vários conteúdos em uma única requisição e transação
+
+    Corpo: {"items": [{"type": "caption", "topic": "...", ...}, ...]}. Cada item
+    usa os mesmos campos do endpoint individual. Erros por item são retornados
+    em "results" sem invalidar os demais.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Lista de itens é obrigatória'}), 400
+    
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f"Máximo de {app.config['BATCH_MAX_ITEMS']} itens por lote"}), 400
+    
+    # Reservar a cota uma vez para o lote inteiro
+    valid = sum(1 for item in items if isinstance(item, dict) and item.get('type') in CONTENT_TYPES)
+    conn = get_user_db(user_id)
+    granted = 0
+    if valid:
+        try:
+            granted = reserve_quota(conn, user_id, valid)
+        except QuotaExceeded:
+            return quota_exceeded_response()
+    
+    # Gerar conteúdo
+    results = []
+    rows = []
+    blobs = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or item.get('type') not in CONTENT_TYPES:
+            results.append({'index': index, 'status': 'error', 'error': 'Tipo de conteúdo inválido'})
+            continue
+        
+        if len(rows) >= granted:
+            results.append({'index': index, 'status': 'error', 'error': 'Limite mensal atingido'})
+            continue
+        
+        try:
+            generated_content, row, blob = build_content(item['type'], item)
+        except ProviderError as e:
+            results.append({'index': index, 'status': 'error', 'error': e.message})
+            continue
+        except Exception:
+            app.logger.exception('Falha ao gerar item %d do lote', index)
+            results.append({'index': index, 'status': 'error', 'error': 'Falha ao gerar conteúdo'})
+            continue
+        
+        rows.append(row)
+        blobs.append(blob)
+        results.append({'index': index, 'status': 'success', 'type': item['type'],
+                        item['type']: generated_content})
+    
+    # Salvar tudo em uma única transação e devolver a cota não usada
+    if rows:
+        save_content(conn, user_id, rows, blobs)
+    release_quota(conn, user_id, granted - len(rows))
+    
+    return jsonify({
+        'status': 'success',
+        'generated': len(rows),
+        'failed': len(items) - len(rows),
+        'results': results
+    })
+
+# Cursor opaco para paginação por chave (keyset)
+def encode_cursor(created_at, content_id):
+    raw = json.dumps([created_at, content_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor_value):
+    """Decodifica o cursor; levanta ValueError se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor_value + '=' * (-len(cursor_value) % 4))
+        created_at, content_id = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Cursor inválido') from exc
+    if not isinstance(created_at, str) or not isinstance(content_id, int):
+        raise ValueError('Cursor inválido')
+    return created_at, content_id
+
+# Colunas de content na ordem original, com o corpo vindo de content_blobs
+# (ou de content_archive, descomprimido, se já foi para o armazenamento frio)
+CONTENT_COLUMNS = ('c.id, c.user_id, c.content_type, c.prompt, '
+                   f"COALESCE(c.generated_text, b.body{ARCHIVED_BODY_SQL.format(row='c')}), "
+                   'c.platform, c.tone, c.keywords, c.is_favorite, c.created_at')
+
+# Tipos armazenados como JSON (ideias, hashtags e roteiros)
+JSON_CONTENT_TYPES = ('ideas', 'hashtags', 'script')
+
+def format_content(content, raw=False):
+    """Formata uma linha de CONTENT_COLUMNS para a resposta
+
+    Com raw=True, o JSON armazenado é embutido como valor (RawJSON) em vez de
+    string escapada, sem decodificar e recodificar.
+    """
+    generated_text = content[4]
+    if raw and content[2] in JSON_CONTENT_TYPES and generated_text and generated_text[0] in '[{':
+        generated_text = RawJSON(generated_text)
+    return {
+        'id': content[0],
+        'content_type': content[2],
+        'prompt': content[3],
+        'generated_text': generated_text,
+        'platform': content[5],
+        'tone': content[6],
+        'is_favorite': bool(content[8]),
+        'created_at': content[9]
+    }
+
+def wants_raw_json():
+    return request.args.get('raw') in ('1', 'true')
+
+MAX_PER_PAGE = 100
+
+def pagination_args():
+    """(page, per_page) da query string
+
+    per_page acima de MAX_PER_PAGE é reduzido; as respostas trazem o valor
+    efetivo em per_page. Levanta ValueError se não forem inteiros.
+    """
+    page = max(int(request.args.get('page', 1)), 1)
+    per_page = min(max(int(request.args.get('per_page', 10)), 1), MAX_PER_PAGE)
+    return page, per_page
+
 @app.route('/api/content/history', methods=['GET'])
 @token_required
 def get_content_history(user_id):
-    """Retorna histórico de conteúdo do usuário"""
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 10))
+    """Retorna histórico de conteúdo do usuário
+
+    Aceita paginação por página (?page=&per_page=) ou por cursor (?after=<cursor>),
+    que busca pelo índice em vez de usar OFFSET. O total é exato no modo página
+    e opcional (?count=1) no modo cursor. Com ?raw=1, ideias, hashtags e roteiros
+    vêm como JSON em generated_text, em vez de string.
+    """
+    try:
+        page, per_page = pagination_args()
+    except ValueError:
+        return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
     content_type = request.args.get('type', '')
+    after = request.args.get('after')
     
-    conn = sqlite3.connect(app.config['DATABASE'])
+    conn = get_user_db(user_id)
     cursor = conn.cursor()
     
-    query = 'SELECT * FROM content WHERE user_id = ?'
+    where = 'user_id = ?'
     params = [user_id]
     
     if content_type:
-        query += ' AND content_type = ?'
+        where += ' AND content_type = ?'
         params.append(content_type)
     
-    query += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, (page - 1) * per_page])
+    query = (f'SELECT {CONTENT_COLUMNS} FROM content c '
+             f'LEFT JOIN content_blobs b ON b.hash = c.blob_hash WHERE {where}')
+    query_params = list(params)
     
-    cursor.execute(query, params)
+    if after is not None:
+        if after:
+            try:
+                query += ' AND (created_at, id) < (?, ?)'
+                query_params.extend(decode_cursor(after))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        query_params.append(per_page)
+    else:
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?'
+        query_params.extend([per_page, (page - 1) * per_page])
+    
+    cursor.execute(query, query_params)
     contents = cursor.fetchall()
     
-    # Contar total
-    count_query = 'SELECT COUNT(*) FROM content WHERE user_id = ?'
-    count_params = [user_id]
-    if content_type:
-        count_query += ' AND content_type = ?'
-        count_params.append(content_type)
+    # Total mantido em user_stats (opcional no modo cursor)
+    total = None
+    if after is None or request.args.get('count') in ('1', 'true'):
+        total = (user_stat(conn, user_id, 'content_type', content_type) if content_type
+                 else user_stat(conn, user_id, 'total'))
     
-    cursor.execute(count_query, count_params)
-    total = cursor.fetchone()[0]
+    # Formatar resposta
+    raw = wants_raw_json()
+    formatted_contents = [format_content(content, raw) for content in contents]
     
-    conn.close()
+    next_cursor = None
+    if len(contents) == per_page:
+        next_cursor = encode_cursor(contents[-1][9], contents[-1][0])
     
-    # Formatar resposta
+    response = {
+        'contents': formatted_contents,
+        'next_cursor': next_cursor,
+        'per_page': per_page
+    }
+    
+    if after is None:
+        response.update({
+            'total': total,
+            'page': page,
+            'pages': (total + per_page - 1) // per_page
+        })
+    elif total is not None:
+        response['total'] = total
+    
+    return jsonify(response)
+
+@app.route('/api/content/<int:content_id>/favorite', methods=['POST'])
+@token_required
+def toggle_favorite(user_id, content_id):
+    """Marca ou desmarca o conteúdo como favorito"""
+    conn = get_user_db(user_id)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        UPDATE content SET is_favorite = NOT is_favorite
+        WHERE id = ? AND user_id = ? RETURNING is_favorite
+    ''', (content_id, user_id))
+    row = cursor.fetchone()
+    
+    if not row:
+        return jsonify({'error': 'Conteúdo não encontrado'}), 404
+    
+    is_favorite = bool(row[0])
+    apply_user_stats(cursor, {(user_id, 'favorites', ''): 1 if is_favorite else -1})
+    conn.commit()
+    
+    return jsonify({'id': content_id, 'is_favorite': is_favorite})
+
+# Busca no histórico
+def build_search_query(text):
+    """Converte o texto do usuário em uma consulta FTS5 segura
+
+    Termos viram frases entre aspas (AND implícito); texto entre aspas é
+    buscado como frase exata.
+    """
+    text = text.strip()
+    if len(text) > 1 and text.startswith('"') and text.endswith('"'):
+        terms = [text[1:-1]]
+    else:
+        terms = text.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms if term.strip('"'))
+
+@app.route('/api/content/search', methods=['GET'])
+@token_required
+def search_content(user_id):
+    """Busca textual no prompt e no conteúdo gerado do usuário, ordenada por relevância"""
+    query_text = build_search_query(request.args.get('q', ''))
+    if not query_text:
+        return jsonify({'error': 'Parâmetro q é obrigatório'}), 400
+    
+    try:
+        page, per_page = pagination_args()
+    except ValueError:
+        return jsonify({'error': 'Parâmetros de paginação inválidos'}), 400
+    
+    # Termos só nas colunas de texto: em user_key, 'u1' casaria com todo o conteúdo do usuário 1
+    match = f'user_key:"u{int(user_id)}" AND {{prompt body}} : ({query_text})'
+    
+    conn = get_user_db(user_id)
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+        SELECT {CONTENT_COLUMNS}, snippet(content_fts, 2, '[', ']', '…', 12), f.rank
+        FROM content_fts f
+        JOIN content c ON c.id = f.rowid
+        LEFT JOIN content_blobs b ON b.hash = c.blob_hash
+        WHERE content_fts MATCH ? AND rank MATCH 'bm25(0.0, 2.0, 1.0)'
+        ORDER BY f.rank
+        LIMIT ? OFFSET ?
+    ''', (match, per_page, (page - 1) * per_page))
+    contents = cursor.fetchall()
+    
+    cursor.execute('SELECT COUNT(*) FROM content_fts WHERE content_fts MATCH ?', (match,))
+    total = cursor.fetchone()[0]
+    
+    raw = wants_raw_json()
     formatted_contents = []
     for content in contents:
-        formatted_contents.append({
-            'id': content[0],
-            'content_type': content[2],
-            'prompt': content[3],
-            'generated_text': content[4],
-            'platform': content[5],
-            'tone': content[6],
-            'is_favorite': bool(content[8]),
-            'created_at': content[9]
-        })
+        formatted = format_content(content, raw)
+        formatted['snippet'] = content[10]
+        formatted['score'] = -content[11]
+        formatted_contents.append(formatted)
     
     return jsonify({
         'contents': formatted_contents,
         'total': total,
         'page': page,
+        'per_page': per_page,
         'pages': (total + per_page - 1) // per_page
     })
 
+# Exportação do histórico completo
+EXPORT_FIELDS = ('id', 'content_type', 'prompt', 'generated_text', 'platform', 'tone',
+                 'is_favorite', 'created_at', 'cursor')
+
+def parse_export_date(value):
+    """Aceita data ou data/hora ISO e devolve no formato do CURRENT_TIMESTAMP do SQLite"""
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def iter_export_rows(conn, query, params, fetch_size):
+    """Lê o cursor em blocos com fetchmany, sem carregar o histórico em memória"""
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for content in rows:
+            yield (content[0], content[2], content[3], content[4], content[5], content[6],
+                   bool(content[8]), content[9], encode_cursor(content[9], content[0]))
+
+@app.route('/api/content/export', methods=['GET'])
+@token_required
+def export_content(user_id):
+    """Exporta todo o histórico do usuário em NDJSON ou CSV, em streaming
+
+    Filtros: ?type=, ?from= (inclusivo) e ?to= (exclusivo), em ISO 8601.
+    As linhas saem em ordem cronológica e cada uma traz seu cursor; para
+    retomar uma exportação interrompida, envie ?after=<último cursor recebido>.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Formato inválido (use ndjson ou csv)'}), 400
+    
+    where = 'user_id = ?'
+    params = [user_id]
+    
+    content_type = request.args.get('type', '')
+    if content_type:
+        where += ' AND content_type = ?'
+        params.append(content_type)
+    
+    try:
+        if request.args.get('from'):
+            where += ' AND created_at >= ?'
+            params.append(parse_export_date(request.args['from']))
+        if request.args.get('to'):
+            where += ' AND created_at < ?'
+            params.append(parse_export_date(request.args['to']))
+    except ValueError:
+        return jsonify({'error': 'Data inválida (use o formato ISO 8601)'}), 400
+    
+    if request.args.get('after'):
+        try:
+            where += ' AND (created_at, id) > (?, ?)'
+            params.extend(decode_cursor(request.args['after']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    query = (f'SELECT {CONTENT_COLUMNS} FROM content c '
+             f'LEFT JOIN content_blobs b ON b.hash = c.blob_hash WHERE {where} '
+             f'ORDER BY created_at, id')
+    rows = iter_export_rows(get_user_db(user_id), query, params, app.config['EXPORT_FETCH_SIZE'])
+    
+    if export_format == 'ndjson':
+        def generate():
+            for row in rows:
+                yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+        mimetype = 'application/x-ndjson'
+    else:
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            for row in rows:
+                writer.writerow(row)
+                if buffer.tell() >= 65536:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        mimetype = 'text/csv'
+    
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=contentflow-export.{export_format}',
+        'X-Accel-Buffering': 'no'
+    })
+
 # Rotas de usuário
 @app.route('/api/user/profile', methods=['GET'])
 @token_required
 def get_profile(user_id):
     """Retorna perfil do usuário"""
-    conn = sqlite3.connect(app.config['DATABASE'])
+    conn = get_user_db(user_id)
     cursor = conn.cursor()
     
     cursor.execute('''
         SELECT username, email, full_name, subscription_plan, usage_limit, 
-               monthly_usage, subscription_status, created_at, last_login
+               CASE WHEN usage_period = ? THEN monthly_usage ELSE 0 END,
+               subscription_status, created_at, last_login
         FROM users WHERE id = ?
-    ''', (user_id,))
+    ''', (current_usage_period(), user_id))
     
     user = cursor.fetchone()
-    conn.close()
     
     if not user:
         return jsonify({'error': 'Usuário não encontrado'}), 404
@@ -439,6 +3928,46 @@ def get_profile(user_id):
         'last_login': user[8]
     })
 
+@app.route('/api/user/stats', methods=['GET'])
+@token_required
+def get_user_stats(user_id):
+    """Estatísticas do usuário lidas de user_stats, sem agregar o histórico
+
+    ?days= (padrão 30, máx. 365) define a janela da atividade diária.
+    """
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), USER_STATS_MAX_DAYS)
+    except ValueError:
+        return jsonify({'error': 'Parâmetro days inválido'}), 400
+    
+    conn = get_user_db(user_id)
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+        SELECT dimension, value, count FROM user_stats
+        WHERE user_id = ? AND dimension IN ({', '.join('?' * len(USER_STATS_DIMENSIONS))})
+    ''', (user_id,) + USER_STATS_DIMENSIONS)
+    stats = {dimension: {} for dimension in USER_STATS_DIMENSIONS}
+    for dimension, value, count in cursor.fetchall():
+        if count:
+            stats[dimension][value] = count
+    
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    cursor.execute('''
+        SELECT value, count FROM user_stats
+        WHERE user_id = ? AND dimension = 'day' AND value >= ? ORDER BY value
+    ''', (user_id, since))
+    
+    return jsonify({
+        'total': stats['total'].get('', 0),
+        'favorites': stats['favorites'].get('', 0),
+        'by_type': stats['content_type'],
+        'by_platform': stats['platform'],
+        'by_tone': stats['tone'],
+        'activity': [{'date': day, 'count': count} for day, count in cursor.fetchall()],
+        'days': days
+    })
+
 # Rotas de sistema
 @app.route('/api/health')
 def health_check():
@@ -447,52 +3976,60 @@ def health_check():
         'status': 'ok',
         'message': 'ContentFlow AI API funcionando',
         'version': '1.0.0',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'caches': {
+            'token': token_cache.stats(),
+            'generation': generation_cache.stats()
+        },
+        # Por shard; None enquanto nenhum writer foi iniciado
+        'write_behind': {str(shard): writer.stats() for shard, writer in list(_writers.items())} or None
     })
 
+def admin_authorized():
+    """Com ADMIN_TOKEN definido, exige o header X-Admin-Token correspondente"""
+    token = app.config['ADMIN_TOKEN']
+    return not token or secrets.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+@app.route('/api/metrics')
+def metrics_endpoint():
+    """Métricas de todos os workers no formato de texto do Prometheus"""
+    if not admin_authorized():
+        return jsonify({'error': 'Token de administrador inválido'}), 403
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+API_INFO = {
+    'name': 'ContentFlow AI',
+    'version': '1.0.0',
+    'description': 'API para geração de conteúdo para redes sociais usando IA',
+    'features': [
+        'Geração de legendas inteligentes',
+        'Criação de ideias de conteúdo',
+        'Geração de hashtags relevantes',
+        'Roteiros para vídeos curtos',
+        'Sistema de usuários completo',
+        'Planos de assinatura',
+        'Histórico de conteúdo'
+    ],
+    'endpoints': {
+        'auth': ['/api/auth/register', '/api/auth/login'],
+        'content': ['/api/content/generate/<type>', '/api/content/generate/batch',
+                    '/api/content/history', '/api/content/search', '/api/content/export',
+                    '/api/content/<id>/favorite'],
+        'user': ['/api/user/profile', '/api/user/stats'],
+        'system': ['/api/health', '/api/info', '/api/metrics']
+    }
+}
+
+# Resposta constante, serializada uma única vez
+api_info_response = static_json(API_INFO)
+
 @app.route('/api/info')
 def api_info():
     """Informações da API"""
-    return jsonify({
-        'name': 'ContentFlow AI',
-        'version': '1.0.0',
-        'description': 'API para geração de conteúdo para redes sociais usando IA',
-        'features': [
-            'Geração de legendas inteligentes',
-            'Criação de ideias de conteúdo',
-            'Geração de hashtags relevantes',
-            'Roteiros para vídeos curtos',
-            'Sistema de usuários completo',
-            'Planos de assinatura',
-            'Histórico de conteúdo'
-        ],
-        'endpoints': {
-            'auth': ['/api/auth/register', '/api/auth/login'],
-            'content': ['/api/content/generate/<type>', '/api/content/history'],
-            'user': ['/api/user/profile'],
-            'system': ['/api/health', '/api/info']
-        }
-    })
+    return api_info_response()
 
-# Rota para servir frontend (se existir)
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve_frontend(path):
-    """Serve o frontend React ou página de demonstração"""
-    
-    # Verificar se existe pasta static com frontend
-    static_dir = os.path.join(os.path.dirname(__file__), 'static')
-    
-    if os.path.exists(static_dir):
-        if path != '' and os.path.exists(os.path.join(static_dir, path)):
-            return send_from_directory(static_dir, path)
-        else:
-            index_path = os.path.join(static_dir, 'index.html')
-            if os.path.exists(index_path):
-                return send_from_directory(static_dir, 'index.html')
-    
-    # Página de demonstração
-    return '''
+# Página de demonstração (servida quando não há frontend em static/)
+DEMO_PAGE = '''
     <!DOCTYPE html>
     <html lang="pt-BR">
     <head>
@@ -534,6 +4071,7 @@ def serve_frontend(path):
                 <div class="endpoint"><strong>POST</strong> /api/content/generate/ideas - Gerar ideias</div>
                 <div class="endpoint"><strong>POST</strong> /api/content/generate/hashtags - Gerar hashtags</div>
                 <div class="endpoint"><strong>POST</strong> /api/content/generate/script - Gerar roteiro</div>
+                <div class="endpoint"><strong>POST</strong> /api/content/generate/batch - Gerar em lote</div>
                 <div class="endpoint"><strong>GET</strong> /api/content/history - Histórico</div>
                 <div class="endpoint"><strong>GET</strong> /api/user/profile - Perfil do usuário</div>
             </div>
@@ -545,6 +4083,113 @@ def serve_frontend(path):
     </html>
     '''
 
+# Arquivos estáticos: manifesto em memória, pré-comprimido
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'application/manifest+json', 'application/wasm')
+
+# Nomes com hash de conteúdo (app.3f2a9c1b.js, chunk-8d1e2f3a.css) podem ser cacheados para sempre
+HASHED_ASSET_RE = re.compile(r'[.-][0-9a-f]{8,}\.[^/]+$', re.IGNORECASE)
+
+class StaticAsset:
+    """Arquivo estático com ETag forte e variantes gzip/brotli pré-calculadas
+
+    Arquivos acima do limite de memória guardam só o caminho e são enviados
+    do disco, com o mesmo ETag.
+    """
+
+    def __init__(self, name, body, mimetype, path=None):
+        self.name = name
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.cache_control = ('public, max-age=31536000, immutable' if HASHED_ASSET_RE.search(name)
+                              else 'no-cache')
+        self.encodings = {}
+        if path is None:
+            self.encodings['identity'] = body
+            if mimetype.startswith(COMPRESSIBLE_TYPES) and len(body) > 256:
+                self.encodings['gzip'] = gzip.compress(body, 9, mtime=0)
+                if brotli is not None:
+                    self.encodings['br'] = brotli.compress(body)
+
+    @classmethod
+    def from_file(cls, name, path, memory_limit):
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        with open(path, 'rb') as f:
+            body = f.read()
+        return cls(name, body, mimetype, path if len(body) > memory_limit else None)
+
+    def matches(self, if_none_match):
+        """ETag do If-None-Match corresponde a qualquer variante deste arquivo"""
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag.strip('"').split('-')[0] == self.etag:
+                return True
+        return False
+
+    def response(self):
+        headers = {'ETag': f'"{self.etag}"', 'Cache-Control': self.cache_control,
+                   'Vary': 'Accept-Encoding'}
+        if self.matches(request.headers.get('If-None-Match', '')):
+            return Response(status=304, headers=headers)
+        
+        if self.path is not None:
+            response = send_file(self.path, mimetype=self.mimetype, conditional=True, etag=False)
+            response.headers.update(headers)
+            return response
+        
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in self.encodings and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        
+        response = Response(self.encodings[encoding], mimetype=self.mimetype, headers=headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+            response.headers['ETag'] = f'"{self.etag}-{encoding}"'
+        return response
+
+class AssetManifest:
+    """Índice de static/ construído uma vez por worker"""
+
+    def __init__(self, directory, memory_limit=512 * 1024):
+        self.directory = directory
+        self.assets = {}
+        if os.path.isdir(directory):
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, directory).replace(os.sep, '/')
+                    self.assets[name] = StaticAsset.from_file(name, path, memory_limit)
+        self.index = self.assets.get('index.html')
+        self.demo = StaticAsset('demo.html', DEMO_PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def lookup(self, path):
+        """Arquivo pedido, index.html do SPA ou a página de demonstração"""
+        return self.assets.get(path) or self.index or self.demo
+
+# Construído no primeiro acesso ao frontend, fora da partida a frio da API
+asset_manifest = None
+
+def get_asset_manifest():
+    global asset_manifest
+    if asset_manifest is None:
+        asset_manifest = AssetManifest(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'),
+                                       app.config['STATIC_MEMORY_LIMIT'])
+    return asset_manifest
+
+# Rota para servir frontend (se existir)
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>')
+def serve_frontend(path):
+    """Serve o frontend React ou página de demonstração, sem acessar o disco por requisição"""
+    return get_asset_manifest().lookup(path).response()
+
 if __name__ == '__main__':
     # Inicializar banco de dados
     init_db()
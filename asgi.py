@@ -0,0 +1,216 @@
+"""
+Entrada ASGI do ContentFlow AI
+
+Expõe as mesmas rotas do app Flask para servidores ASGI (uvicorn, hypercorn):
+
+    pip install uvicorn
+    uvicorn asgi:app --workers 4
+    # ou com o gunicorn.conf.py (migrações no master, métricas dos workers)
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn asgi:app
+
+Conexões ficam no event loop; toda requisição (inclusive health e info, que
+também tocam o app Flask e seus hooks) roda em um pool limitado de
+ASGI_THREADS threads, e no máximo ASGI_MAX_PENDING requisições aguardam uma
+thread antes de receberem 503. Em respostas em streaming (SSE, export)
+a mesma thread que atendeu a requisição produz os pedaços, porque o contexto da
+requisição do Flask fica preso a ela; o loop só os repassa ao cliente.
+"""
+
+import os
+import io
+import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 32))
+ASGI_MAX_PENDING = int(os.getenv('ASGI_MAX_PENDING', 1000))
+
+OVERLOADED_BODY = b'{"error":"Servidor sobrecarregado, tente novamente"}\n'
+
+def build_environ(scope, body):
+    """Ambiente WSGI (PEP 3333) a partir do scope HTTP do ASGI"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body))
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class WSGIRequest:
+    """Uma requisição WSGI executada em uma única thread
+
+    `started` recebe (status, headers, corpo); o corpo é None em streaming,
+    quando os pedaços chegam por `chunks` (None marca o fim).
+    """
+
+    def __init__(self, environ, loop):
+        self.environ = environ
+        self.loop = loop
+        self.status = 500
+        self.headers = []
+        self.started = loop.create_future()
+        self.chunks = asyncio.Queue(maxsize=8)
+        self.disconnected = threading.Event()
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = headers
+
+    def _resolve(self, body):
+        result = (self.status, self.headers, body)
+        self.loop.call_soon_threadsafe(
+            lambda: self.started.done() or self.started.set_result(result))
+
+    def _put(self, chunk):
+        asyncio.run_coroutine_threadsafe(self.chunks.put(chunk), self.loop).result()
+
+    def run(self):
+        streaming = False
+        try:
+            iterable = flask_app(self.environ, self.start_response)
+            try:
+                # Com Content-Length o corpo já está pronto: lê tudo de uma vez
+                if any(name.lower() == 'content-length' for name, _ in self.headers):
+                    self._resolve(b''.join(iterable))
+                    return
+                streaming = True
+                self._resolve(None)
+                for chunk in iterable:
+                    if self.disconnected.is_set():
+                        break
+                    if chunk:
+                        self._put(chunk)
+            finally:
+                close = getattr(iterable, 'close', None)
+                if close is not None:
+                    close()
+        except Exception as e:
+            self.loop.call_soon_threadsafe(
+                lambda: self.started.done() or self.started.set_exception(e))
+        finally:
+            if streaming:
+                self._put(None)
+
+class ASGIApp:
+    """Adaptador ASGI do app Flask com executor e fila limitados"""
+
+    def __init__(self, threads=ASGI_THREADS, max_pending=ASGI_MAX_PENDING):
+        self.threads = threads
+        self.max_pending = max_pending
+        self.executor = None
+        self.pending = 0
+
+    def ensure_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.ensure_executor()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        loop = asyncio.get_running_loop()
+        wsgi = WSGIRequest(build_environ(scope, b''.join(chunks)), loop)
+
+        if self.pending >= self.max_pending:
+            await self.send_start(send, 503, [('Content-Type', 'application/json'), ('Retry-After', '1')])
+            await send({'type': 'http.response.body', 'body': OVERLOADED_BODY})
+            return
+
+        self.pending += 1
+        try:
+            worker = loop.run_in_executor(self.ensure_executor(), wsgi.run)
+            status, headers, body = await wsgi.started
+        finally:
+            self.pending -= 1
+        await self.send_start(send, status, headers)
+        if body is not None:
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        # Streaming: repassa os pedaços e avisa a thread se o cliente desconectar
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            wsgi.disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            while True:
+                chunk = await wsgi.chunks.get()
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            wsgi.disconnected.set()
+        finally:
+            watcher.cancel()
+            # Esvazia a fila até a thread terminar, para ela não ficar bloqueada
+            while not worker.done():
+                while not wsgi.chunks.empty():
+                    wsgi.chunks.get_nowait()
+                await asyncio.sleep(0.01)
+
+    @staticmethod
+    async def send_start(send, status, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers]
+        })
+
+app = ASGIApp()
@@ -0,0 +1,996 @@
+#!/usr/bin/env python3
+"""
+Benchmarks do ContentFlow AI (executados em processo com o test client do Flask)
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import timeit
+import json
+import threading
+import tracemalloc
+import random
+import inspect
+import shutil
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import app as contentflow
+
+def setup_database(directory, **config):
+    """Cria um banco limpo em um diretório temporário e aplica as configurações"""
+    contentflow.app.config['DATABASE'] = os.path.join(directory, 'bench.db')
+    # Os benchmarks medem capacidade; o rate limit é medido à parte (admission)
+    contentflow.app.config['RATE_LIMIT_ENABLED'] = False
+    contentflow.app.config.update(config)
+    contentflow._pools.clear()
+    contentflow.init_db()
+    return contentflow.app.test_client()
+
+def create_user(client, username='bench_user'):
+    """Registra um usuário sem limite mensal e retorna o token"""
+    response = client.post('/api/auth/register', json={
+        'username': username,
+        'email': f'{username}@contentflow.ai',
+        'password': '12345678'
+    })
+    token = response.get_json()['token']
+    conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+    conn.execute('UPDATE users SET usage_limit = -1 WHERE username = ?', (username,))
+    conn.commit()
+    conn.close()
+    return {'Authorization': f'Bearer {token}'}
+
+def measure(label, func, iterations):
+    """Executa func N vezes e imprime requisições por segundo"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    rps = iterations / elapsed
+    print(f"  {label:<32} {rps:>10.1f} req/s")
+    return rps
+
+def bench_pool(iterations):
+    """Compara conexão por requisição (DB_POOL_SIZE=0) com o pool"""
+    print("🔌 Pool de conexões SQLite")
+    results = {}
+    for pool_size in (0, 8):
+        print(f" DB_POOL_SIZE={pool_size}")
+        with tempfile.TemporaryDirectory() as directory:
+            client = setup_database(directory, DB_POOL_SIZE=pool_size)
+            headers = create_user(client)
+            payload = {'topic': 'Produtividade', 'platform': 'instagram', 'tone': 'casual'}
+            results[pool_size] = (
+                measure('generate/caption', lambda: client.post(
+                    '/api/content/generate/caption', json=payload, headers=headers), iterations),
+                measure('history', lambda: client.get(
+                    '/api/content/history', headers=headers), iterations)
+            )
+    print(f"  Ganho generate: {results[8][0] / results[0][0]:.2f}x | "
+          f"history: {results[8][1] / results[0][1]:.2f}x")
+    print()
+
+def seed_content(rows):
+    """Insere linhas de histórico diretamente no banco para o primeiro usuário"""
+    conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+    conn.executemany('''
+        INSERT INTO content (user_id, content_type, prompt, generated_text, platform, tone, created_at)
+        VALUES (1, ?, ?, ?, 'instagram', 'casual', datetime('now', ?))
+    ''', ((('caption', 'ideas', 'hashtags', 'script')[i % 4], f'Prompt {i}', f'Texto gerado {i}',
+           f'-{rows - i} seconds') for i in range(rows)))
+    contentflow.repair_user_stats(conn, commit=False)
+    conn.commit()
+    conn.close()
+
+def bench_history(iterations, rows=20000):
+    """Compara páginas profundas por OFFSET com paginação por cursor"""
+    print(f"📚 Histórico com {rows} linhas")
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        seed_content(rows)
+        per_page = 10
+        last_page = rows // per_page
+        conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+        created_at, content_id = conn.execute(
+            'SELECT created_at, id FROM content WHERE user_id = 1 '
+            'ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?',
+            ((last_page - 1) * per_page - 1,)).fetchone()
+        conn.close()
+        deep_cursor = contentflow.encode_cursor(created_at, content_id)
+        measure('primeira página (page=1)', lambda: client.get(
+            '/api/content/history?page=1', headers=headers), iterations)
+        offset_rps = measure(f'página profunda (page={last_page})', lambda: client.get(
+            f'/api/content/history?page={last_page}', headers=headers), iterations)
+        cursor_rps = measure('página profunda (after=cursor)', lambda: client.get(
+            f'/api/content/history?after={deep_cursor}', headers=headers), iterations)
+        measure('primeira página por tipo (cursor)', lambda: client.get(
+            '/api/content/history?after=&type=script', headers=headers), iterations)
+    print(f"  Ganho cursor vs OFFSET: {cursor_rps / offset_rps:.2f}x")
+    print()
+
+def bench_batch(iterations, batch_size=20):
+    """Compara N chamadas individuais com um único lote de N itens"""
+    print(f"📦 Lote de {batch_size} itens")
+    items = [
+        {'type': ('caption', 'ideas', 'hashtags', 'script')[i % 4],
+         'topic': f'Tema {i}', 'keywords': f'Tema {i}', 'content': f'tema{i}, dicas'}
+        for i in range(batch_size)
+    ]
+    rounds = max(iterations // batch_size, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+
+        def individual():
+            for item in items:
+                client.post(f"/api/content/generate/{item['type']}", json=item, headers=headers)
+
+        single_rps = measure(f'{batch_size} chamadas individuais (lotes/s)', individual, rounds)
+        batch_rps = measure('1 chamada em lote (lotes/s)', lambda: client.post(
+            '/api/content/generate/batch', json={'items': items}, headers=headers), rounds)
+    print(f"  Ganho do lote: {batch_rps / single_rps:.2f}x")
+    print()
+
+# Implementação anterior ao registro de templates, mantida como referência
+def legacy_generate_ai_content(content_type, prompt, platform='instagram', tone='casual'):
+    """Versão que reconstrói todos os templates a cada chamada"""
+    
+    if content_type == 'caption':
+        templates = {
+            'casual': f"🚀 {prompt} ✨\n\nVocê sabia que isso pode transformar completamente sua rotina? Aqui estão algumas dicas incríveis:\n\n📝 Primeira dica importante\n💡 Segunda dica valiosa\n🎯 Terceira dica essencial\n\nO que você achou? Comenta aqui embaixo! 👇\n\n#ContentFlow #DicasIncriveis #Transformacao",
+            'professional': f"📊 {prompt}\n\nEm um mercado cada vez mais competitivo, é fundamental estar atualizado com as melhores práticas. Nosso estudo mostra que:\n\n• 85% dos profissionais que aplicam essas técnicas veem resultados\n• Aumento médio de 40% na produtividade\n• ROI positivo em até 30 dias\n\nSaiba mais nos comentários.\n\n#Profissional #Resultados #Estrategia",
+            'funny': f"😂 {prompt} 🤣\n\nGente, vocês não vão acreditar no que aconteceu! Era uma vez...\n\n🎭 Plot twist número 1\n🎪 Momento épico\n🎨 Final inesperado\n\nQuem mais já passou por isso? Marca aquele amigo que precisa ver! 😅\n\n#Humor #Engracado #VidaReal"
+        }
+        return templates.get(tone, templates['casual'])
+    
+    elif content_type == 'ideas':
+        ideas = [
+            {
+                'title': f'Tutorial sobre {prompt}',
+                'description': f'Crie um passo a passo completo sobre {prompt} para iniciantes',
+                'format': 'Vídeo tutorial'
+            },
+            {
+                'title': f'Mitos e verdades sobre {prompt}',
+                'description': f'Desmistifique conceitos errados relacionados a {prompt}',
+                'format': 'Carrossel informativo'
+            },
+            {
+                'title': f'Antes e depois: {prompt}',
+                'description': f'Mostre transformações reais relacionadas a {prompt}',
+                'format': 'Post comparativo'
+            },
+            {
+                'title': f'5 erros comuns em {prompt}',
+                'description': f'Liste os principais erros que pessoas cometem com {prompt}',
+                'format': 'Lista educativa'
+            },
+            {
+                'title': f'Tendências 2024 em {prompt}',
+                'description': f'Apresente as principais tendências e novidades em {prompt}',
+                'format': 'Post informativo'
+            }
+        ]
+        return ideas
+    
+    elif content_type == 'hashtags':
+        base_hashtags = prompt.lower().replace(' ', '').split(',')
+        hashtags = []
+        
+        # Hashtags específicas do prompt
+        for tag in base_hashtags[:3]:
+            hashtags.extend([
+                tag.strip(),
+                f'{tag.strip()}2024',
+                f'{tag.strip()}Brasil'
+            ])
+        
+        # Hashtags gerais por plataforma
+        platform_hashtags = {
+            'instagram': ['insta', 'instagram', 'reels', 'stories', 'igers'],
+            'tiktok': ['tiktok', 'fyp', 'viral', 'trending', 'foryou'],
+            'youtube': ['youtube', 'shorts', 'subscribe', 'youtuber', 'video'],
+            'linkedin': ['linkedin', 'professional', 'career', 'business', 'networking']
+        }
+        
+        hashtags.extend(platform_hashtags.get(platform, platform_hashtags['instagram']))
+        
+        # Hashtags populares gerais
+        hashtags.extend([
+            'brasil', 'dicas', 'motivacao', 'inspiracao', 'sucesso',
+            'lifestyle', 'qualidade', 'inovacao', 'criatividade', 'foco'
+        ])
+        
+        return list(set(hashtags))[:20]  # Remove duplicatas e limita a 20
+    
+    elif content_type == 'script':
+        return {
+            'hook': f'Você sabia que {prompt} pode mudar sua vida em 30 dias?',
+            'development': f'Hoje vou te mostrar exatamente como {prompt} funciona na prática. Primeiro, você precisa entender que... [desenvolvimento do conteúdo sobre {prompt}]',
+            'cta': 'Se esse conteúdo te ajudou, salva o post e compartilha com quem precisa ver!',
+            'visual_suggestions': [
+                'Texto na tela com estatísticas',
+                'Transições dinâmicas',
+                'Close-up para momentos importantes',
+                'Música de fundo energética'
+            ]
+        }
+    
+    return "Conteúdo gerado com sucesso!"
+
+def bench_templates(iterations):
+    """Custo por chamada da geração: implementação anterior vs registro de templates"""
+    print("🧩 Registro de templates (µs por chamada, incluindo serialização)")
+    cases = [
+        ('caption', 'Dicas de produtividade', 'instagram', 'professional'),
+        ('ideas', 'produtividade, trabalho remoto', 'instagram', 'casual'),
+        ('hashtags', 'produtividade, trabalho remoto', 'tiktok', 'casual'),
+        ('script', 'Dicas de produtividade', 'instagram', 'casual'),
+    ]
+    number = iterations * 20
+
+    def legacy(args):
+        generated = legacy_generate_ai_content(*args)
+        return json.dumps(generated) if isinstance(generated, (dict, list)) else generated
+
+    # Hashtags consultam o índice aprendido: usa um banco temporário (vazio)
+    with tempfile.TemporaryDirectory() as directory:
+        setup_database(directory)
+        for args in cases:
+            before = timeit.timeit(lambda: legacy(args), number=number) / number * 1e6
+            after = timeit.timeit(lambda: contentflow.render_template(*args).serialized,
+                                  number=number) / number * 1e6
+            print(f"  {args[0]:<10} antes {before:>7.2f} µs | depois {after:>7.2f} µs | {before / after:.2f}x")
+    print()
+
+def bench_cache(iterations, distinct_prompts=20):
+    """Geração com e sem cache e espaço economizado pelos blobs deduplicados"""
+    print(f"🗃️  Cache de geração ({distinct_prompts} prompts distintos)")
+    cache = contentflow.generation_cache
+    cache_size = cache.maxsize
+    results = {}
+    for size in (0, cache_size):
+        cache.maxsize = size
+        cache.clear()
+        cache.hits = cache.misses = cache.evictions = 0
+        with tempfile.TemporaryDirectory() as directory:
+            client = setup_database(directory)
+            headers = create_user(client)
+            counter = iter(range(10 ** 9))
+
+            def generate():
+                i = next(counter)
+                content_type = ('caption', 'ideas', 'script')[i % 3]
+                client.post(f'/api/content/generate/{content_type}', headers=headers,
+                            json={'topic': f'Tema {i % distinct_prompts}',
+                                  'keywords': f'Tema {i % distinct_prompts}'})
+
+            results[size] = measure(f'generate (cache={size})', generate, iterations)
+            conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+            stored, inline = conn.execute('''
+                SELECT (SELECT SUM(LENGTH(body)) FROM content_blobs),
+                       SUM(LENGTH(b.body))
+                FROM content c JOIN content_blobs b ON b.hash = c.blob_hash
+            ''').fetchone()
+            conn.close()
+        print(f"  {cache.stats()}")
+    cache.maxsize = cache_size
+    print(f"  Ganho do cache: {results[cache_size] / results[0]:.2f}x")
+    print(f"  Corpos armazenados: {stored} bytes (seriam {inline} bytes sem deduplicação)")
+    print()
+
+def bench_provider(iterations, threads=16, latency=0.05):
+    """Vazão contra o provedor fake com latência, com e sem prompts repetidos"""
+    print(f"🤖 Provedor fake ({latency * 1000:.0f} ms, {threads} threads)")
+    app_config = contentflow.app.config
+    previous = {key: app_config[key] for key in ('AI_PROVIDER', 'FAKE_PROVIDER_LATENCY')}
+    cache_size = contentflow.generation_cache.maxsize
+    contentflow.generation_cache.maxsize = 0
+    app_config.update(AI_PROVIDER='fake', FAKE_PROVIDER_LATENCY=latency)
+    requests_per_thread = max(iterations // threads, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        setup_database(directory)
+        headers = create_user(contentflow.app.test_client())
+        for label, distinct in (('prompts distintos', None), ('prompts repetidos', 4)):
+            contentflow._gateway = None
+
+            def worker(thread_id):
+                client = contentflow.app.test_client()
+                for i in range(requests_per_thread):
+                    topic = f'Tema {thread_id}-{i}' if distinct is None else f'Tema {i % distinct}'
+                    client.post('/api/content/generate/caption', json={'topic': topic}, headers=headers)
+
+            workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<32} {threads * requests_per_thread / elapsed:>10.1f} req/s")
+            print(f"  {contentflow.get_provider_gateway().stats()}")
+    app_config.update(previous)
+    contentflow._gateway = None
+    contentflow.generation_cache.maxsize = cache_size
+    print()
+
+def bench_stream(iterations, latency=0.2):
+    """Tempo até o primeiro byte com e sem streaming, contra o provedor fake"""
+    print(f"📡 Streaming de roteiro (provedor fake, {latency * 1000:.0f} ms)")
+    app_config = contentflow.app.config
+    previous = {key: app_config[key] for key in ('AI_PROVIDER', 'FAKE_PROVIDER_LATENCY')}
+    cache_size = contentflow.generation_cache.maxsize
+    contentflow.generation_cache.maxsize = 0
+    app_config.update(AI_PROVIDER='fake', FAKE_PROVIDER_LATENCY=latency)
+    contentflow._gateway = None
+    rounds = max(iterations // 50, 3)
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        full, first_byte, complete = [], [], []
+        for i in range(rounds):
+            start = time.perf_counter()
+            client.post('/api/content/generate/script', json={'topic': f'Tema {i}'}, headers=headers)
+            full.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            response = client.post('/api/content/generate/script?stream=1', json={'topic': f'Tema {i}'},
+                                   headers=headers, buffered=False)
+            first_byte.append(time.perf_counter() - start)
+            response.get_data()
+            complete.append(time.perf_counter() - start)
+    app_config.update(previous)
+    contentflow._gateway = None
+    contentflow.generation_cache.maxsize = cache_size
+    average = lambda values: sum(values) / len(values) * 1000
+    print(f"  {'sem streaming (resposta completa)':<36} {average(full):>8.1f} ms")
+    print(f"  {'streaming (primeiro byte)':<36} {average(first_byte):>8.1f} ms")
+    print(f"  {'streaming (stream completo)':<36} {average(complete):>8.1f} ms")
+    print()
+
+def bench_auth(iterations, threads=8, rounds=10, duration=3.0):
+    """Rajada de logins concorrentes e seu efeito sobre a geração"""
+    print(f"🔐 Rajada de login ({threads} threads, bcrypt custo {rounds}, {duration:.0f} s)")
+    app_config = contentflow.app.config
+    previous = {key: app_config[key] for key in ('BCRYPT_ROUNDS', 'BCRYPT_WORKERS', 'BCRYPT_MAX_PENDING')}
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory, BCRYPT_ROUNDS=rounds)
+        contentflow._hasher = None
+        headers = create_user(client)
+        for workers, max_pending in ((threads, threads), (1, 2)):
+            app_config.update(BCRYPT_WORKERS=workers, BCRYPT_MAX_PENDING=max_pending)
+            contentflow._hasher = None
+            stop = threading.Event()
+            statuses = []
+
+            def login_worker():
+                login_client = contentflow.app.test_client()
+                while not stop.is_set():
+                    statuses.append(login_client.post('/api/auth/login', json={
+                        'username': 'bench_user', 'password': '12345678'}).status_code)
+
+            workers_threads = [threading.Thread(target=login_worker) for _ in range(threads)]
+            for thread in workers_threads:
+                thread.start()
+            generated = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                client.post('/api/content/generate/caption', json={'topic': 'Tema'}, headers=headers)
+                generated += 1
+            stop.set()
+            for thread in workers_threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            print(f"  BCRYPT_WORKERS={workers} BCRYPT_MAX_PENDING={max_pending}")
+            print(f"    logins aceitos {statuses.count(200) / elapsed:>8.1f}/s | "
+                  f"503 {statuses.count(503) / elapsed:>8.1f}/s | "
+                  f"generate durante a rajada {generated / elapsed:>8.1f} req/s")
+    app_config.update(previous)
+    contentflow._hasher = None
+    print()
+
+def bench_token(iterations):
+    """Rotas autenticadas com e sem cache de tokens verificados"""
+    print("🎟️  Cache de tokens")
+    cache = contentflow.token_cache
+    cache_size = cache.maxsize
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        for size in (0, cache_size):
+            cache.maxsize = size
+            cache.clear()
+            cache.hits = cache.misses = 0
+            results[size] = measure(f'profile (cache={size})', lambda: client.get(
+                '/api/user/profile', headers=headers), iterations)
+            print(f"  {cache.stats()}")
+    cache.maxsize = cache_size
+    print(f"  Ganho do cache: {results[cache_size] / results[0]:.2f}x")
+    print()
+
+def bench_quota(iterations, threads=8, usage_limit=50):
+    """Cota sob concorrência: nenhum uso além do limite e vazão da reserva atômica"""
+    print(f"📏 Cota mensal ({threads} threads, limite {usage_limit})")
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+        conn.execute('UPDATE users SET usage_limit = ?', (usage_limit,))
+        conn.commit()
+        statuses = []
+
+        def worker():
+            worker_client = contentflow.app.test_client()
+            for _ in range(usage_limit // threads * 2 + 1):
+                statuses.append(worker_client.post('/api/content/generate/ideas',
+                                                   json={'keywords': 'Tema'}, headers=headers).status_code)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        usage, rows = conn.execute(
+            'SELECT monthly_usage, (SELECT COUNT(*) FROM content) FROM users').fetchone()
+        overshoot = max(statuses.count(200), usage, rows) - usage_limit
+        print(f"  200: {statuses.count(200)} | 403: {statuses.count(403)} | "
+              f"monthly_usage: {usage} | linhas: {rows} | "
+              f"{'✅ sem estouro' if overshoot <= 0 else f'❌ estouro de {overshoot}'}")
+
+        conn.execute('UPDATE users SET usage_limit = -1, monthly_usage = 0')
+        conn.commit()
+        conn.close()
+        measure('generate (reserva atômica)', lambda: client.post(
+            '/api/content/generate/ideas', json={'keywords': 'Tema'}, headers=headers), iterations)
+        pooled = contentflow.get_pool().acquire()
+        measure('reserve_quota isolado', lambda: contentflow.reserve_quota(pooled, 1), iterations)
+        contentflow.get_pool().release(pooled)
+    print()
+
+def bench_write_behind(iterations):
+    """Geração com gravação síncrona e com a fila de write-behind"""
+    print("✍️  Gravação do histórico (CONTENT_WRITE_MODE)")
+    previous = contentflow.app.config['CONTENT_WRITE_MODE']
+    results = {}
+    for mode in ('sync', 'batched'):
+        with tempfile.TemporaryDirectory() as directory:
+            client = setup_database(directory, CONTENT_WRITE_MODE=mode)
+            headers = create_user(client)
+            counter = iter(range(10 ** 9))
+            results[mode] = measure(f'generate ({mode})', lambda: client.post(
+                '/api/content/generate/caption', json={'topic': f'Tema {next(counter)}'},
+                headers=headers), iterations)
+            if mode == 'batched':
+                writer = contentflow.get_content_writer()
+                start = time.perf_counter()
+                writer.flush()
+                print(f"  flush final: {(time.perf_counter() - start) * 1000:.1f} ms | {writer.stats()}")
+                writer.stop()
+                contentflow._writer = None
+    contentflow.app.config['CONTENT_WRITE_MODE'] = previous
+    print(f"  Ganho do write-behind: {results['batched'] / results['sync']:.2f}x")
+    print()
+
+def bench_export(iterations, sizes=(10000, 100000)):
+    """Vazão e pico de memória da exportação em streaming para históricos crescentes"""
+    print("📤 Exportação do histórico")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            client = setup_database(directory)
+            headers = create_user(client)
+            seed_content(rows)
+            for export_format in ('ndjson', 'csv'):
+                tracemalloc.start()
+                start = time.perf_counter()
+                response = client.get(f'/api/content/export?format={export_format}',
+                                      headers=headers, buffered=False)
+                size = sum(len(chunk) for chunk in response.response)
+                response.close()
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"  {rows:>7} linhas {export_format:<6} {rows / elapsed:>10.0f} linhas/s | "
+                      f"{size / 1e6:>6.1f} MB | pico de memória {peak / 1e6:.2f} MB")
+    print()
+
+SEARCH_WORDS = (
+    'produtividade', 'receitas', 'treino', 'viagem', 'marketing', 'finanças', 'moda', 'beleza',
+    'tecnologia', 'educação', 'carreira', 'saúde', 'yoga', 'café', 'música', 'fotografia',
+    'empreendedorismo', 'vendas', 'jardinagem', 'pets', 'decoração', 'leitura', 'cinema', 'games'
+)
+
+# Vocabulário sintético para que cada termo apareça em uma fração pequena das linhas
+SEARCH_VOCABULARY = SEARCH_WORDS + tuple(f'{word}{n}' for word in SEARCH_WORDS for n in range(200))
+
+def bench_search(iterations, rows=1000000, users=10):
+    """Latência da busca FTS5 comparada com LIKE em prompt e texto gerado"""
+    print(f"🔎 Busca textual ({rows} linhas, {users} usuários)")
+    generator = random.Random(42)
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+        start = time.perf_counter()
+        conn.executemany(
+            'INSERT INTO content (user_id, content_type, prompt, generated_text) VALUES (?, ?, ?, ?)',
+            ((i % users + 1, 'caption',
+              ' '.join(generator.sample(SEARCH_VOCABULARY, 3)),
+              ' '.join(generator.sample(SEARCH_VOCABULARY, 8)) + f' post {i}')
+             for i in range(rows)))
+        conn.commit()
+        print(f"  carga com triggers: {time.perf_counter() - start:.1f} s")
+        rounds = max(iterations // 50, 5)
+        for term in ('yoga', 'café receitas'):
+            like_sql = 'SELECT id FROM content WHERE user_id = 1' + ''.join(
+                ' AND (prompt LIKE ? OR generated_text LIKE ?)' for _ in term.split())
+            like_params = [value for word in term.split() for value in (f'%{word}%',) * 2]
+            start = time.perf_counter()
+            for _ in range(rounds):
+                conn.execute(like_sql + ' ORDER BY created_at DESC LIMIT 10', like_params).fetchall()
+                conn.execute(like_sql.replace('SELECT id', 'SELECT COUNT(*)'), like_params).fetchone()
+            like_ms = (time.perf_counter() - start) / rounds * 1000
+            start = time.perf_counter()
+            for _ in range(rounds):
+                client.get(f'/api/content/search?q={term}', headers=headers)
+            fts_ms = (time.perf_counter() - start) / rounds * 1000
+            print(f"  '{term}': LIKE {like_ms:>8.1f} ms | FTS5 (rota completa) {fts_ms:>8.1f} ms | "
+                  f"{like_ms / fts_ms:.1f}x")
+        conn.close()
+    print()
+
+def hashtag_vocabulary(size, generator):
+    """Tags sintéticas com popularidade decrescente (distribuição de Zipf)"""
+    stems = ['fit', 'treino', 'receita', 'viagem', 'moda', 'pet', 'tech', 'music', 'arte', 'foto']
+    tags = [f'{generator.choice(stems)}{i}' for i in range(size)]
+    return tags, [1 / (rank + 1) for rank in range(size)]
+
+def bench_hashtags(iterations, rows=200000, vocabulary=5000):
+    """Índice de hashtags: carga, atualização incremental e latência das sugestões"""
+    print(f"#️⃣  Índice de hashtags ({rows} posts, {vocabulary} tags)")
+    generator = random.Random(42)
+    tags, weights = hashtag_vocabulary(vocabulary, generator)
+    platforms = contentflow.PLATFORMS
+
+    def post():
+        # Pedido de hashtags com as tags do usuário ('tag1, tag2, ...')
+        return ', '.join(dict.fromkeys(generator.choices(tags, weights, k=12)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        create_user(client)
+        conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+        prompts = [post() for _ in range(rows)]
+        bodies = [json.dumps(prompt.split(', ')) for prompt in prompts]
+        conn.executemany('INSERT OR IGNORE INTO content_blobs (hash, body) VALUES (?, ?)',
+                         ((contentflow.content_digest(body), body) for body in bodies))
+        conn.executemany('''
+            INSERT INTO content (user_id, content_type, prompt, blob_hash, platform, tone)
+            VALUES (1, 'hashtags', ?, ?, ?, 'casual')
+        ''', ((prompt, contentflow.content_digest(body), platforms[i % len(platforms)])
+              for i, (prompt, body) in enumerate(zip(prompts, bodies))))
+        conn.commit()
+
+        start = time.perf_counter()
+        indexed_tags, pairs = contentflow.rebuild_hashtag_index(conn)
+        print(f"  rebuild: {time.perf_counter() - start:.1f} s ({indexed_tags} tags, {pairs} pares)")
+
+        index = contentflow.get_hashtag_index()
+        tracemalloc.start()
+        start = time.perf_counter()
+        trie = index.trie('instagram')
+        load_ms = (time.perf_counter() - start) * 1000
+        memory = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+        print(f"  carga da trie (instagram): {load_ms:.1f} ms, {len(trie)} tags, {memory:.1f} MiB")
+
+        # Gravação incremental: custo por post com e sem o índice
+        pool = contentflow.get_pool()
+        writer_conn = pool.acquire()
+        for enabled in (False, True):
+            contentflow.app.config['HASHTAG_INDEX_ENABLED'] = enabled
+            entries = []
+            for _ in range(iterations):
+                prompt = post()
+                body = json.dumps(prompt.split(', '))
+                digest = contentflow.content_digest(body)
+                entries.append((1, [('hashtags', prompt, digest, generator.choice(platforms), 'casual')],
+                                [(digest, body)]))
+            start = time.perf_counter()
+            for entry in entries:
+                contentflow.write_content(writer_conn, [entry])
+            per_post = (time.perf_counter() - start) / iterations * 1e6
+            print(f"  gravação por post, índice {'ligado   ' if enabled else 'desligado'}: {per_post:>8.1f} µs")
+        # Pares acumulados, montados e gravados em lote fora da requisição
+        pairs = index.pairs_flushed
+        start = time.perf_counter()
+        index.flush()
+        flush_ms = (time.perf_counter() - start) * 1000
+        pairs = index.pairs_flushed - pairs
+        print(f"  gravação em lote dos pares: {pairs} em {flush_ms:.0f} ms "
+              f"({flush_ms * 1000 / max(pairs, 1):.1f} µs por par)")
+        pool.release(writer_conn)
+
+        # Sugestões: render do template, sem o cache de geração (o das consultas
+        # ao índice fica ligado, como em produção)
+        prompts = [', '.join(generator.choices(tags, weights, k=3)) for _ in range(iterations)]
+        for enabled in (False, True):
+            contentflow.app.config['HASHTAG_INDEX_ENABLED'] = enabled
+            samples = []
+            for prompt in prompts:
+                start = time.perf_counter()
+                contentflow.render_template('hashtags', prompt, 'instagram')
+                samples.append((time.perf_counter() - start) * 1e6)
+            samples.sort()
+            print(f"  sugestão, índice {'ligado   ' if enabled else 'desligado'}: "
+                  f"p50 {samples[len(samples) // 2]:>7.1f} µs | p99 {samples[int(len(samples) * 0.99)]:>7.1f} µs")
+        prefixes = [tag[:generator.randint(1, len(tag))] for tag in generator.choices(tags, k=iterations)]
+        complete = timeit.timeit(lambda: [trie.complete(prefix) for prefix in prefixes],
+                                 number=20) / (iterations * 20) * 1e6
+        print(f"  complemento de prefixo na trie: {complete:.2f} µs")
+        sample = contentflow.render_template('hashtags', tags[0], 'instagram').native
+        print(f"  exemplo ('{tags[0]}'): {' '.join('#' + tag for tag in sample[:8])} ...")
+        conn.close()
+    print()
+
+def bench_static(iterations):
+    """Frontend servido do manifesto em memória: corpo completo, gzip e 304"""
+    print("🗂️  Arquivos estáticos (index.html do frontend via fallback do SPA)")
+    previous = contentflow.asset_manifest
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'), directory)
+        contentflow.asset_manifest = contentflow.AssetManifest(directory)
+        client = contentflow.app.test_client()
+        plain = client.get('/dashboard')
+        compressed = client.get('/dashboard', headers={'Accept-Encoding': 'gzip'})
+        print(f"  tamanho: {len(plain.data)} bytes | gzip: {len(compressed.data)} bytes")
+        measure('GET /dashboard', lambda: client.get('/dashboard'), iterations)
+        measure('GET /dashboard (gzip)', lambda: client.get(
+            '/dashboard', headers={'Accept-Encoding': 'gzip'}), iterations)
+        measure('GET /dashboard (304)', lambda: client.get(
+            '/dashboard', headers={'If-None-Match': plain.headers['ETag']}), iterations)
+    contentflow.asset_manifest = previous
+    print()
+
+def bench_json(iterations, rows=1000):
+    """Histórico de roteiros com JSON embutido (raw) vs string, e /api/info pré-serializado"""
+    print(f"🧾 Serialização JSON (orjson: {'sim' if contentflow.orjson else 'não'})")
+    script = json.dumps(contentflow.render_template('script', 'Rotina de treino em casa'))
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+        conn.executemany('''
+            INSERT INTO content (user_id, content_type, prompt, generated_text, platform, tone)
+            VALUES (1, 'script', ?, ?, 'tiktok', 'casual')
+        ''', ((f'Prompt {i}', script) for i in range(rows)))
+        conn.commit()
+        conn.close()
+        url = '/api/content/history?after=&per_page=50&type=script'
+        for encoder in ('stdlib', 'auto'):
+            contentflow.app.json.use_orjson = encoder == 'auto' and contentflow.orjson is not None
+            measure(f'{encoder}: histórico (string)', lambda: client.get(url, headers=headers), iterations)
+            measure(f'{encoder}: histórico (?raw=1)', lambda: client.get(
+                url + '&raw=1', headers=headers), iterations)
+        contentflow.app.json.use_orjson = contentflow.orjson is not None
+        measure('GET /api/info (pré-serializado)', lambda: client.get('/api/info'), iterations)
+    print()
+
+def bench_metrics(iterations):
+    """Custo da instrumentação (rotas e SQL) e de uma leitura de /api/metrics"""
+    print("📈 Métricas")
+    with tempfile.TemporaryDirectory() as directory:
+        contentflow.app.config['METRICS_DIR'] = os.path.join(directory, 'metrics')
+        contentflow._metrics = None
+        for enabled in (False, True):
+            contentflow.app.config['METRICS_ENABLED'] = enabled
+            client = setup_database(directory)
+            headers = create_user(client, f'bench_{enabled}')
+            label = 'com métricas' if enabled else 'sem métricas'
+            measure(f'{label}: geração', lambda: client.post(
+                '/api/content/generate/caption', json={'topic': 'Treino'}, headers=headers), iterations)
+            measure(f'{label}: perfil', lambda: client.get('/api/user/profile', headers=headers), iterations)
+        measure('GET /api/metrics', lambda: client.get('/api/metrics'), max(iterations // 10, 1))
+    contentflow.app.config['METRICS_DIR'] = ''
+    contentflow._metrics = None
+    print()
+
+def shard_write_worker(user_ids, duration):
+    """Processo de escrita: reserva de cota + INSERT do conteúdo, como em /generate"""
+    generated = contentflow.render_template('caption', 'Rotina de treino', 'instagram', 'casual')
+    row, blob = contentflow.content_rows('caption', {'topic': 'Rotina de treino'}, generated)
+    writes = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        user_id = user_ids[writes % len(user_ids)]
+        shard = contentflow.shard_for(user_id)
+        pool = contentflow.get_pool(shard)
+        conn = pool.acquire()
+        try:
+            contentflow.reserve_quota(conn, user_id)
+            contentflow.write_content(conn, [(user_id, [row], [blob])], shard)
+        finally:
+            pool.release(conn)
+        writes += 1
+    return writes
+
+def bench_shards(iterations, processes=None, duration=3.0, users=64):
+    """Vazão de escrita com N processos (como workers do gunicorn) e 1..N shards"""
+    # Como os workers do gunicorn, pode haver mais processos que núcleos
+    processes = processes or min(max(os.cpu_count() or 1, 4), 8)
+    shard_counts = sorted({1, 2, 4, processes})
+    print(f"🧱 Shards: escrita com {processes} processo(s) por {duration:.0f} s "
+          f"(núcleos: {os.cpu_count()})")
+    context = multiprocessing.get_context('fork')
+    app_config = contentflow.app.config
+    previous = {key: app_config[key] for key in ('SHARD_COUNT', 'BCRYPT_ROUNDS',
+                                                 'HASHTAG_INDEX_ENABLED', 'SLOW_QUERY_MS')}
+    baseline = None
+    for shards in shard_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            # Só o caminho de escrita: sem o índice de hashtags, medido à parte (hashtags)
+            client = setup_database(directory, SHARD_COUNT=shards, BCRYPT_ROUNDS=4,
+                                    HASHTAG_INDEX_ENABLED=False, SLOW_QUERY_MS=0)
+            user_ids = []
+            for i in range(users):
+                response = client.post('/api/auth/register', json={
+                    'username': f'shard_user{i}', 'email': f'shard_user{i}@contentflow.ai',
+                    'password': '12345678'})
+                user_ids.append(response.get_json()['user']['id'])
+            for shard in range(shards):
+                conn = sqlite3.connect(contentflow.shard_database(shard))
+                conn.execute('UPDATE users SET usage_limit = -1')
+                conn.commit()
+                conn.close()
+            # Conexões abertas no processo pai não atravessam o fork
+            contentflow._pools.clear()
+            # Cada processo escreve para usuários de todos os shards
+            assignments = [user_ids[i::processes] for i in range(processes)]
+            with context.Pool(processes) as workers:
+                start = time.perf_counter()
+                writes = sum(workers.starmap(shard_write_worker,
+                                             [(assigned, duration) for assigned in assignments]))
+                elapsed = time.perf_counter() - start
+        rate = writes / elapsed
+        baseline = baseline or rate
+        print(f"  SHARD_COUNT={shards:<3} {rate:>10.1f} escritas/s | {rate / baseline:.2f}x")
+    app_config.update(previous)
+    contentflow._pools.clear()
+    print()
+
+def bench_admission(iterations, threads=8):
+    """Custo do rate limiter compartilhado (SQLite) e rejeições sob rajada"""
+    print("🚦 Controle de admissão")
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+
+        def generate():
+            response = client.post('/api/content/generate/caption', json={'topic': 'Treino'}, headers=headers)
+            response.close()
+            return response.status_code
+
+        measure('geração sem admissão', generate, iterations)
+        contentflow.app.config.update(RATE_LIMIT_ENABLED=True, RATE_LIMIT_USER_RATE=1e9,
+                                      RATE_LIMIT_USER_BURST=1e9, RATE_LIMIT_IP_RATE=1e9,
+                                      RATE_LIMIT_IP_BURST=1e9)
+        measure('geração com admissão', generate, iterations)
+
+        contentflow.app.config.update(RATE_LIMIT_USER_RATE=50, RATE_LIMIT_USER_BURST=20)
+        contentflow._admission = None
+        statuses = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            statuses = list(executor.map(lambda _: generate(), range(iterations)))
+        elapsed = time.perf_counter() - start
+        print(f"  rajada de {iterations} em {elapsed:.2f}s com {threads} threads (50/s, burst 20): "
+              f"{statuses.count(200)} aceitas, {statuses.count(429)} com 429")
+        contentflow.app.config['RATE_LIMIT_ENABLED'] = False
+    print()
+
+COLD_START_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/health')
+health = time.perf_counter()
+heavy = sorted(name for name in ('jwt', 'bcrypt') if name in sys.modules)
+response = client.post('/api/auth/login', json={{'username': 'cold', 'password': '12345678'}})
+login = time.perf_counter()
+print(imported - start, health - start, login - start, response.status_code, ','.join(heavy) or '-')
+'''
+
+def bench_coldstart(iterations, runs=5):
+    """Partida a frio em processo novo: import, primeiro /api/health e primeiro login"""
+    print("🧊 Partida a frio (mediana de processos novos)")
+    script = COLD_START_SCRIPT.format(root=os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory, BCRYPT_ROUNDS=4)
+        client.post('/api/auth/register', json={
+            'username': 'cold', 'email': 'cold@contentflow.ai', 'password': '12345678'})
+        env = dict(os.environ, DATABASE=contentflow.app.config['DATABASE'], BCRYPT_ROUNDS='4')
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                                    capture_output=True, text=True).stdout.split()
+            total = time.perf_counter() - start
+            samples.append([float(value) for value in output[:3]] + [total])
+            loaded_at_health = output[4]
+        medians = [sorted(column)[len(column) // 2] * 1000 for column in zip(*samples)]
+        print(f"  import do app                   {medians[0]:>10.1f} ms")
+        print(f"  primeiro /api/health            {medians[1]:>10.1f} ms")
+        print(f"  primeiro login (jwt + bcrypt)   {medians[2]:>10.1f} ms")
+        print(f"  processo completo               {medians[3]:>10.1f} ms")
+        print(f"  módulos pesados carregados até o health: {loaded_at_health}")
+
+        fresh = os.path.join(directory, 'fresh.db')
+        start = time.perf_counter()
+        contentflow.init_db(fresh)
+        migrated = time.perf_counter()
+        contentflow.init_db(fresh)
+        checked = time.perf_counter()
+        print(f"  migrações em banco novo         {(migrated - start) * 1000:>10.1f} ms")
+        print(f"  verificação de banco atualizado {(checked - migrated) * 1000:>10.1f} ms")
+    print()
+
+def database_bytes(database):
+    """Bytes ocupados no arquivo (páginas em uso, sem a lista livre)"""
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    page_count, free_pages, page_size = (conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                                         for pragma in ('page_count', 'freelist_count', 'page_size'))
+    conn.close()
+    return (page_count - free_pages) * page_size
+
+def bench_archive(iterations, rows=100000):
+    """Armazenamento frio: espaço recuperado e latência de leitura do conteúdo arquivado"""
+    print(f"🧊 Armazenamento frio ({rows} linhas antigas)")
+    generator = random.Random(42)
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        database = contentflow.app.config['DATABASE']
+        conn = sqlite3.connect(database)
+        blobs, contents = {}, []
+        for i in range(rows):
+            content_type = contentflow.CONTENT_TYPES[i % 4]
+            prompt = ', '.join(generator.sample(SEARCH_WORDS, 2)) + f' {i}'
+            platform = generator.choice(contentflow.PLATFORMS)
+            tone = generator.choice(contentflow.TONES)
+            generated = contentflow.render_content(content_type, prompt, platform, tone)
+            blobs[generated.digest] = generated.serialized
+            # Tudo com mais de 200 dias, para ser arquivado
+            contents.append((content_type, prompt, generated.digest, platform, tone,
+                             f'-{rows - i + 86400 * 200} seconds'))
+        conn.executemany('INSERT OR IGNORE INTO content_blobs (hash, body) VALUES (?, ?)', blobs.items())
+        conn.executemany('''
+            INSERT INTO content (user_id, content_type, prompt, blob_hash, platform, tone, created_at)
+            VALUES (1, ?, ?, ?, ?, ?, datetime('now', ?))
+        ''', contents)
+        conn.commit()
+        conn.close()
+        hot = os.path.join(directory, 'hot.db')
+        contentflow._pools.clear()
+        database_bytes(database)  # checkpoint do WAL antes da cópia
+        shutil.copy(database, hot)
+
+        def read_latency():
+            rounds = max(iterations // 10, 5)
+            timings = {}
+            for label, url in (('histórico (100 itens)', '/api/content/history?after=&per_page=100'),
+                               ('busca', '/api/content/search?q=yoga&per_page=100')):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    client.get(url, headers=headers)
+                timings[label] = (time.perf_counter() - start) / rounds * 1000
+            start = time.perf_counter()
+            response = client.get('/api/content/export', headers=headers, buffered=False)
+            for _ in response.response:
+                pass
+            response.close()
+            timings['export (linhas/s)'] = rows / (time.perf_counter() - start)
+            return timings
+
+        baseline = read_latency()
+        print(f"  {'quente':<24} {database_bytes(database) / 1e6:>7.1f} MB | " +
+              ' | '.join(f'{label} {value:.1f}' for label, value in baseline.items()))
+        for dictionary in (False, True):
+            contentflow._pools.clear()
+            shutil.copy(hot, database)
+            contentflow.app.config['ARCHIVE_DICTIONARY'] = dictionary
+            stats = contentflow.compact_archive(database, pause=0)
+            timings = read_latency()
+            label = 'zlib + dicionário' if dictionary else 'zlib'
+            print(f"  {label:<24} {database_bytes(database) / 1e6:>7.1f} MB | " +
+                  ' | '.join(f'{name} {value:.1f}' for name, value in timings.items()))
+            print(f"  {'':<24} corpos {stats['bytes_before'] / 1e6:.1f} -> {stats['bytes_after'] / 1e6:.1f} MB "
+                  f"({stats['ratio']:.1f}x), {stats['decompress_us']:.1f} µs/corpo, "
+                  f"lock máx. {stats['max_lock_ms']:.1f} ms em {stats['batches']} lotes, {stats['elapsed']:.1f} s")
+        contentflow.app.config['ARCHIVE_DICTIONARY'] = True
+        contentflow._pools.clear()
+    print("  (histórico e busca em ms por requisição)")
+    print()
+
+def bench_stats(iterations, rows=100000):
+    """/api/user/stats (user_stats) comparado com agregar o histórico a cada requisição"""
+    print(f"📊 Estatísticas por usuário ({rows} linhas)")
+    with tempfile.TemporaryDirectory() as directory:
+        client = setup_database(directory)
+        headers = create_user(client)
+        seed_content(rows)
+        conn = sqlite3.connect(contentflow.app.config['DATABASE'])
+        since = time.strftime('%Y-%m-%d', time.gmtime(time.time() - 29 * 86400))
+
+        def aggregate():
+            for column in ('content_type', 'platform', 'tone'):
+                conn.execute(f'SELECT {column}, COUNT(*) FROM content '
+                             f'WHERE user_id = 1 GROUP BY {column}').fetchall()
+            conn.execute('SELECT COUNT(*), SUM(is_favorite) FROM content WHERE user_id = 1').fetchone()
+            conn.execute('SELECT date(created_at), COUNT(*) FROM content WHERE user_id = 1 AND created_at >= ? '
+                         'GROUP BY 1', (since,)).fetchall()
+
+        rounds = max(iterations // 10, 5)
+        aggregate_rps = measure('agregação (só SQL)', aggregate, rounds)
+        stats_rps = measure('/api/user/stats', lambda: client.get('/api/user/stats', headers=headers), iterations)
+        measure('history (total de user_stats)', lambda: client.get(
+            '/api/content/history?page=1', headers=headers), iterations)
+        conn.close()
+    print(f"  Ganho: {stats_rps / aggregate_rps:.0f}x")
+    print()
+
+BENCHMARKS = {
+    'pool': bench_pool,
+    'history': bench_history,
+    'batch': bench_batch,
+    'templates': bench_templates,
+    'cache': bench_cache,
+    'provider': bench_provider,
+    'stream': bench_stream,
+    'auth': bench_auth,
+    'token': bench_token,
+    'quota': bench_quota,
+    'writebehind': bench_write_behind,
+    'export': bench_export,
+    'search': bench_search,
+    'static': bench_static,
+    'json': bench_json,
+    'metrics': bench_metrics,
+    'admission': bench_admission,
+    'coldstart': bench_coldstart,
+    'hashtags': bench_hashtags,
+    'shards': bench_shards,
+    'archive': bench_archive,
+    'stats': bench_stats,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks do ContentFlow AI')
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"Benchmarks a executar: {', '.join(BENCHMARKS)} (padrão: todos)")
+    parser.add_argument('-n', '--iterations', type=int, default=500)
+    parser.add_argument('-r', '--rows', type=int,
+                        help='Linhas de conteúdo semeadas (benchmarks que aceitam)')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmark desconhecido: {', '.join(sorted(unknown))}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        options = {}
+        if args.rows and 'rows' in inspect.signature(BENCHMARKS[name]).parameters:
+            options['rows'] = args.rows
+        BENCHMARKS[name](args.iterations, **options)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Configuração do gunicorn (carregada automaticamente por `gunicorn app:app`)
+
+O app é importado uma única vez no master (preload) e as migrações rodam ali,
+antes do fork: os workers já nascem com o módulo carregado e o schema pronto.
+"""
+
+import os
+
+# Workers herdam o pid do master: as métricas deles ficam em um diretório só
+# deste master, limpo pelo child_exit abaixo
+os.environ['METRICS_MASTER_PID'] = str(os.getpid())
+
+# bind e workers seguem os padrões do gunicorn (PORT e WEB_CONCURRENCY)
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+# Workers com threads: o login espera o bcrypt (que libera o GIL) sem prender o
+# worker inteiro, e o BCRYPT_MAX_PENDING (menor que threads) deixa threads
+# livres para as demais rotas enquanto o excesso de logins recebe 503
+# (ASGI: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn asgi:app)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+def on_starting(server):
+    from app import migrate_shards
+    for shard, applied in migrate_shards().items():
+        if applied:
+            server.log.info('Shard %d, migrações aplicadas: %s', shard, ', '.join(map(str, applied)))
+
+def child_exit(server, worker):
+    # Contadores do worker encerrado vão para o total dos workers mortos
+    from app import metrics_directory, retire_worker_metrics
+    try:
+        retire_worker_metrics(worker.pid, metrics_directory(server.pid))
+    except OSError as e:
+        server.log.warning('Falha ao somar as métricas do worker %d: %s', worker.pid, e)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do ContentFlow AI com percentis de latência e baselines em JSON
+
+Executa cada cenário (registro, login, geração por tipo, histórico e perfil)
+contra o app em processo (test client do Flask), um gunicorn local (WSGI) ou um
+uvicorn local com asgi.py,
+sobre um banco semeado com o número de usuários e linhas de conteúdo pedido.
+
+    python loadtest.py --save baseline.json
+    python loadtest.py --compare baseline.json
+    python loadtest.py --target gunicorn --workers 4 -c 16
+    python loadtest.py --target uvicorn --workers 4 -c 256 --provider-latency 0.2 generate_caption
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import app as contentflow
+
+PASSWORD = '12345678'
+CONTENT_TYPES = ('caption', 'ideas', 'hashtags', 'script')
+PER_PAGE = 10
+
+def seed_database(path, users, rows, bcrypt_rounds):
+    """Cria o schema e insere usuários sem limite mensal e linhas de histórico
+
+    Os usuários entram no diretório global e, com o histórico, no seu shard (SHARD_COUNT).
+    """
+    contentflow.app.config['DATABASE'] = path
+    contentflow._pools.clear()
+    contentflow.migrate_shards()
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds)).decode('utf-8')
+    period = contentflow.current_usage_period()
+    directory = sqlite3.connect(path)
+    directory.executemany('INSERT INTO user_directory (username, email) VALUES (?, ?)',
+                          ((f'load_{i}', f'load_{i}@contentflow.ai') for i in range(users)))
+    directory.commit()
+    accounts = directory.execute('SELECT id, username, email FROM user_directory ORDER BY id').fetchall()
+    directory.close()
+    per_user = rows // users
+    shards = {}
+    for user_id, username, email in accounts:
+        shard = contentflow.shard_for(user_id)
+        conn = shards.get(shard)
+        if conn is None:
+            conn = shards[shard] = sqlite3.connect(contentflow.shard_database(shard))
+        conn.execute('''
+            INSERT INTO users (id, username, email, password_hash, usage_limit, usage_period)
+            VALUES (?, ?, ?, ?, -1, ?)
+        ''', (user_id, username, email, password_hash, period))
+        conn.executemany('''
+            INSERT INTO content (user_id, content_type, prompt, generated_text, platform, tone, created_at)
+            VALUES (?, ?, ?, ?, 'instagram', 'casual', datetime('now', ?))
+        ''', ((user_id, CONTENT_TYPES[i % 4], f'Prompt {i}', f'Texto gerado {i}', f'-{per_user - i} seconds')
+              for i in range(per_user)))
+    for conn in shards.values():
+        contentflow.repair_user_stats(conn, commit=False)
+        conn.commit()
+        conn.close()
+    return per_user
+
+def percentile(ordered, fraction):
+    """Percentil por posição mais próxima sobre uma lista ordenada"""
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+class InProcessClient:
+    """Requisições pelo test client do Flask (um client por thread)"""
+
+    def __init__(self):
+        self.client = contentflow.app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        response.close()
+        return response.status_code
+
+class HTTPClient:
+    """Requisições HTTP com conexão keep-alive (uma conexão por thread)"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            # Conexão fechada pelo servidor (ex.: gunicorn sync não mantém keep-alive)
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            response.read()
+        return response.status
+
+def build_scenarios(users, per_user):
+    """Cenários: nome -> função (índice) que retorna (método, caminho, corpo, headers)"""
+    tokens = [{'Authorization': f'Bearer {contentflow.create_token(user_id)}'}
+              for user_id in range(1, users + 1)]
+    registrations = itertools.count()
+    run_id = os.urandom(3).hex()
+    deep_page = max(per_user // PER_PAGE, 1)
+
+    def register(index):
+        n = next(registrations)
+        return 'POST', '/api/auth/register', {
+            'username': f'new_{run_id}_{n}',
+            'email': f'new_{run_id}_{n}@contentflow.ai',
+            'password': PASSWORD
+        }, None
+
+    def login(index):
+        return 'POST', '/api/auth/login', {'username': f'load_{index % users}', 'password': PASSWORD}, None
+
+    def generate(content_type):
+        def scenario(index):
+            return 'POST', f'/api/content/generate/{content_type}', {
+                'topic': f'Tema {index % 50}',
+                'platform': ('instagram', 'tiktok', 'linkedin')[index % 3]
+            }, tokens[index % users]
+        return scenario
+
+    def history(page):
+        def scenario(index):
+            return 'GET', f'/api/content/history?page={page}&per_page={PER_PAGE}', None, tokens[index % users]
+        return scenario
+
+    def profile(index):
+        return 'GET', '/api/user/profile', None, tokens[index % users]
+
+    scenarios = {'register': register, 'login': login}
+    for content_type in CONTENT_TYPES:
+        scenarios[f'generate_{content_type}'] = generate(content_type)
+    scenarios['history_first'] = history(1)
+    scenarios['history_deep'] = history(deep_page)
+    scenarios['profile'] = profile
+    return scenarios
+
+def run_scenario(make_client, scenario, requests, concurrency, warmup=0):
+    """Executa o cenário com N threads e retorna latências (ms), erros e RPS"""
+    client = make_client()
+    for index in range(warmup):
+        client.request(*scenario(requests + index))
+    per_thread = [requests // concurrency + (1 if i < requests % concurrency else 0)
+                  for i in range(concurrency)]
+
+    def worker(offset, count):
+        client = make_client()
+        latencies = []
+        errors = 0
+        for index in range(offset, offset + count):
+            method, path, body, headers = scenario(index)
+            start = time.perf_counter()
+            status = client.request(method, path, body, headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors += 1
+        return latencies, errors
+
+    offsets = list(itertools.accumulate([0] + per_thread[:-1]))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, offsets, per_thread))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[1] for result in results),
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3)
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+SERVER_COMMANDS = {
+    'gunicorn': lambda port, workers, threads: [
+        sys.executable, '-m', 'gunicorn', 'app:app', '-b', f'127.0.0.1:{port}',
+        '-w', str(workers), '--log-level', 'warning'] + (['--threads', str(threads)] if threads else []),
+    'uvicorn': lambda port, workers, threads: [
+        sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+}
+
+def start_server(target, database, workers, threads, env):
+    """Sobe um gunicorn (WSGI) ou uvicorn (asgi.py) local sobre o banco semeado e espera o /api/health"""
+    port = free_port()
+    env = dict(os.environ, DATABASE=database, SECRET_KEY=contentflow.app.config['SECRET_KEY'],
+               RATE_LIMIT_ENABLED='0', **env)
+    process = subprocess.Popen(SERVER_COMMANDS[target](port, workers, threads),
+                               cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{target} terminou durante a inicialização')
+        try:
+            if HTTPClient('127.0.0.1', port).request('GET', '/api/health') == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'{target} não respondeu ao /api/health em 30s')
+
+def compare(results, baseline, tolerance):
+    """Compara com um baseline; retorna os cenários que regrediram"""
+    regressions = []
+    print(f"\n📏 Comparação com baseline (tolerância {tolerance:.0%})")
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            print(f"  {name:<20} sem baseline")
+            continue
+        p95_delta = current['p95_ms'] / previous['p95_ms'] - 1
+        rps_delta = current['rps'] / previous['rps'] - 1
+        regressed = p95_delta > tolerance or rps_delta < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<20} p95 {p95_delta:>+7.1%}  rps {rps_delta:>+7.1%}  {'❌' if regressed else '✅'}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do ContentFlow AI')
+    parser.add_argument('scenarios', nargs='*', help='Cenários a executar (padrão: todos)')
+    parser.add_argument('--target', choices=('inprocess',) + tuple(SERVER_COMMANDS), default='inprocess')
+    parser.add_argument('-n', '--requests', type=int, default=500, help='Requisições por cenário')
+    parser.add_argument('-c', '--concurrency', type=int, default=1, help='Clientes simultâneos')
+    parser.add_argument('--warmup', type=int, default=20, help='Requisições de aquecimento por cenário')
+    parser.add_argument('-u', '--users', type=int, default=100, help='Usuários semeados')
+    parser.add_argument('-r', '--rows', type=int, default=100000, help='Linhas de conteúdo semeadas')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='Workers do gunicorn/uvicorn')
+    parser.add_argument('--threads', type=int,
+                        help='Threads por worker do gunicorn (padrão: GUNICORN_THREADS do gunicorn.conf.py)')
+    parser.add_argument('--bcrypt-rounds', type=int, default=contentflow.app.config['BCRYPT_ROUNDS'])
+    parser.add_argument('--provider-latency', type=float,
+                        help='Usa o provedor fake com esta latência (s) e sem cache de geração')
+    parser.add_argument('--save', metavar='ARQUIVO', help='Salva os resultados como baseline JSON')
+    parser.add_argument('--compare', metavar='ARQUIVO', help='Falha se regredir em relação ao baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Regressão tolerada (fração)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'loadtest.db')
+        contentflow.app.config['BCRYPT_ROUNDS'] = args.bcrypt_rounds
+        # Mede a capacidade do servidor, não o rate limit por usuário/IP
+        contentflow.app.config['RATE_LIMIT_ENABLED'] = False
+        contentflow._hasher = None
+        server_env = {'BCRYPT_ROUNDS': str(args.bcrypt_rounds)}
+        if args.provider_latency is not None:
+            server_env.update(AI_PROVIDER='fake', FAKE_PROVIDER_LATENCY=str(args.provider_latency),
+                              GENERATION_CACHE_SIZE='0')
+            contentflow.app.config.update(AI_PROVIDER='fake', FAKE_PROVIDER_LATENCY=args.provider_latency)
+            contentflow.generation_cache.maxsize = 0
+            contentflow._gateway = None
+        per_user = seed_database(database, args.users, args.rows, args.bcrypt_rounds)
+        scenarios = build_scenarios(args.users, per_user)
+        unknown = set(args.scenarios) - set(scenarios)
+        if unknown:
+            parser.error(f"cenário desconhecido: {', '.join(sorted(unknown))} "
+                         f"(disponíveis: {', '.join(scenarios)})")
+
+        process = None
+        if args.target in SERVER_COMMANDS:
+            process, port = start_server(args.target, database, args.workers, args.threads, server_env)
+            make_client = lambda: HTTPClient('127.0.0.1', port)
+        else:
+            make_client = InProcessClient
+
+        print(f"🏋️  {args.target}: {args.users} usuários, {per_user * args.users} linhas, "
+              f"{args.requests} requisições por cenário, concorrência {args.concurrency}")
+        print(f"  {'cenário':<20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>6}")
+        results = {}
+        try:
+            for name in args.scenarios or scenarios:
+                result = run_scenario(make_client, scenarios[name], args.requests,
+                                      args.concurrency, args.warmup)
+                results[name] = result
+                print(f"  {name:<20} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} "
+                      f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>6}")
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    report = {
+        'meta': {
+            'target': args.target,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'users': args.users,
+            'rows': per_user * args.users,
+            'workers': args.workers if args.target in SERVER_COMMANDS else None,
+            'bcrypt_rounds': args.bcrypt_rounds,
+            'provider_latency': args.provider_latency,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': results
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline salvo em {args.save}")
+
+    failed = [name for name, result in results.items() if result['errors']]
+    if failed:
+        print(f"\n⚠️  Cenários com erros: {', '.join(failed)}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ Regressões: {', '.join(regressions)}")
+            return 1
+        print("\n✅ Sem regressões")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""
+Configuração comum dos testes automatizados (python -m pytest tests)
+
+O banco, as métricas e o rate limit apontam para um diretório temporário
+antes de o app ser importado.
+"""
+
+import os
+import sys
+import tempfile
+
+_directory = tempfile.mkdtemp(prefix='contentflow-tests-')
+os.environ.setdefault('DATABASE', os.path.join(_directory, 'contentflow.db'))
+os.environ.setdefault('METRICS_DIR', os.path.join(_directory, 'metrics'))
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
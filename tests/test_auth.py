@@ -0,0 +1,59 @@
+"""Revogação de tokens"""
+
+import itertools
+
+import pytest
+
+import app as contentflow
+
+_users = itertools.count()
+
+@pytest.fixture
+def client():
+    return contentflow.app.test_client()
+
+@pytest.fixture
+def account(client):
+    n = next(_users)
+    credentials = {'username': f'auth_{n}', 'email': f'auth_{n}@contentflow.ai', 'password': 'senha-segura'}
+    response = client.post('/api/auth/register', json=credentials)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['user']['id'], credentials
+
+def login(client, credentials):
+    response = client.post('/api/auth/login', json={'username': credentials['username'],
+                                                    'password': credentials['password']})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['token']
+
+def profile_status(client, token):
+    return client.get('/api/user/profile', headers={'Authorization': f'Bearer {token}'}).status_code
+
+def revoke(user_id):
+    with contentflow.app.app_context():
+        contentflow.revoke_user_tokens(user_id)
+
+def test_login_right_after_revocation_is_valid(client, account):
+    user_id, credentials = account
+    old_token = login(client, credentials)
+    assert profile_status(client, old_token) == 200
+
+    revoke(user_id)
+    new_token = login(client, credentials)
+
+    assert profile_status(client, new_token) == 200
+    assert profile_status(client, old_token) == 401
+
+def test_revocation_reaches_other_workers(client, account):
+    user_id, credentials = account
+    old_token = login(client, credentials)
+    assert profile_status(client, old_token) == 200
+
+    revoke(user_id)
+    new_token = login(client, credentials)
+    # Outro worker: sem a revogação local nem o token em cache, só o que está no banco
+    contentflow._token_versions.clear()
+    contentflow.token_cache.clear()
+
+    assert profile_status(client, old_token) == 401
+    assert profile_status(client, new_token) == 200
@@ -0,0 +1,43 @@
+"""Índice de hashtags atualizado a cada gravação"""
+
+import itertools
+
+import pytest
+
+import app as contentflow
+
+_users = itertools.count()
+
+@pytest.fixture
+def headers():
+    n = next(_users)
+    response = contentflow.app.test_client().post('/api/auth/register', json={
+        'username': f'tags_{n}', 'email': f'tags_{n}@contentflow.ai', 'password': 'senha-segura'})
+    assert response.status_code == 201, response.get_json()
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def generate_hashtags(client, headers, content):
+    response = client.post('/api/content/generate/hashtags',
+                           json={'content': content, 'platform': 'tiktok'}, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['hashtags']
+
+def test_new_cooccurrence_shows_up_on_the_next_request(headers):
+    client = contentflow.app.test_client()
+    # Consulta e guarda as sugestões de "jardimvertical" antes de existir o par
+    before = generate_hashtags(client, headers, 'jardimvertical')
+    assert 'hortaurbana' not in before
+
+    generate_hashtags(client, headers, 'jardimvertical, hortaurbana')
+    contentflow.get_hashtag_index().flush()
+
+    assert 'hortaurbana' in generate_hashtags(client, headers, 'jardimvertical')
+
+def test_new_tag_completes_its_prefixes_right_away(headers):
+    client = contentflow.app.test_client()
+    index = contentflow.get_hashtag_index()
+    assert 'plantasdesombra' not in index.learned('tiktok', ['plantasde'])
+
+    generate_hashtags(client, headers, 'plantasdesombra')
+
+    assert 'plantasdesombra' in index.learned('tiktok', ['plantasde'])
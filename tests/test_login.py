@@ -0,0 +1,36 @@
+"""Login com o pool de hash de senhas cheio"""
+
+import itertools
+
+import app as contentflow
+
+_users = itertools.count()
+
+class RehashBusyHasher(contentflow.PasswordHasher):
+    """Verifica normalmente, mas o pool está cheio na hora de refazer o hash"""
+
+    def hash(self, password):
+        raise contentflow.HasherBusy()
+
+def test_busy_pool_skips_rehash_and_still_logs_in(monkeypatch):
+    client = contentflow.app.test_client()
+    n = next(_users)
+    credentials = {'username': f'login_{n}', 'email': f'login_{n}@contentflow.ai', 'password': 'senha-segura'}
+    assert client.post('/api/auth/register', json=credentials).status_code == 201
+
+    # Custo diferente do hash gravado: o login pede um rehash, que encontra o pool cheio
+    hasher = RehashBusyHasher(rounds=contentflow.app.config['BCRYPT_ROUNDS'] + 1, workers=1)
+    monkeypatch.setattr(contentflow, 'get_password_hasher', lambda: hasher)
+    response = client.post('/api/auth/login', json={'username': credentials['username'],
+                                                    'password': credentials['password']})
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['token']
+    # O hash antigo continua no lugar (o rehash fica para o próximo login)
+    user_id = response.get_json()['user']['id']
+    pool = contentflow.ConnectionPool(contentflow.shard_database(contentflow.shard_for(user_id)))
+    conn = pool.acquire()
+    stored = conn.execute('SELECT password_hash FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    pool.release(conn)
+    pool.close_all()
+    assert int(stored.split('$')[2]) == contentflow.app.config['BCRYPT_ROUNDS']
@@ -0,0 +1,43 @@
+"""Diretório das métricas fora do gunicorn"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import os, re
+import app as contentflow
+client = contentflow.app.test_client()
+for _ in range(3):
+    client.get('/api/health')
+text = client.get('/api/metrics').get_data(as_text=True)
+match = re.search(r'contentflow_http_requests_total\\{endpoint="/api/health"[^}]*\\} (\\d+)', text)
+print(match.group(1), contentflow.get_metrics().directory)
+'''
+
+def run_process(tmp_path):
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('METRICS_DIR', 'METRICS_MASTER_PID')}
+    env.update(DATABASE=str(tmp_path / 'metrics.db'), TMPDIR=str(tmp_path))
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout.split()
+    return int(output[0]), output[1]
+
+def test_successive_processes_do_not_share_counters(tmp_path):
+    first, first_directory = run_process(tmp_path)
+    second, second_directory = run_process(tmp_path)
+
+    assert first == second == 3
+    assert first_directory != second_directory
+    # Cada processo remove o seu diretório ao sair
+    assert not os.path.exists(first_directory)
+    assert not os.path.exists(second_directory)
+
+def test_gunicorn_master_pid_keys_the_shared_directory(monkeypatch):
+    import app as contentflow
+    monkeypatch.setitem(contentflow.app.config, 'METRICS_DIR', '')
+    monkeypatch.setenv('METRICS_MASTER_PID', '4242')
+
+    assert contentflow.metrics_directory().endswith('contentflow-metrics-4242')
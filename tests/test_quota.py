@@ -0,0 +1,101 @@
+"""Reserva de cota sob concorrência"""
+
+import itertools
+import threading
+
+import pytest
+
+import app as contentflow
+
+THREADS = 16
+LIMIT = 5
+_users = itertools.count()
+
+@pytest.fixture
+def pool():
+    pool = contentflow.ConnectionPool(contentflow.shard_database(0), size=THREADS)
+    yield pool
+    pool.close_all()
+
+@pytest.fixture
+def user_id(pool):
+    n = next(_users)
+    response = contentflow.app.test_client().post('/api/auth/register', json={
+        'username': f'quota_{n}', 'email': f'quota_{n}@contentflow.ai', 'password': 'senha-segura'})
+    assert response.status_code == 201, response.get_json()
+    user_id = response.get_json()['user']['id']
+    assert contentflow.shard_for(user_id) == 0
+    conn = pool.acquire()
+    conn.execute('UPDATE users SET usage_limit = ?, monthly_usage = 0 WHERE id = ?', (LIMIT, user_id))
+    conn.commit()
+    pool.release(conn)
+    return user_id
+
+def reserve_concurrently(pool, user_id, requested):
+    """THREADS conexões distintas (como workers diferentes) disputando a cota ao mesmo tempo"""
+    barrier = threading.Barrier(THREADS)
+    granted = []
+    errors = []
+
+    def worker():
+        conn = pool.acquire()
+        try:
+            barrier.wait()
+            granted.append(contentflow.reserve_quota(conn, user_id, requested))
+        except contentflow.QuotaExceeded:
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            pool.release(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return granted
+
+def usage(pool, user_id):
+    conn = pool.acquire()
+    try:
+        return conn.execute('SELECT monthly_usage FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    finally:
+        pool.release(conn)
+
+def test_concurrent_single_reservations_never_overshoot(pool, user_id):
+    granted = reserve_concurrently(pool, user_id, 1)
+
+    assert len(granted) == LIMIT
+    assert usage(pool, user_id) == LIMIT
+
+def test_concurrent_batch_reservations_never_overshoot(pool, user_id):
+    granted = reserve_concurrently(pool, user_id, 2)
+
+    assert sum(granted) == LIMIT
+    assert usage(pool, user_id) == LIMIT
+
+def test_release_returns_quota(pool, user_id):
+    conn = pool.acquire()
+    assert contentflow.reserve_quota(conn, user_id, LIMIT) == LIMIT
+    with pytest.raises(contentflow.QuotaExceeded):
+        contentflow.reserve_quota(conn, user_id)
+
+    contentflow.release_quota(conn, user_id, 2)
+    assert usage(pool, user_id) == LIMIT - 2
+    assert contentflow.reserve_quota(conn, user_id, 3) == 2
+    pool.release(conn)
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('body', ['null', '[]', '"texto"'])
+def test_invalid_body_does_not_consume_quota(pool, user_id, stream, body):
+    with contentflow.app.app_context():
+        token = contentflow.create_token(user_id)
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    if stream:
+        headers['Accept'] = 'text/event-stream'
+    response = contentflow.app.test_client().post('/api/content/generate/caption', data=body, headers=headers)
+
+    assert response.status_code == 400
+    assert usage(pool, user_id) == 0
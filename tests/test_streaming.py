@@ -0,0 +1,80 @@
+"""Streaming pelo ProviderGateway com um provedor lento"""
+
+import threading
+import time
+
+import pytest
+
+import app as contentflow
+
+class SlowProvider(contentflow.AIProvider):
+    """Entrega uma seção e trava antes da próxima"""
+    name = 'slow'
+    blocking = True
+
+    def __init__(self, stall=2.0):
+        self.stall = stall
+        self.threads = []
+        self.finished = threading.Event()
+
+    def stream(self, content_type, prompt, platform, tone):
+        self.threads.append(threading.current_thread())
+        try:
+            yield 'hook', 'primeira seção'
+            time.sleep(self.stall)
+            yield 'body', 'tarde demais'
+        finally:
+            self.finished.set()
+
+class FailingProvider(contentflow.AIProvider):
+    name = 'failing'
+    blocking = True
+
+    def stream(self, content_type, prompt, platform, tone):
+        yield 'hook', 'primeira seção'
+        raise RuntimeError('conexão perdida')
+
+def test_stalled_section_times_out_at_deadline():
+    provider = SlowProvider(stall=2.0)
+    gateway = contentflow.ProviderGateway(provider, max_concurrency=2, timeout=0.3)
+    received = []
+    start = time.monotonic()
+    with pytest.raises(contentflow.ProviderTimeout):
+        for section in gateway.stream('caption', 'tema', 'instagram', 'casual'):
+            received.append(section)
+    elapsed = time.monotonic() - start
+
+    assert received == [('hook', 'primeira seção')]
+    assert elapsed < 1.0
+    assert gateway.timeouts == 1
+
+def test_provider_runs_on_gateway_executor():
+    provider = SlowProvider(stall=0)
+    gateway = contentflow.ProviderGateway(provider, max_concurrency=2, timeout=5)
+    sections = list(gateway.stream('caption', 'tema', 'instagram', 'casual'))
+
+    assert sections == [('hook', 'primeira seção'), ('body', 'tarde demais')]
+    assert provider.threads and provider.threads[0] is not threading.current_thread()
+    assert provider.threads[0].name.startswith('provider-slow')
+
+def test_slot_returns_when_stalled_provider_finishes():
+    provider = SlowProvider(stall=0.5)
+    gateway = contentflow.ProviderGateway(provider, max_concurrency=1, timeout=0.1)
+    with pytest.raises(contentflow.ProviderTimeout):
+        list(gateway.stream('caption', 'tema', 'instagram', 'casual'))
+
+    # Enquanto o provedor travado não termina, a única vaga segue ocupada
+    assert provider.finished.wait(2)
+    provider.stall = 0
+    gateway.timeout = 5
+    assert len(list(gateway.stream('caption', 'tema', 'instagram', 'casual'))) == 2
+
+def test_provider_error_reaches_the_stream():
+    gateway = contentflow.ProviderGateway(FailingProvider(), max_concurrency=1, timeout=5)
+    received = []
+    with pytest.raises(contentflow.ProviderError):
+        for section in gateway.stream('caption', 'tema', 'instagram', 'casual'):
+            received.append(section)
+
+    assert received == [('hook', 'primeira seção')]
+    assert gateway.failures == 1